@@ -0,0 +1,138 @@
+"""Реестр статических ассетов бота: картинки по file_id и готовые клавиатуры.
+
+Картинка загружается в Telegram один раз, полученный file_id сохраняется
+в JSON под ключом «id бота:sha256 файла» — изменённый файл получит новый
+хеш и будет загружен заново, а file_id чужого бота (другой токен) не
+подхватится. Дальше картинка отправляется по file_id без чтения с диска и
+multipart-загрузки, а байты файла в памяти больше не держатся. Если
+Telegram перестал узнавать file_id, он забывается, файл перечитывается
+с диска и загружается снова; прочие ошибки BadRequest (подпись, разметка)
+пробрасываются, не трогая file_id.
+
+Клавиатуры собираются один раз при старте и отдаются по имени.
+"""
+import asyncio
+import hashlib
+import json
+import os
+
+from telegram.error import BadRequest
+
+# Фрагменты текста BadRequest, означающие, что Telegram не узнал именно file_id
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file_id", "file reference")
+
+
+def _file_id_rejected(error: BadRequest) -> bool:
+    message = error.message.lower()
+    return any(fragment in message for fragment in FILE_ID_ERRORS)
+
+
+class StaticAsset:
+    __slots__ = ("name", "path", "digest", "data", "lock")
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.digest = None      # sha256 содержимого; None — файла нет
+        self.data = None        # байты файла, нужны только до загрузки; после неё — None
+        self.lock = asyncio.Lock()
+
+    def read(self):
+        if not os.path.exists(self.path):
+            self.digest = self.data = None
+            return
+        with open(self.path, "rb") as f:
+            self.data = f.read()
+        self.digest = hashlib.sha256(self.data).hexdigest()
+
+
+class AssetRegistry:
+    def __init__(self, path: str = None):
+        self.path = path
+        self.assets = {}
+        self.keyboards = {}
+        self.file_ids = {}      # "id бота:sha256" -> file_id
+        self.uploads = 0
+        self.prepared = False
+        self._prepare_task = None
+
+    def add_file(self, name: str, path: str):
+        self.assets[name] = StaticAsset(name, path)
+
+    def add_keyboard(self, name: str, markup):
+        self.keyboards[name] = markup
+
+    def keyboard(self, name: str):
+        return self.keyboards[name]
+
+    def _prepare(self):
+        """Читает файлы ассетов и сохранённые file_id — блокирующий ввод-вывод, вызывается в потоке."""
+        for asset in self.assets.values():
+            asset.read()
+        if self.path and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.file_ids = json.load(f)
+        # Файл, для которого file_id уже есть, с диска понадобится, только если Telegram его забудет
+        digests = {key.rpartition(":")[2] for key in self.file_ids}
+        for asset in self.assets.values():
+            if asset.digest in digests:
+                asset.data = None
+        self.prepared = True
+
+    async def prepare(self):
+        if self.prepared:
+            return
+        if self._prepare_task is None:
+            self._prepare_task = asyncio.ensure_future(asyncio.to_thread(self._prepare))
+        try:
+            await asyncio.shield(self._prepare_task)
+        except Exception:
+            # Упавшая подготовка не кэшируется: следующий /start попробует снова
+            self._prepare_task = None
+            raise
+
+    def _save(self, snapshot: str):
+        tmp = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(snapshot)
+        os.replace(tmp, self.path)
+
+    async def _remember(self, key: str, file_id: str = None):
+        if file_id is None:
+            self.file_ids.pop(key, None)
+        else:
+            self.file_ids[key] = file_id
+        if self.path:
+            await asyncio.to_thread(self._save, json.dumps(self.file_ids, indent=1, sort_keys=True))
+
+    async def send_photo(self, message, name: str, **kwargs):
+        """reply_photo ассетом name; (сообщение, как отправлено: file_id или upload) или None, если файла нет."""
+        await self.prepare()
+        asset = self.assets[name]
+        if asset.digest is None:
+            return None
+        key = f"{message.get_bot().id}:{asset.digest}"
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            try:
+                return await message.reply_photo(photo=file_id, **kwargs), "file_id"
+            except BadRequest as e:
+                if not _file_id_rejected(e):
+                    raise
+                await self._remember(key, None)
+        # Одна загрузка на ассет: остальные /start ждут её и уходят уже по file_id
+        async with asset.lock:
+            file_id = self.file_ids.get(key)
+            if file_id is not None:
+                return await message.reply_photo(photo=file_id, **kwargs), "file_id"
+            if asset.data is None:
+                await asyncio.to_thread(asset.read)
+                if asset.digest is None:
+                    return None
+                key = f"{message.get_bot().id}:{asset.digest}"
+            sent = await message.reply_photo(photo=asset.data, filename=os.path.basename(asset.path), **kwargs)
+            self.uploads += 1
+            await self._remember(key, sent.photo[-1].file_id)
+            asset.data = None
+            return sent, "upload"
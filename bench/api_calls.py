@@ -0,0 +1,96 @@
+"""Сколько вызовов Bot API уходит на один поиск.
+
+Источники заменены заглушками, считаются только обращения к Telegram.
+Запуск: python -m bench.api_calls
+"""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench.fakebot import make_application, text_update, callback_update  # noqa: E402
+
+LONG = main.format_dict_as_damage({f"site{i}": f"https://example.com/{'x' * 40}/{i}" for i in range(150)},
+                                  title="🔍 Найдены профили")
+SHORT = main.format_dict_as_damage({"Страна": "RU", "Город": "Москва"}, title="Результат")
+
+
+async def _const(value, *args, **kwargs):
+    return value
+
+
+def install_stubs():
+    main.check_social_media = lambda nick: _const([(f"site{i}", f"https://example.com/{i}") for i in range(150)])
+    main.get_telegram_id = lambda username, context: _const((12345, None))
+    main.get_ip_info_combined = lambda ip: _const((SHORT, None))
+    main.github_find_info_by_username = lambda username: _const(({"login": username}, None))
+    main.get_email_info_combined = lambda email: _const((LONG, None, None))
+    main.search_hudson_domain = lambda session, domain: _const({"total": 3, "employees": 1, "users": 2})
+    main.search_leakcheck = lambda session, query: _const({"success": True, "found": 0})
+    main.search_psbdmp_domain = lambda session, domain: _const([])
+    main.get_phone_info_combined = lambda phone: _const((SHORT, None))
+    main.get_mnp_info = lambda phone: _const((SHORT, None))
+    main.get_tiktok_info = lambda username: _const(SHORT)
+    main.get_inn_info = lambda inn: _const((SHORT, None))
+    main.get_fio_info = lambda fio: _const((SHORT, None))
+    main.MAX_REQUESTS_PER_DAY = 10 ** 9
+    main.RATE_LIMITS.update(user_burst=10 ** 9, global_burst=10 ** 9)
+
+
+CASES = [
+    ("nick", "durov"), ("tgid", "@durov"), ("ip", "8.8.8.8"), ("github_user", "octocat"),
+    ("email", "user@example.com"), ("domain", "example.com"), ("phone", "+79123456789"),
+    ("mnp", "+79123456789"), ("tiktok", "durov"), ("inn", "7707083893"), ("fio", "Иванов Иван"),
+]
+
+
+async def settle(user_id):
+    # handle_input запускает поиск отдельной задачей — ждём её, чтобы учесть все вызовы
+    lookup = main.user_record(user_id).lookup
+    if lookup is not None:
+        await asyncio.wait({lookup.task})
+
+
+async def run():
+    install_stubs()
+    application, request = await make_application()
+    update_id = 1
+    print(f"{'action':<12} {'кнопка':>7} {'ввод':>5}  методы")
+    total_button = total_input = 0
+    for n, (action, query) in enumerate(CASES):
+        user_id = 5000 + n
+        update, context = callback_update(application, update_id, user_id, action, main.MENU_TEXT_AGAIN)
+        await main.button_handler(update, context)
+        button_calls = sum(request.calls.values())
+        request.calls.clear()
+        update, context = text_update(application, update_id + 1, user_id, query)
+        await main.handle_input(update, context)
+        await settle(user_id)
+        input_calls = sum(request.calls.values())
+        methods = ", ".join(f"{k}={v}" for k, v in sorted(request.calls.items()))
+        request.calls.clear()
+        update_id += 2
+        total_button += button_calls
+        total_input += input_calls
+        print(f"{action:<12} {button_calls:>7} {input_calls:>5}  {methods}")
+
+    # Свободный текст без выбора действия (автоопределение)
+    main.users.clear()
+    for n, query in enumerate(["@durov", "8.8.8.8", "user@example.com", "+79123456789"]):
+        update, context = text_update(application, update_id, 9000 + n, query)
+        await main.handle_input(update, context)
+        await settle(9000 + n)
+        print(f"{'auto':<12} {'-':>7} {sum(request.calls.values()):>5}  {query}")
+        request.calls.clear()
+        update_id += 1
+    print(f"\nсреднее на поиск (ввод): {total_input / len(CASES):.2f}, с нажатием кнопки: "
+          f"{(total_input + total_button) / len(CASES):.2f}")
+    await application.shutdown()
+    await main.close_http_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
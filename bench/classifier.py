@@ -0,0 +1,132 @@
+"""Пропускная способность и точность автоопределения типа ввода.
+
+Размеченный корпус генерируется детерминированно (--seed): @username, IPv4/IPv6,
+email, телефоны в разных записях, ИНН с верной контрольной суммой, домены,
+URL, ники и мусор, который не должен уходить ни в какой поиск. Сравниваются
+classifier.classify и прежняя цепочка is_telegram_username → is_ip → is_email →
+is_phone → ник. Отдельно считается, сколько ввода ушло бы в поиск по нику
+по ошибке — каждый такой случай стоит ~400 HTTP-запросов.
+
+Запуск: python -m bench.classifier [--size 20000] [--seed 1]
+"""
+import argparse
+import random
+import re
+import string
+import time
+from collections import Counter
+
+from bench.lookups import main  # noqa: F401 — тот же sys.path, что у остальных бенчмарков
+import classifier
+
+ACTION_OF = dict(main.AUTO_ACTIONS, unknown="unknown")
+
+
+def legacy_route(text: str) -> str:
+    """Автоопределение до classifier — регулярки собираются на каждом вызове."""
+    if text.startswith('@'):
+        return "tgid"
+    if re.match(r'^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$', text):
+        return "ip"
+    if re.match(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$', text):
+        return "email"
+    cleaned = re.sub(r'[^\d+]', '', text)
+    number = cleaned[1:] if cleaned.startswith('+') else cleaned
+    if number.isdigit() and 8 <= len(number) <= 15:
+        return "phone"
+    return "nick"
+
+
+def new_route(text: str) -> str:
+    guess = classifier.classify(text)
+    if guess.confidence < main.AUTO_ROUTE_MIN_CONFIDENCE:
+        return "unknown"
+    if guess.kind == "url" and classifier.is_ip(guess.value):
+        return "ip"
+    return ACTION_OF[guess.kind]
+
+
+def _inn(rnd: random.Random) -> str:
+    while True:
+        digits = "".join(rnd.choice(string.digits) for _ in range(rnd.choice((9, 10))))
+        if len(digits) == 9:
+            candidate = digits + str(classifier._check_digit(digits, classifier._INN10_WEIGHTS))
+        else:
+            n11 = str(classifier._check_digit(digits, classifier._INN11_WEIGHTS))
+            candidate = digits + n11 + str(classifier._check_digit(digits + n11, classifier._INN12_WEIGHTS))
+        if candidate[0] != "0":
+            return candidate
+
+
+def _word(rnd: random.Random, low=4, high=10) -> str:
+    return "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(low, high)))
+
+
+def make_corpus(size: int, seed: int):
+    """Список (текст, ожидаемое действие)."""
+    rnd = random.Random(seed)
+    tlds = ["com", "ru", "net", "org", "io", "рф"]
+
+    def phone():
+        digits = "9" + "".join(rnd.choice(string.digits) for _ in range(9))
+        return rnd.choice([f"+7{digits}", f"8{digits}", f"+7 ({digits[:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}",
+                           f"+380{digits[1:]}", f"7 {digits[:3]} {digits[3:]}"])
+
+    def ipv6():
+        groups = [f"{rnd.randrange(65536):x}" for _ in range(8)]
+        return rnd.choice([":".join(groups), f"{groups[0]}:{groups[1]}::{groups[7]}", f"2001:db8::{groups[2]}"])
+
+    generators = {
+        "tgid": lambda: "@" + _word(rnd, 5, 12) + rnd.choice(["", "_bot", str(rnd.randint(1, 99))]),
+        "ip": lambda: rnd.choice([".".join(str(rnd.randint(0, 255)) for _ in range(4)), ipv6()]),
+        "email": lambda: f"{_word(rnd)}{rnd.choice(['', '.', '_', '+'])}{_word(rnd, 2, 5)}@{_word(rnd)}.{rnd.choice(tlds[:5])}",
+        "phone": phone,
+        "inn": lambda: _inn(rnd),
+        "domain": lambda: rnd.choice([f"{_word(rnd)}.{rnd.choice(tlds)}", f"{_word(rnd, 3, 6)}.{_word(rnd)}.com",
+                                      f"https://{_word(rnd)}.{rnd.choice(tlds[:5])}/{_word(rnd)}",
+                                      f"www.{_word(rnd)}.ru"]),
+        "nick": lambda: _word(rnd, 3, 8) + rnd.choice(["", "_", "123", "_dev", str(rnd.randint(1970, 2010))]),
+        "unknown": lambda: rnd.choice(["Иванов Иван Иванович", "привет", "что ты умеешь?", "hello world",
+                                       "256.300.1.1", "12345", "@", "?"]),
+    }
+    labels = list(generators)
+    return [(generators[label](), label) for label in (rnd.choice(labels) for _ in range(size))]
+
+
+def measure(route, corpus):
+    started = time.perf_counter()
+    routed = [route(text) for text, _ in corpus]
+    elapsed = time.perf_counter() - started
+    confusion = Counter((label, got) for (_, label), got in zip(corpus, routed))
+    return elapsed, confusion
+
+
+def run(args):
+    corpus = make_corpus(args.size, args.seed)
+    labels = sorted({label for _, label in corpus})
+    print(f"корпус: {len(corpus)} строк, seed {args.seed}\n")
+    print(f"{'маршрутизатор':<14} {'тыс./с':>8} {'мкс/строку':>11} {'точность':>9} {'ложный ник':>11}")
+    for name, route in (("прежний", legacy_route), ("classifier", new_route)):
+        measure(route, corpus[:1000])  # прогрев
+        elapsed, confusion = measure(route, corpus)
+        correct = sum(n for (label, got), n in confusion.items() if label == got)
+        false_nick = sum(n for (label, got), n in confusion.items() if got == "nick" and label != "nick")
+        print(f"{name:<14} {len(corpus) / elapsed / 1000:8.1f} {elapsed / len(corpus) * 1e6:11.2f} "
+              f"{correct / len(corpus):9.1%} {false_nick:11d}")
+        if args.verbose:
+            for label in labels:
+                row = ", ".join(f"{got}={n}" for (want, got), n in sorted(confusion.items()) if want == label and got != label)
+                if row:
+                    print(f"    {label:<8} → {row}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--size", type=int, default=20000, help="строк в корпусе")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора корпуса")
+    parser.add_argument("-v", "--verbose", action="store_true", help="показать ошибки по меткам")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
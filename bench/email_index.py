@@ -0,0 +1,91 @@
+"""Скорость и память локального индекса почтовых доменов.
+
+Индекс строится из синтетических списков нужного размера (по умолчанию
+100 тыс. одноразовых и 20 тыс. бесплатных доменов) и сравнивается по
+памяти с обычным frozenset строк. Проверяются адреса вперемешку:
+попадания, поддомены из списка и промахи. Отдельно — кэш MX.
+
+Запуск: python -m bench.email_index [--disposable 100000] [--free 20000] [--emails 200000]
+"""
+import argparse
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+from bench.lookups import main  # noqa: F401 — тот же sys.path, что у остальных бенчмарков
+import email_index
+
+
+def _domain(rnd: random.Random) -> str:
+    name = "".join(rnd.choice(string.ascii_lowercase + string.digits) for _ in range(rnd.randint(5, 14)))
+    return f"{name}.{rnd.choice(['com', 'net', 'org', 'ru', 'io', 'xyz', 'info'])}"
+
+
+def allocated(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return obj, size
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+    disposable = [_domain(rnd) for _ in range(args.disposable)]
+    free = [_domain(rnd) for _ in range(args.free)]
+
+    started = time.perf_counter()
+    index, index_bytes = allocated(lambda: email_index.EmailDomainIndex(disposable, free))
+    build = time.perf_counter() - started
+    _, set_bytes = allocated(lambda: (frozenset(d.lower() for d in disposable), frozenset(d.lower() for d in free)))
+    print(f"доменов: {len(index.disposable)} одноразовых + {len(index.free)} бесплатных, построение {build:.2f} с")
+    print(f"память: индекс {index_bytes / 2 ** 20:.2f} МиБ, frozenset строк {set_bytes / 2 ** 20:.2f} МиБ")
+
+    emails = []
+    for _ in range(args.emails):
+        kind = rnd.random()
+        if kind < 0.3:
+            domain = rnd.choice(disposable)
+        elif kind < 0.4:
+            domain = f"mx{rnd.randint(1, 9)}.{rnd.choice(disposable)}"
+        elif kind < 0.6:
+            domain = rnd.choice(free)
+        else:
+            domain = _domain(rnd)
+        emails.append(f"{rnd.choice(['ivan', 'info', 'support', 'anna.k', 'x+tag'])}@{domain}")
+
+    for label, is_valid in (("без проверки формата", None), ("с is_email", main.is_email)):
+        started = time.perf_counter()
+        verdicts = [index.check(email, is_valid) for email in emails]
+        elapsed = time.perf_counter() - started
+        print(f"check() {label}: {len(emails) / elapsed / 1000:.0f} тыс./с, {elapsed / len(emails) * 1e6:.2f} мкс на адрес")
+    print(f"  одноразовых {sum(v.disposable for v in verdicts)}, бесплатных {sum(v.free for v in verdicts)}, "
+          f"ролевых {sum(v.role for v in verdicts)} из {len(verdicts)}")
+
+    cache = email_index.MxCache()
+    domains = [email.rpartition("@")[2] for email in emails]
+    started = time.perf_counter()
+    for domain in domains:
+        if cache.get(domain) is None:
+            cache.put(domain, ("mx." + domain,), 3600)
+    elapsed = time.perf_counter() - started
+    print(f"MxCache get/put: {len(domains) / elapsed / 1000:.0f} тыс./с, записей {len(cache)}")
+
+    real = email_index.EmailDomainIndex.load(main.EMAIL_INDEX_DIR)
+    print(f"\nсписки бота: {real.stats()}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--disposable", type=int, default=100000, help="одноразовых доменов")
+    parser.add_argument("--free", type=int, default=20000, help="бесплатных доменов")
+    parser.add_argument("--emails", type=int, default=200000, help="проверяемых адресов")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
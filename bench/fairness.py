@@ -0,0 +1,94 @@
+"""Хвост задержки дешёвых поисков, пока идут тяжёлые сканы ника.
+
+--scans сканов ника крутятся без перерыва и вместе требуют больше
+соединений, чем есть в пуле; в это время --requests поисков по IP и ИНН
+(по --concurrency одновременно) замеряются в трёх режимах:
+без нагрузки; под нагрузкой в порядке прихода (ёмкость http_scheduler
+снята, очередь — внутри aiohttp); под нагрузкой со взвешенной очередью.
+Каждый поиск — свой поток с весом из HTTP_FLOW_WEIGHTS, как в run_lookup.
+
+Запуск: python -m bench.fairness [--latency 0.3] [--sites 400] [--scans 16]
+                                 [--requests 40] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import time
+
+from bench.lookups import INPUTS, LOOKUPS, main, percentile
+from bench.mock_upstream import MockConfig, MockUpstream
+
+CHEAP = ("ip", "inn")
+
+
+async def in_flow(action: str):
+    main.http_flow.set(main.fairqueue.Flow(action, main.HTTP_FLOW_WEIGHTS.get(action, main.HTTP_FLOW_WEIGHT_DEFAULT)))
+    return await LOOKUPS[action](INPUTS[action])
+
+
+async def heavy_scans(count: int, stop: asyncio.Event, done: list):
+    async def loop():
+        while not stop.is_set():
+            await asyncio.create_task(in_flow("nick"))
+            done.append(time.perf_counter())
+    await asyncio.gather(*(loop() for _ in range(count)))
+
+
+async def cheap_lookups(action: str, requests: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await asyncio.create_task(in_flow(action))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+async def measure(args, scans: int):
+    stop, done = asyncio.Event(), []
+    heavy = asyncio.create_task(heavy_scans(scans, stop, done))
+    # Даём сканам занять пул
+    await asyncio.sleep(0.5 if scans else 0)
+    started = time.perf_counter()
+    results = {action: await cheap_lookups(action, args.requests, args.concurrency) for action in CHEAP}
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await heavy
+    return results, sum(1 for t in done if t >= started) / elapsed
+
+
+async def run(args):
+    mock = MockUpstream(MockConfig(latency=args.latency, sherlock_sites=args.sites))
+    main.UPSTREAM_OVERRIDE = await mock.start()
+    await main.load_sherlock_manifest()
+    print(f"макет: задержка {args.latency * 1000:.0f} мс, сайтов {args.sites}; сканов ника {args.scans} "
+          f"по {main.NICK_PROBE_CONCURRENCY} проверок, пул {main.HTTP_POOL_LIMIT}\n")
+    print(f"{'режим':<18} {'поиск':<5} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'сканов/с':>9}")
+    modes = [("без нагрузки", 0, main.HTTP_POOL_LIMIT),
+             ("в порядке прихода", args.scans, 10 ** 9),
+             ("взвешенная", args.scans, main.HTTP_POOL_LIMIT)]
+    for name, scans, capacity in modes:
+        main.http_scheduler.capacity = capacity
+        results, scan_rate = await measure(args, scans)
+        for action, latencies in results.items():
+            print(f"{name:<18} {action:<5} {percentile(latencies, 0.5) * 1000:9.1f} "
+                  f"{percentile(latencies, 0.95) * 1000:9.1f} {percentile(latencies, 0.99) * 1000:9.1f} {scan_rate:9.2f}")
+    await main.close_http_session()
+    await mock.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка макета, с")
+    parser.add_argument("--sites", type=int, default=400, help="сайтов в манифесте Sherlock")
+    parser.add_argument("--scans", type=int, default=16, help="одновременных сканов ника")
+    parser.add_argument("--requests", type=int, default=40, help="дешёвых поисков каждого вида")
+    parser.add_argument("--concurrency", type=int, default=4, help="одновременных дешёвых поисков")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,76 @@
+"""Бот с подменённым транспортом: Bot API не вызывается, все вызовы считаются по методам."""
+import json
+import time
+from collections import Counter
+
+from telegram import Bot, Update
+from telegram.ext import Application, ContextTypes
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "search_bot", "username": "search_bot"}
+
+
+class CountingRequest(BaseRequest):
+    def __init__(self):
+        self.calls = Counter()
+        self._message_id = 1000
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params, **extra):
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0) or 0)
+        message = {"message_id": int(params.get("message_id", self._message_id)), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        message.update(extra)
+        return message
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint in ("sendMessage", "editMessageText"):
+            result = self._message(params, text=str(params.get("text", "")))
+        elif endpoint == "sendPhoto":
+            photo = [{"file_id": "fake-photo", "file_unique_id": "fake", "width": 1, "height": 1}]
+            result = self._message(params, photo=photo)
+        elif endpoint == "getChat":
+            result = {"id": 777, "type": "private"}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+async def make_application():
+    request = CountingRequest()
+    bot = Bot("1:fake", request=request, get_updates_request=request)
+    application = Application.builder().bot(bot).build()
+    await application.initialize()
+    request.calls.clear()
+    return application, request
+
+
+def text_update(application, update_id, user_id, text):
+    data = {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "user"}}}
+    update = Update.de_json(data, application.bot)
+    return update, ContextTypes.DEFAULT_TYPE.from_update(update, application)
+
+
+def callback_update(application, update_id, user_id, data, message_text):
+    payload = {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "bench", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+        "message": {"message_id": update_id, "date": int(time.time()), "text": message_text,
+                    "chat": {"id": user_id, "type": "private"}, "from": BOT_USER}}}
+    update = Update.de_json(payload, application.bot)
+    return update, ContextTypes.DEFAULT_TYPE.from_update(update, application)
@@ -0,0 +1,296 @@
+"""Сквозной нагрузочный тест: настоящий Application из main против поддельного Bot API.
+
+Бот запускается отдельным процессом (run_polling, как в проде) с base_url,
+указывающим на локальный сервер Bot API, и с UPSTREAM_OVERRIDE на макет
+внешних API (bench/mock_upstream.py). Синтетические пользователи шлют /start,
+нажимают кнопки меню и вводят запросы (часть пользователей пишет свободным
+текстом без кнопок).
+Для каждого шага по числу одновременных пользователей считаются апдейты в
+секунду, время до первого ответа, время до итогового ответа (сообщения с меню),
+CPU и RSS процесса бота.
+
+Запуск: python -m bench.loadtest [--users 1,5,10,25] [--rounds 3]
+                                 [--mix email=3,ip=2,phone=2,nick=1,inn=1] [--free-text 0.5]
+                                 [--latency 0.05] [--sites 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# bench.lookups задаёт фиктивные ключи API до импорта main
+from bench.lookups import INPUTS, main, percentile  # noqa: E402
+from bench.mock_upstream import MockConfig, MockUpstream  # noqa: E402
+
+TOKEN = "1:loadtest"
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "search_bot", "username": "search_bot"}
+REPLY_TIMEOUT = 60.0
+
+# Действия, которые handle_input распознаёт в свободном тексте без нажатия кнопки
+FREE_TEXT_ACTIONS = {"nick", "tgid", "ip", "email", "phone"}
+
+
+def _has_menu(markup) -> bool:
+    if not markup:
+        return False
+    if isinstance(markup, str):
+        markup = json.loads(markup)
+    return any(button.get("callback_data") == "nick"
+               for row in markup.get("inline_keyboard", []) for button in row)
+
+
+class FakeBotAPI:
+    """Bot API в памяти: отдаёт апдейты через getUpdates и записывает ответы бота по чатам."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.replies = {}
+        self.polling = asyncio.Event()
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._update_id = 0
+        self._message_id = 0
+        self._texts = {}
+        self._runner = None
+
+    async def start(self, host: str = "127.0.0.1") -> str:
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, 0).start()
+        return f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    # ---------- Апдейты от пользователей ----------
+    def _push(self, payload: dict):
+        self._update_id += 1
+        payload["update_id"] = self._update_id
+        self._updates.append(payload)
+        self._new_updates.set()
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        self._message_id += 1
+        message = {"message_id": self._message_id, "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"}}
+        message.update(fields)
+        return message
+
+    def send_text(self, user: dict, text: str):
+        fields = {"from": user, "text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self._push({"message": self._message(user["id"], **fields)})
+
+    def press(self, user: dict, message_id: int, data: str):
+        message = {"message_id": message_id, "date": int(time.time()),
+                   "chat": {"id": user["id"], "type": "private"}, "from": BOT_USER}
+        text = self._texts.get((user["id"], message_id))
+        if text is not None:
+            message["text"] = text
+        self._push({"callback_query": {"id": str(self._update_id), "from": user, "chat_instance": "1",
+                                       "data": data, "message": message}})
+
+    # ---------- Методы Bot API ----------
+    async def _params(self, request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        return {key: value for key, value in form.items() if isinstance(value, str)}
+
+    def _reply(self, chat_id: int, message_id: int, method: str, markup):
+        self.replies.setdefault(chat_id, asyncio.Queue()).put_nowait(
+            (time.perf_counter(), method, message_id, _has_menu(markup)))
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await self._params(request)
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "getChat":
+            result = {"id": 777000, "type": "private", "username": str(params.get("chat_id", "")).lstrip("@")}
+        elif method in ("sendMessage", "sendPhoto", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            if method == "editMessageText":
+                message = self._message(chat_id, **{"from": BOT_USER, "text": params.get("text", "")})
+                message["message_id"] = int(params["message_id"])
+                self._message_id -= 1
+            elif method == "sendPhoto":
+                message = self._message(chat_id, **{"from": BOT_USER, "caption": params.get("caption", ""),
+                                                    "photo": [{"file_id": "photo", "file_unique_id": "photo",
+                                                               "width": 640, "height": 480}]})
+            else:
+                message = self._message(chat_id, **{"from": BOT_USER, "text": params.get("text", "")})
+            self._texts[(chat_id, message["message_id"])] = message.get("text")
+            self._reply(chat_id, message["message_id"], method, params.get("reply_markup"))
+            result = message
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params) -> list:
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0) or 0.01)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+
+class Population:
+    """Синтетические пользователи: /start, затем rounds поисков по смеси действий."""
+
+    def __init__(self, api: FakeBotAPI, mix: dict, free_text: float, rounds: int, seed: int = 1):
+        self.api = api
+        self.actions, self.weights = list(mix), list(mix.values())
+        self.free_text = free_text
+        self.rounds = rounds
+        self.random = random.Random(seed)
+        self.first, self.final = [], []
+        self.updates = 0
+        self.timeouts = 0
+
+    async def _exchange(self, user: dict, send, final_on_first: bool = False):
+        """Отправляет апдейт и ждёт ответов: первый — любой, итоговый — с клавиатурой меню."""
+        queue = self.api.replies.setdefault(user["id"], asyncio.Queue())
+        while not queue.empty():
+            queue.get_nowait()
+        started = time.perf_counter()
+        send()
+        self.updates += 1
+        first = None
+        deadline = started + REPLY_TIMEOUT
+        while True:
+            try:
+                stamp, method, message_id, has_menu = await asyncio.wait_for(
+                    queue.get(), max(0.0, deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return None
+            if first is None:
+                first = stamp
+                self.first.append(stamp - started)
+            if has_menu or final_on_first:
+                self.final.append(stamp - started)
+                return message_id
+
+    async def user(self, user_id: int):
+        user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+        # Выбранное кнопкой действие запоминается (UserRecord.action), и после первого нажатия
+        # свободный текст уже не распознаётся автоматически — поэтому часть пользователей
+        # кнопками не пользуется вовсе, а остальные нажимают кнопку перед каждым поиском.
+        texting = self.random.random() < self.free_text
+        actions = [(a, w) for a, w in zip(self.actions, self.weights) if not texting or a in FREE_TEXT_ACTIONS]
+        if not actions:
+            return
+        menu = await self._exchange(user, lambda: self.api.send_text(user, "/start"))
+        for _ in range(self.rounds):
+            if menu is None:
+                return
+            action = self.random.choices([a for a, _ in actions], [w for _, w in actions])[0]
+            text = INPUTS[action]
+            if not texting:
+                await self._exchange(user, lambda: self.api.press(user, menu, action), final_on_first=True)
+            menu = await self._exchange(user, lambda: self.api.send_text(user, text))
+
+
+def _proc_usage(pid: int):
+    """CPU-секунды и RSS (МиБ) процесса из /proc; вне Linux — None."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+        return cpu, rss
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+
+
+async def run(args):
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    api = FakeBotAPI()
+    mock = MockUpstream(MockConfig(latency=args.latency, sherlock_sites=args.sites))
+    api_url = await api.start()
+    upstream_url = await mock.start()
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bench.loadtest", "--serve-bot", api_url, upstream_url, cwd=ROOT)
+    try:
+        await asyncio.wait_for(api.polling.wait(), 30)
+        print(f"смесь: {args.mix}; пишут без кнопок: {args.free_text:.0%}; поисков на пользователя: {args.rounds}; "
+              f"задержка API {args.latency * 1000:.0f} мс\n")
+        print(f"{'польз.':>6} {'апдейтов':>8} {'апд/с':>7} {'1-й p50':>8} {'1-й p95':>8} "
+              f"{'итог p50':>9} {'итог p95':>9} {'таймауты':>8} {'CPU':>6} {'RSS, МиБ':>9}")
+        next_user = 10 ** 6
+        for users in (int(n) for n in args.users.split(",")):
+            population = Population(api, mix, args.free_text, args.rounds, seed=users)
+            usage_before = _proc_usage(bot.pid)
+            started = time.perf_counter()
+            await asyncio.gather(*(population.user(next_user + i) for i in range(users)))
+            wall = time.perf_counter() - started
+            usage_after = _proc_usage(bot.pid)
+            next_user += users
+            if usage_before and usage_after:
+                cpu = f"{(usage_after[0] - usage_before[0]) / wall:6.0%}"
+                rss = f"{usage_after[1]:9.1f}"
+            else:
+                cpu, rss = f"{'н/д':>6}", f"{'н/д':>9}"
+            print(f"{users:6d} {population.updates:8d} {population.updates / wall:7.1f} "
+                  f"{percentile(population.first, 0.5):8.3f} {percentile(population.first, 0.95):8.3f} "
+                  f"{percentile(population.final, 0.5):9.3f} {percentile(population.final, 0.95):9.3f} "
+                  f"{population.timeouts:8d} {cpu} {rss}")
+        print("\nвызовы Bot API:", ", ".join(f"{m}={n}" for m, n in api.calls.most_common()))
+    finally:
+        bot.terminate()
+        await bot.wait()
+        await mock.stop()
+        await api.stop()
+
+
+def serve_bot(api_url: str, upstream_url: str):
+    """Дочерний процесс: настоящий бот из main.py, Bot API и внешние API подменены."""
+    main.UPSTREAM_OVERRIDE = upstream_url
+    main.METRICS_PORT = 0
+    # Нагрузочный тест меряет бота, а не лимитер
+    main.MAX_REQUESTS_PER_DAY = 10 ** 9
+    main.RATE_LIMITS.update(user_burst=10 ** 9, global_burst=10 ** 9)
+    application = main.build_application(token=TOKEN, base_url=f"{api_url}/bot")
+    application.run_polling(poll_interval=0.0, timeout=1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", default="1,5,10,25", help="шаги по числу одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="поисков на пользователя")
+    parser.add_argument("--mix", default="email=3,ip=2,phone=2,nick=1,inn=1,tgid=1", help="действие=вес,...")
+    parser.add_argument("--free-text", type=float, default=0.5, help="доля пользователей, пишущих без кнопок")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка макета внешних API, с")
+    parser.add_argument("--sites", type=int, default=20, help="сайтов в манифесте Sherlock")
+    parser.add_argument("--serve-bot", nargs=2, metavar=("API_URL", "UPSTREAM_URL"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.serve_bot:
+        serve_bot(*arguments.serve_bot)
+    else:
+        asyncio.run(run(arguments))
@@ -0,0 +1,141 @@
+"""Цена вызова лога в горячем пути: сколько поток event loop тратит на одну запись.
+
+Режимы:
+- уровень ниже порога — log.debug при выключенном DEBUG;
+- jsonlog.sampled() — событие с долей --sample (как nick.probe), решение до LogRecord;
+- SamplingFilter — то же событие обычным log.debug, решение в фильтре обработчика;
+- очередь (jsonlog) — запись уходит в AsyncQueueHandler, файл пишет фоновый поток;
+- синхронно в файл — тот же JsonFormatter и RotatingFileHandler прямо в потоке вызова,
+  как было бы без очереди.
+Для очереди отдельно видно, сколько записей поток записи успел сбросить
+в файл и сколько отброшено на полной очереди; сразу за всплеском отладки
+в неё же пишутся предупреждения — они должны дойти до файла все.
+
+Запуск: python -m bench.logpipe [--calls 100000] [--sample 0.01]
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+
+import jsonlog
+
+
+def make_logger(name: str, handler=None, level=logging.DEBUG) -> logging.Logger:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(level)
+    if handler is not None:
+        logger.addHandler(handler)
+    return logger
+
+
+def file_handler(path: str):
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=jsonlog.MAX_BYTES, backupCount=2, encoding="utf-8")
+    handler.setFormatter(jsonlog.JsonFormatter())
+    return handler
+
+
+def per_call(logger, calls: int, event: str) -> float:
+    extra = {"event": event, "site": "GitHub", "outcome": "absent", "ms": 12.5}
+    started = time.perf_counter()
+    for _ in range(calls):
+        logger.debug("сайт %s: %s", "GitHub", "absent", extra=extra)
+    return (time.perf_counter() - started) / calls
+
+
+def per_sampled_call(logger, calls: int, event: str) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        jsonlog.sampled(logger, event, "сайт %s: %s", "GitHub", "absent", site="GitHub", outcome="absent", ms=12.5)
+    return (time.perf_counter() - started) / calls
+
+
+class Listeners:
+    """Потоки записи обеих очередей jsonlog, как в jsonlog.setup()."""
+
+    def __init__(self, *listeners):
+        self.listeners = listeners
+        for listener in listeners:
+            listener.start()
+
+    def stop(self):
+        for listener in self.listeners:
+            listener.stop()
+
+
+def queue_logger(name: str, path: str):
+    records, urgent = queue.Queue(jsonlog.QUEUE_SIZE), queue.SimpleQueue()
+    handler = jsonlog.AsyncQueueHandler(records, urgent)
+    handler.addFilter(jsonlog.SamplingFilter())
+    handler.addFilter(jsonlog.ContextFilter())
+    output = file_handler(path)
+    return make_logger(name, handler), Listeners(jsonlog.QueueListener(records, output),
+                                                 jsonlog.QueueListener(urgent, output))
+
+
+def lines(path: str, marker: bytes = b"") -> int:
+    total = 0
+    for name in os.listdir(os.path.dirname(path)):
+        if name.startswith(os.path.basename(path)):
+            with open(os.path.join(os.path.dirname(path), name), "rb") as f:
+                total += sum(1 for line in f if marker in line)
+    return total
+
+
+def run(args):
+    token = jsonlog.bind("bench0001", 42, "nick")
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        rows.append(("уровень ниже порога", per_call(make_logger("off", level=logging.INFO), args.calls, "nick.probe"), None))
+
+        jsonlog.sample_rates["nick.probe"] = args.sample
+        for name, measure in (("sampled()", per_sampled_call), ("SamplingFilter", per_call)):
+            path = os.path.join(tmp, f"{name}.jsonl")
+            logger, listener = queue_logger(name, path)
+            cost = measure(logger, args.calls, "nick.probe")
+            listener.stop()
+            rows.append((f"{name} {args.sample:g}", cost, lines(path)))
+
+        queued_path = os.path.join(tmp, "queued.jsonl")
+        dropped = jsonlog.DROPPED.value("queue_full")
+        logger, listener = queue_logger("queued", queued_path)
+        cost = per_call(logger, args.calls, "lookup.finish")
+        warnings = args.calls // 100
+        for n in range(warnings):
+            logger.warning("источник %s: %s", "leakcheck", "timeout", extra={"event": "source.result", "n": n})
+        drain_started = time.perf_counter()
+        listener.stop()
+        drain = time.perf_counter() - drain_started
+        rows.append(("очередь (jsonlog)", cost, lines(queued_path, b'"level":"debug"')))
+        warnings_written = lines(queued_path, b'"level":"warning"')
+        dropped = jsonlog.DROPPED.value("queue_full") - dropped
+
+        sync = file_handler(os.path.join(tmp, "sync.jsonl"))
+        sync.addFilter(jsonlog.ContextFilter())
+        cost = per_call(make_logger("sync", sync), args.calls, "lookup.finish")
+        sync.close()
+        rows.append(("синхронно в файл", cost, lines(os.path.join(tmp, "sync.jsonl"))))
+    jsonlog.unbind(token)
+
+    print(f"{args.calls} вызовов log.debug с extra и контекстом поиска\n")
+    print(f"{'режим':<22} {'мкс/вызов':>10} {'строк в файле':>14}")
+    for name, cost, written in rows:
+        print(f"{name:<22} {cost * 1e6:10.2f} {'—' if written is None else written:>14}")
+    print(f"\nочередь: отброшено на полной очереди {dropped}, дописывание после остановки {drain * 1000:.0f} мс")
+    print(f"предупреждений сразу за всплеском: записано {warnings_written} из {warnings}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=100000, help="вызовов лога на режим")
+    parser.add_argument("--sample", type=float, default=0.01, help="доля сэмплируемого события")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,114 @@
+"""Задержка и пропускная способность каждого пути поиска против локального макета API.
+
+Все get_*-функции ходят в bench/mock_upstream.py через UPSTREAM_OVERRIDE,
+настоящие сервисы не вызываются.
+
+Запуск: python -m bench.lookups [--latency 0.05] [--error-rate 0.0] [--payload 1]
+                                [--requests 50] [--concurrency 10] [--sites 50] [--actions ip,email]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+for key in ("VERIPHONE_API_KEY", "DADATA_API_KEY", "DADATA_SECRET_KEY", "EMAIL_REPUTATION_API_KEY"):
+    os.environ.setdefault(key, "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench.mock_upstream import MockConfig, MockUpstream  # noqa: E402
+
+# Что пользователь вводит для каждого действия
+INPUTS = {
+    "nick": "mockuser",
+    "tgid": "@mockuser",
+    "ip": "203.0.113.7",
+    "github_user": "mockuser",
+    "email": "user@example.com",
+    "domain": "example.com",
+    "phone": "+79123456789",
+    "mnp": "+79123456789",
+    "tiktok": "mockuser",
+    "inn": "7707083893",
+    "fio": "Иванов Иван Иванович",
+}
+# tgid (Bot API) и fio (только ссылки) внешних HTTP-запросов не делают
+LOOKUPS = {
+    "nick": main.check_social_media,
+    "ip": main.get_ip_info_combined,
+    "github_user": main.github_find_info_by_username,
+    "email": main.get_email_info_combined,
+    "domain": main.get_domain_info_combined,
+    "phone": main.get_phone_info_combined,
+    "mnp": main.get_mnp_info,
+    "tiktok": main.get_tiktok_info,
+    "inn": main.get_inn_info,
+}
+ACTIONS = {action: (lambda fn=fn, value=INPUTS[action]: fn(value)) for action, fn in LOOKUPS.items()}
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+async def run_action(factory, requests: int, concurrency: int):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await factory()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run(args):
+    config = MockConfig(latency=args.latency, error_rate=args.error_rate,
+                        payload_scale=args.payload, sherlock_sites=args.sites)
+    mock = MockUpstream(config)
+    main.UPSTREAM_OVERRIDE = await mock.start()
+    actions = args.actions.split(",") if args.actions else list(ACTIONS)
+
+    print(f"макет: задержка {config.latency * 1000:.0f} мс ±{config.jitter:.0%}, ошибки {config.error_rate:.0%}, "
+          f"payload ×{config.payload_scale}, сайтов Sherlock {config.sherlock_sites}; "
+          f"{args.requests} поисков, параллельно {args.concurrency}\n")
+    print(f"{'действие':<12} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'поиск/с':>9} {'HTTP/поиск':>11} {'304/поиск':>10} {'ошибок':>7}")
+    for action in actions:
+        mock.requests.clear()
+        mock.not_modified = 0
+        latencies, errors, wall = await run_action(ACTIONS[action], args.requests, args.concurrency)
+        upstream_calls = sum(mock.requests.values()) / args.requests
+        print(f"{action:<12} {percentile(latencies, 0.5) * 1000:9.1f} {percentile(latencies, 0.95) * 1000:9.1f} "
+              f"{percentile(latencies, 0.99) * 1000:9.1f} {args.requests / wall:9.1f} {upstream_calls:11.1f} {mock.not_modified / args.requests:10.1f} {errors:7d}")
+
+    await main.close_http_session()
+    await mock.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка макета, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов HTTP 500")
+    parser.add_argument("--payload", type=int, default=1, help="множитель размера ответов")
+    parser.add_argument("--sites", type=int, default=50, help="сайтов в манифесте Sherlock")
+    parser.add_argument("--requests", type=int, default=50, help="поисков на действие")
+    parser.add_argument("--concurrency", type=int, default=10, help="одновременных поисков")
+    parser.add_argument("--actions", default="", help="через запятую; по умолчанию все")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
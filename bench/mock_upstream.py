@@ -0,0 +1,276 @@
+"""Локальный макет всех внешних API бота.
+
+Бот с UPSTREAM_OVERRIDE=http://127.0.0.1:<порт> отправляет сюда запрос
+https://host/path?query как /host/path?query. Ответы по форме повторяют
+настоящие API, чтобы форматтеры и парсеры отрабатывали полностью.
+Задержка, доля ошибок и размер ответов задаются MockConfig.
+"""
+import asyncio
+import hashlib
+import json
+import random
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05       # средняя задержка ответа, с
+    jitter: float = 0.5         # разброс задержки: latency * (1 ± jitter)
+    error_rate: float = 0.0     # доля ответов HTTP 500
+    hang_rate: float = 0.0      # доля «зависших» ответов (клиент упрётся в свой таймаут)
+    hang_seconds: float = 30.0
+    payload_scale: int = 1      # множитель длины списков и HTML-страниц
+    sherlock_sites: int = 50    # сайтов в манифесте Sherlock
+    bad_sites: bool = False     # каждый 11-й сайт «находит» любой ник, каждый 13-й отвечает 429
+    seed: int = 1
+
+
+def _filler(scale: int) -> str:
+    # Настоящие страницы phoneradar/TikTok весят сотни КБ — парсер должен это почувствовать
+    return "<div class='pad'>" + "<p>lorem ipsum dolor sit amet</p>" * 1500 * scale + "</div>"
+
+
+def _hudson(request, cfg):
+    if "search-by-domain" in request.path:
+        urls = [{"url": f"https://login{i}.example.com"} for i in range(5 * cfg.payload_scale)]
+        return {"total": 120, "employees": 20, "users": 100,
+                "data": {"employees_urls": urls, "clients_urls": urls}}
+    stealer = {"date_compromised": "2023-05-01T00:00:00.000Z", "ip": "203.0.113.7",
+               "operating_system": "Windows 10", "top_logins": ["user1", "user2", "user3"]}
+    return {"message": "This email address is associated with a computer that was infected by an info-stealer",
+            "total_corporate_services": 3, "total_user_services": 12, "stealers": [stealer] * 2 * cfg.payload_scale}
+
+
+def _leakcheck(request, cfg):
+    sources = [{"name": f"Breach{i}.com", "date": "2020-01"} for i in range(10 * cfg.payload_scale)]
+    return {"success": True, "found": len(sources), "sources": sources}
+
+
+def _proxynova(request, cfg):
+    query = request.query.get("query", "")
+    start, limit = int(request.query.get("start", 0)), int(request.query.get("limit", 10))
+    count = 100 * cfg.payload_scale
+    return {"count": count, "lines": [f"{query}:password{i}" for i in range(start, min(start + limit, count))]}
+
+
+def _psbdmp(request, cfg):
+    return [{"id": f"pB{i:06d}", "tags": "email,leak"} for i in range(5 * cfg.payload_scale)]
+
+
+def _htmlweb(request, cfg):
+    region = {"name": "Москва", "okrug": "Центральный", "autocod": "77, 97, 99, 177"}
+    oper = {"brand": "МТС", "name": "ПАО Мобильные ТелеСистемы", "url": "www.mts.ru"}
+    if request.path.startswith("/htmlweb.ru/json/mnp"):
+        return {"city": "Москва", "region": region, "oper": oper}
+    return {"country": {"name": "Россия", "iso": "RU"}, "region": region, "capital": {"name": "Москва"},
+            "0": {"oper_brand": "МТС", "oper": oper["name"], "url": oper["url"], "name": "Москва",
+                  "post": "101000", "latitude": 55.75, "longitude": 37.62}}
+
+
+def _phoneradar(request, cfg):
+    number = request.path.rsplit("/", 1)[-1]
+    card = (f"<div class='card-body'><a href='/phone/{number[1:]}'>{number}</a>"
+            f"<p>Навязывание услуг</p><span>Оценка</span><b>Коллекторы</b></div>")
+    return web.Response(text=f"<html><body>{_filler(cfg.payload_scale)}{card}</body></html>", content_type="text/html")
+
+
+def _veriphone(request, cfg):
+    return {"status": "success", "phone_valid": True, "carrier": "MTS", "phone_type": "mobile",
+            "phone_region": "Moscow", "international_number": "+7 912 345-67-89"}
+
+
+def _ip(request, cfg):
+    return {"status": "success", "country": "Netherlands", "regionName": "North Holland", "region": "North Holland",
+            "city": "Amsterdam", "zip": "1012", "timezone": "Europe/Amsterdam", "isp": "Mock ISP",
+            "org": "Mock ISP B.V.", "lat": 52.37, "lon": 4.89, "as": "AS64500 Mock", "query": "203.0.113.7"}
+
+
+def _dadata(request, cfg):
+    data = {"name": {"short_with_opf": "ПАО СБЕРБАНК"}, "inn": "7707083893", "kpp": "773601001",
+            "ogrn": "1027700132195", "ogrn_date": 1029456000000, "state": {"status": "ACTIVE"},
+            "address": {"unrestricted_value": "117312, г Москва, ул Вавилова, д 19",
+                        "data": {"geo_lat": "55.7", "geo_lon": "37.58"}},
+            "okved": "64.19", "management": {"name": "Греф Герман Оскарович"}, "branch_count": 88, "type": "LEGAL"}
+    return {"suggestions": [{"value": "ПАО СБЕРБАНК", "data": data}]}
+
+
+def _github_api(request, cfg):
+    if request.path.startswith("/api.github.com/search/users"):
+        return {"total_count": 1, "items": [{"login": "mockuser", "avatar_url": "https://avatars.example/1"}]}
+    login = request.path.rsplit("/", 1)[-1]
+    return {"login": login, "id": 1, "avatar_url": "https://avatars.example/1", "name": "Mock User",
+            "blog": "https://example.com", "location": "Earth", "company": "Mock", "bio": "bio",
+            "public_repos": 10, "followers": 5, "following": 1,
+            "created_at": "2015-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z"}
+
+
+def _github(request, cfg):
+    if request.path.endswith(".gpg"):
+        return web.Response(text="-----BEGIN PGP PUBLIC KEY BLOCK-----\nmock\n-----END PGP PUBLIC KEY BLOCK-----")
+    return web.Response(text="ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAImock")
+
+
+def _tiktok(request, cfg):
+    login = request.path.rsplit("@", 1)[-1]
+    state = {"props": {"pageProps": {"userInfo": {
+        "user": {"id": "6800000000000000000", "uniqueId": login, "nickname": "Mock", "signature": "bio",
+                 "avatarLarger": "https://p16.example/avatar.jpeg", "verified": False},
+        "stats": {"followingCount": 10, "followerCount": 1000, "heart": 5000, "videoCount": 12}}}}}
+    script = f"<script type='application/json' crossorigin='anonymous'>{json.dumps(state)}</script>"
+    return web.Response(text=f"<html><head>{script}</head><body>{_filler(cfg.payload_scale)}</body></html>",
+                        content_type="text/html")
+
+
+SITE_KINDS = ("status_code", "message", "response_url")
+# Ник, профиль которого «существует» на чётных сайтах; любой другой ник не найден нигде
+KNOWN_NICK = "mockuser"
+# Каждый пятый сайт принимает только короткие ники из строчных букв — «mockuser» ему не подходит
+SHORT_NICK_REGEX = "^[a-z]{1,6}$"
+
+
+def _sherlock_manifest(request, cfg):
+    manifest = {"$schema": "data.schema.json"}
+    for i in range(cfg.sherlock_sites):
+        site = {"url": f"https://site{i}.mock/u/{{}}", "urlMain": f"https://site{i}.mock/"}
+        kind = SITE_KINDS[i % 3]
+        if kind == "status_code":
+            site["errorType"] = "status_code"
+        elif kind == "message":
+            site.update(errorType="message", errorMsg="Profile not found")
+        else:
+            site.update(errorType="response_url", errorUrl=f"https://site{i}.mock/404")
+        if i % 5 == 4:
+            site["regexCheck"] = SHORT_NICK_REGEX
+        manifest[f"Site{i}"] = site
+    return manifest
+
+
+def _site(request, cfg):
+    """Сайт из манифеста: чётные «находят» KNOWN_NICK, остальные отвечают так, как велит errorType."""
+    index = int("".join(ch for ch in request.match_info["host"] if ch.isdigit()) or 0)
+    kind = SITE_KINDS[index % 3]
+    page = f"<html><head><title>{{}}</title></head><body>{_filler(cfg.payload_scale)}</body></html>"
+    if cfg.bad_sites and index % 13 == 12:
+        return web.Response(status=429, text="Too Many Requests")
+    if cfg.bad_sites and index % 11 == 10:
+        return web.Response(text=page.format("profile"), content_type="text/html")
+    if request.match_info["tail"] == "404":
+        return web.Response(text=page.format("Profile not found"), content_type="text/html")
+    if index % 2 == 0 and request.match_info["tail"].endswith(KNOWN_NICK):
+        return web.Response(text=page.format("profile"), content_type="text/html")
+    if kind == "message":
+        # Как у большинства таких сайтов: 200 и текст ошибки в заголовке страницы
+        return web.Response(text=page.format("Profile not found"), content_type="text/html")
+    if kind == "response_url":
+        raise web.HTTPFound(f"https://site{index}.mock/404")
+    return web.Response(status=404, text="Profile not found")
+
+
+ROUTES = {
+    "cavalier.hudsonrock.com": _hudson,
+    "leakcheck.net": _leakcheck,
+    "api.proxynova.com": _proxynova,
+    "psbdmp.ws": _psbdmp,
+    "www.duolingo.com": lambda r, c: {"users": [{"username": "mock", "bio": "", "totalXp": 100,
+                                                 "courses": [{"fromLanguage": "ru"}]}]},
+    "en.gravatar.com": lambda r, c: {"entry": [{"displayName": "Mock User"}]},
+    "imgur.com": lambda r, c: web.Response(text='{"data":{"available":false},"success":true}'),
+    "account.mail.ru": lambda r, c: {"body": {"exists": True}},
+    "api.protonmail.ch": lambda r, c: web.Response(text="info:1:1\npub:ABCDEF:1:2048:1600000000::\n"),
+    "bitmoji.api.snapchat.com": lambda r, c: web.Response(text='{"account_type":"snapchat"}'),
+    "www.instagram.com": lambda r, c: {"users": [{"user": {"username": "mock", "profile_pic_url": "https://ig.example/1"}}]},
+    "api.twitter.com": lambda r, c: {"taken": True},
+    "dns.google": lambda r, c: {
+        "Status": 0, "Answer": [{"name": f"{r.query.get('name')}.", "type": 15, "TTL": 3600,
+                                 "data": f"10 mx.{r.query.get('name')}."}]},
+    "emailreputation.abstractapi.com": lambda r, c: {
+        "reputation": "high", "reputation_score": 0.9, "is_suspicious": False, "is_spam": False, "is_not_trusted": False},
+    "htmlweb.ru": _htmlweb,
+    "phoneradar.ru": _phoneradar,
+    "api.veriphone.io": _veriphone,
+    "ip-api.com": _ip,
+    "ipinfo.io": _ip,
+    "ipwhois.app": _ip,
+    "freegeoip.app": _ip,
+    "suggestions.dadata.ru": _dadata,
+    "api.github.com": _github_api,
+    "github.com": _github,
+    "www.tiktok.com": _tiktok,
+    "raw.githubusercontent.com": _sherlock_manifest,
+}
+
+
+# Хосты, отвечающие с ETag и 304 на совпавший If-None-Match, как GitHub
+CONDITIONAL_HOSTS = {"api.github.com", "github.com"}
+# Лимиты GitHub API без токена: core 60, search 10 запросов; 304 лимит не тратит
+GITHUB_LIMITS = {"core": 60, "search": 10}
+
+
+class MockUpstream:
+    def __init__(self, config: MockConfig = None):
+        self.config = config or MockConfig()
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._random = random.Random(self.config.seed)
+        self._runner = None
+        self.url = None
+        self.not_modified = 0
+        self.github_used = Counter()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/{host}/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        cfg = self.config
+        host = request.match_info["host"]
+        self.requests[host] += 1
+        roll = self._random.random()
+        if roll < cfg.hang_rate:
+            await asyncio.sleep(cfg.hang_seconds)
+        elif cfg.latency:
+            await asyncio.sleep(cfg.latency * self._random.uniform(1 - cfg.jitter, 1 + cfg.jitter))
+        if roll < cfg.hang_rate + cfg.error_rate:
+            return web.Response(status=500, text="mock error")
+        route = ROUTES.get(host, _site)
+        response = route(request, cfg)
+        if not isinstance(response, web.StreamResponse):
+            response = web.json_response(response)
+        if host in CONDITIONAL_HOSTS:
+            response = self._conditional(request, host, response)
+        self.bytes_sent += len(response.body or b"")
+        return response
+
+    def _conditional(self, request, host, response):
+        etag = f'"{hashlib.md5(response.body or b"").hexdigest()}"'
+        not_modified = response.status == 200 and request.headers.get("If-None-Match") == etag
+        if not_modified:
+            self.not_modified += 1
+            response = web.Response(status=304)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "public, max-age=0"
+        if host == "api.github.com":
+            resource = "search" if request.path.startswith("/api.github.com/search/") else "core"
+            if not not_modified:
+                self.github_used[resource] += 1
+            response.headers.update({
+                "X-RateLimit-Resource": resource,
+                "X-RateLimit-Limit": str(GITHUB_LIMITS[resource]),
+                "X-RateLimit-Remaining": str(max(0, GITHUB_LIMITS[resource] - self.github_used[resource])),
+                "X-RateLimit-Reset": "0",
+            })
+        return response
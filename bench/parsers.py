@@ -0,0 +1,159 @@
+"""Микробенчмарки парсеров и форматтеров на корпусе bench/fixtures/.
+
+Для каждого случая — время на вызов (лучшее из нескольких прогонов timeit)
+и пик выделенной памяти за вызов (tracemalloc). Абсолютное время зависит от
+машины и её загрузки, поэтому вперемешку с каждым случаем замеряется
+калибровочная нагрузка (разбор JSON и сборка строк, как в парсерах),
+и сравнивается медиана отношений «случай / калибровка». С --save
+результаты пишутся в базовую линию, без него — сравниваются с ней; с --check
+выход с кодом 1, если отношение выросло больше чем на --tolerance.
+
+Корпус пишет bench/record.py. Базовая линия bench/parsers_baseline.json
+лежит в репозитории и снята на корпусе макета (record.py --mock).
+
+Запуск: python -m bench.parsers [--save] [--check] [--tolerance 0.2] [--baseline путь]
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import timeit
+import tracemalloc
+from functools import partial
+
+from bench.lookups import INPUTS, main
+from bench.record import FIXTURES
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parsers_baseline.json")
+PHONE_DIGITS = INPUTS["phone"].lstrip("+")
+
+
+def _hudson_section(data):
+    return main.format_hudson_standard(data, "email", INPUTS["email"])
+
+# (случай, хост, фрагмент пути, тело ответа -> функция без аргументов)
+CASES = [
+    ("format_hudson_standard", "cavalier.hudsonrock.com", "search-by-email",
+     lambda body: partial(main.format_hudson_standard, json.loads(body), "email", INPUTS["email"])),
+    ("format_hudson_domain", "cavalier.hudsonrock.com", "search-by-domain",
+     lambda body: partial(main.format_hudson_domain, json.loads(body), INPUTS["domain"])),
+    ("format_leakcheck", "leakcheck.net", "",
+     lambda body: partial(main.format_leakcheck, json.loads(body), INPUTS["email"])),
+    ("format_proxynova", "api.proxynova.com", "",
+     lambda body: partial(main.format_proxynova, json.loads(body), INPUTS["email"])),
+    ("format_psbdmp", "psbdmp.ws", "/email/",
+     lambda body: partial(main.format_psbdmp, json.loads(body), INPUTS["email"], "email")),
+    ("format_dict_as_damage (GitHub)", "api.github.com", "/users/",
+     lambda body: partial(main.format_dict_as_damage, json.loads(body), "🐙 GitHub")),
+    ("format_dict_as_damage (Hudson)", "cavalier.hudsonrock.com", "search-by-email",
+     lambda body: partial(main.format_dict_as_damage, _hudson_section(json.loads(body)).items, "🔍 Hudson Rock")),
+    ("parse_phoneradar", "phoneradar.ru", "/phone/",
+     lambda body: partial(main.parse_phoneradar, body, PHONE_DIGITS)),
+    ("parse_tiktok_profile", "www.tiktok.com", "",
+     lambda body: partial(main.parse_tiktok_profile, body)),
+]
+
+
+_CALIBRATION_BODY = json.dumps({"items": [{"name": f"item{n}", "date": "2020-01", "tags": ["leak", "email"]}
+                                          for n in range(5)]})
+
+
+def calibration():
+    data = json.loads(_CALIBRATION_BODY)
+    return "\n".join(f"├{item['name']}: {item['date']} {', '.join(item['tags'])}" for item in data["items"])
+
+
+def paired_time(fn, rounds: int = 15):
+    """Лучшее время на вызов и медиана отношений к калибровке, замеренной вперемешку с fn.
+
+    Калибровка и случай чередуются короткими прогонами: всплеск загрузки
+    задевает обе половины пары, и отношение в паре от него почти не зависит.
+    """
+    case, unit = timeit.Timer(fn), timeit.Timer(calibration)
+    number, unit_number = case.autorange()[0], unit.autorange()[0]
+    times, ratios = [], []
+    for _ in range(rounds):
+        unit_time = unit.timeit(unit_number) / unit_number
+        times.append(case.timeit(number) / number)
+        ratios.append(times[-1] / unit_time)
+    return min(times), statistics.median(ratios)
+
+
+def load_fixtures():
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            fixtures.append(json.load(f))
+    return fixtures
+
+
+def measure(fn):
+    per_call, rel = paired_time(fn)
+    tracemalloc.start()
+    fn()  # первый вызов прогревает кэши, меряем второй
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return per_call, rel, peak
+
+
+def run(args) -> int:
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"корпус пуст: запустите python -m bench.record (--mock) — {FIXTURES}")
+        return 1
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    print(f"{'случай':<32} {'мкс/вызов':>10} {'пик, КиБ':>9} {'калибр.':>8} {'к базе':>8}")
+    for name, host, fragment, make in CASES:
+        matching = [fx for fx in fixtures if fx["host"] == host and fragment in fx["path"] and fx["status"] == 200]
+        if not matching:
+            print(f"{name:<32} {'нет фикстур':>10}")
+            continue
+        per_call = rel = peak = 0
+        for fixture in matching:
+            seconds, ratio, size = measure(make(fixture["body"]))
+            per_call += seconds / len(matching)
+            rel += ratio / len(matching)
+            peak = max(peak, size)
+        results[name] = {"us": per_call * 1e6, "peak": peak, "rel": rel}
+        ratio = ""
+        if "rel" in baseline.get(name, {}):
+            change = results[name]["rel"] / baseline[name]["rel"] - 1
+            ratio = f"{change:+.0%}"
+            if change > args.tolerance:
+                ratio += " ⚠"
+                regressions.append(name)
+        print(f"{name:<32} {per_call * 1e6:10.1f} {peak / 1024:9.1f} {rel:8.3g} {ratio:>8}")
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"\nбазовая линия сохранена: {args.baseline}")
+    if regressions:
+        print(f"\nотносительно калибровки медленнее базовой линии больше чем на {args.tolerance:.0%}: "
+              f"{', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--save", action="store_true", help="записать результаты как базовую линию")
+    parser.add_argument("--check", action="store_true", help="код выхода 1 при замедлении")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое замедление, доля")
+    parser.add_argument("--baseline", default=BASELINE, help="файл базовой линии")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
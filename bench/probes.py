@@ -0,0 +1,119 @@
+"""Поиск по нику: слепой HEAD, полный GET и план по манифесту (probes.plan).
+
+Макет отвечает по errorType сайта: status_code — 404, message — 200 с
+текстом ошибки в заголовке страницы, response_url — редирект на страницу
+ошибки; каждый пятый сайт по regexCheck не принимает «mockuser». Для
+каждой стратегии считаются запросы, прочитанные байты тел, время и ошибки
+против истины (профиль есть на чётных сайтах, которым ник подходит; ответ
+сайта, «находящего» любой ник, за находку не считается).
+
+С --bad-sites часть сайтов «находит» любой ник, часть отвечает 429, и
+добавляется стратегия «план + надёжность»: check_social_media после
+--controls контрольных проходов (main.control_probe_sites), которые
+копят статистику сайтов.
+
+Запуск: python -m bench.probes [--sites 200] [--payload 1] [--latency 0.0] [--bad-sites] [--controls 40]
+"""
+import argparse
+import asyncio
+import time
+
+from bench.lookups import INPUTS, main
+from bench.mock_upstream import MockConfig, MockUpstream, _filler
+import probes
+
+NICK = INPUTS["nick"]
+
+
+def truth(manifest: dict, bad_sites: bool) -> set:
+    return {name for i, (name, site) in enumerate(manifest.items())
+            if i % 2 == 0 and probes.nick_allowed(site, NICK) and not (bad_sites and (i % 13 == 12 or i % 11 == 10))}
+
+
+async def blind_head(session, manifest):
+    """Прежний check_social_media: HEAD с редиректами, найден при 200."""
+    found = set()
+    for name, site in manifest.items():
+        async with session.head(site["url"].replace("{}", NICK), allow_redirects=True) as resp:
+            if resp.status == 200:
+                found.add(name)
+    return found, 0, len(manifest)
+
+
+async def full_get(session, manifest):
+    """Как Sherlock: GET каждой страницы целиком и разбор по errorType."""
+    found, read = set(), 0
+    for name, site in manifest.items():
+        redirects = site["errorType"] != "response_url"
+        async with session.get(site["url"].replace("{}", NICK), allow_redirects=redirects) as resp:
+            body = await resp.read()
+            read += len(body)
+            if site["errorType"] == "message":
+                ok = site["errorMsg"].encode() not in body
+            else:
+                ok = 200 <= resp.status < 300
+            if ok and probes.nick_allowed(site, NICK):
+                found.add(name)
+    return found, read, len(manifest)
+
+
+async def planned(session, manifest):
+    stats = probes.ScanStats()
+    found = set()
+    for probe in probes.plan(manifest, NICK, stats):
+        if await probes.run_probe(session, probe, stats) == probes.FOUND:
+            found.add(probe.name)
+    return found, stats.bytes_read, stats.requests
+
+
+async def with_reliability(session, manifest):
+    # Контрольные проходы идут до замера: считается только сам поиск
+    found = {name for name, _ in await main.check_social_media(NICK)}
+    read = main.NICK_SCAN_BYTES_READ._values[()][-1] - with_reliability.read_before
+    return found, read, sum(main.NICK_PROBES._values.values()) - with_reliability.probes_before
+
+
+async def run(args):
+    mock = MockUpstream(MockConfig(latency=args.latency, jitter=0.0, payload_scale=args.payload,
+                                   sherlock_sites=args.sites, bad_sites=args.bad_sites))
+    main.UPSTREAM_OVERRIDE = await mock.start()
+    session = main.get_http_session()
+    manifest = await main.load_sherlock_manifest()
+    expected = truth(manifest, args.bad_sites)
+    strategies = [("слепой HEAD", blind_head), ("полный GET", full_get), ("план", planned)]
+    if args.bad_sites:
+        strategies.append(("план+надёжн.", with_reliability))
+    print(f"сайтов {len(manifest)}, профиль есть на {len(expected)}, страница ~{len(_filler(args.payload)) / 1024:.0f} КиБ\n")
+    print(f"{'стратегия':<14} {'запросов':>9} {'HTTP всего':>11} {'прочитано, КиБ':>15} {'время, с':>9} "
+          f"{'ложно найдено':>14} {'пропущено':>10}")
+    for name, strategy in strategies:
+        if strategy is with_reliability:
+            main.site_reliability = main.sitestats.SiteReliability()
+            main.site_reliability.loaded = True
+            main.SITE_CONTROLS_PER_RUN = len(manifest)
+            for _ in range(args.controls):
+                await main.control_probe_sites()
+            with_reliability.probes_before = sum(main.NICK_PROBES._values.values())
+            with_reliability.read_before = main.NICK_SCAN_BYTES_READ._values.get((), [0])[-1]
+        mock.requests.clear()
+        started = time.perf_counter()
+        found, read, requests = await strategy(session, manifest)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<14} {requests:9d} {sum(mock.requests.values()):11d} {read / 1024:15.0f} {elapsed:9.2f} "
+              f"{len(found - expected):14d} {len(expected - found):10d}")
+    await main.close_http_session()
+    await mock.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sites", type=int, default=200, help="сайтов в манифесте")
+    parser.add_argument("--payload", type=int, default=1, help="множитель размера страниц")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка макета, с")
+    parser.add_argument("--bad-sites", action="store_true", help="сайты с ложными «найден» и блокировками")
+    parser.add_argument("--controls", type=int, default=10, help="контрольных проходов перед «план + надёжность»")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,164 @@
+"""Запись ответов внешних API в очищенный корпус фикстур bench/fixtures/.
+
+Поиски из bench.lookups прогоняются через общую сессию бота, у которой
+ClientResponse сохраняет каждое прочитанное тело ответа. Перед записью
+искомые значения заменяются на INPUTS из bench.lookups, остальные
+email- и IPv4-адреса и номера телефонов маскируются, а у URL отбрасывается
+query (там ключи API). В JSON-ответах утечек вычищаются сами секреты:
+пароли из строк «логин:пароль» ProxyNova, top_logins/top_passwords
+Hudson Rock, fields LeakCheck и любые поля с паролями, токенами и ключами;
+форма ответа (длины списков, ключи) сохраняется, чтобы парсеры в
+bench.parsers работали с тем же объёмом. Ключи API в URL внутри тела
+тоже заменяются. Ответы без тела (HEAD по сайтам Sherlock) не пишутся.
+
+Запуск: python -m bench.record [--email ...] [--phone ...] [--nick ...] [--domain ...]
+                               [--ip ...] [--inn ...] [--github_user ...] [--tiktok ...]
+        python -m bench.record --mock      # корпус с локального макета, без сети
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from bench.lookups import INPUTS, LOOKUPS, main
+from bench.mock_upstream import MockConfig, MockUpstream
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TEXT_TYPES = ("json", "text", "html", "xml", "javascript")
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+IPV4_RE = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+# Номер с «+» (в том числе с разделителями) или российский мобильный подряд: ИНН, ОГРН и
+# метки времени той же длины под него не подходят
+PHONE_RE = re.compile(r"(?<![\w.])(?:\+\d[\d ()-]{8,18}\d|[78]9\d{9})(?![\w.])")
+KEY_PARAM_RE = re.compile(r"([?&](?:api_?key|apikey|key|token|access_token|secret)=)[^&\s\"'<>]+", re.I)
+# Поля, значения которых — секреты, а не форма ответа
+SECRET_FIELDS = frozenset(("password", "passwords", "top_passwords", "top_logins", "fields", "hash", "token",
+                           "api_key", "apikey", "key", "secret"))
+CREDENTIAL_FIELDS = frozenset(("lines",))   # ProxyNova: «логин:пароль»
+REDACTED = "***"
+
+
+class Recorder:
+    def __init__(self, values: dict):
+        # Сначала длинные значения, чтобы номер целиком заменялся раньше своих частей
+        pairs = []
+        for action, value in values.items():
+            placeholder = INPUTS[action]
+            pairs.append((value, placeholder))
+            if action in ("phone", "mnp"):
+                digits, fake = re.sub(r"\D", "", value), re.sub(r"\D", "", placeholder)
+                pairs += [(digits, fake), (digits[1:], fake[1:])]
+        self.replacements = sorted({(v, p) for v, p in pairs if v and v != p}, key=lambda pair: -len(pair[0]))
+        self.saved = 0
+        self._names = set()
+
+    def sanitize(self, text: str) -> str:
+        for value, placeholder in self.replacements:
+            text = text.replace(value, placeholder)
+        text = EMAIL_RE.sub(INPUTS["email"], text)
+        text = IPV4_RE.sub(INPUTS["ip"], text)
+        text = PHONE_RE.sub(self._phone, text)
+        return KEY_PARAM_RE.sub(rf"\1{REDACTED}", text)
+
+    @staticmethod
+    def _phone(match) -> str:
+        fake = INPUTS["phone"]
+        return fake if match.group().startswith("+") else fake.lstrip("+")
+
+    def redact(self, value, field: str = None):
+        """Заменяет секреты в разобранном JSON, не меняя его форму."""
+        if isinstance(value, dict):
+            return {key: self.redact(item, str(key).lower()) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.redact(item, field) for item in value]
+        if not isinstance(value, str):
+            return value
+        if field in SECRET_FIELDS:
+            return REDACTED
+        if field in CREDENTIAL_FIELDS:
+            login, sep, _ = value.partition(":")
+            return f"{login}{sep}{REDACTED}" if sep else value
+        return value
+
+    def sanitize_body(self, text: str) -> str:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return self.sanitize(text)
+        if not isinstance(data, (dict, list)):
+            return self.sanitize(text)
+        return self.sanitize(json.dumps(self.redact(data), ensure_ascii=False))
+
+    def save(self, url: str, status: int, content_type: str, body: bytes):
+        if not any(kind in content_type for kind in TEXT_TYPES):
+            return
+        parts = urlsplit(url)
+        host, path = parts.hostname, parts.path
+        if main.UPSTREAM_OVERRIDE and url.startswith(main.UPSTREAM_OVERRIDE):
+            host, _, path = parts.path.lstrip("/").partition("/")
+            path = "/" + path
+        path = self.sanitize(path)
+        name = re.sub(r"[^A-Za-z0-9.-]+", "_", f"{host}{path}").strip("_")[:90].removesuffix(".json")
+        candidate, n = name, 1
+        while candidate in self._names:
+            n += 1
+            candidate = f"{name}.{n}"
+        self._names.add(candidate)
+        fixture = {"source": main.current_source.get(), "host": host, "path": path, "status": status,
+                   "content_type": content_type, "body": self.sanitize_body(body.decode("utf-8", "replace"))}
+        with open(os.path.join(FIXTURES, candidate + ".json"), "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=1)
+        self.saved += 1
+
+
+class RecordingResponse(aiohttp.ClientResponse):
+    recorder = None
+
+    async def read(self) -> bytes:
+        body = await super().read()
+        if self.recorder is not None:
+            self.recorder.save(str(self.url), self.status, self.content_type, body)
+        return body
+
+
+async def run(args):
+    values = {action: getattr(args, action) or INPUTS[action] for action in LOOKUPS}
+    mock = None
+    if args.mock:
+        mock = MockUpstream(MockConfig(latency=0, sherlock_sites=6))
+        main.UPSTREAM_OVERRIDE = await mock.start()
+    os.makedirs(FIXTURES, exist_ok=True)
+    RecordingResponse.recorder = recorder = Recorder(values)
+    main._http_session = aiohttp.ClientSession(
+        response_class=RecordingResponse,
+        request_class=main.OverrideRequest if main.UPSTREAM_OVERRIDE else aiohttp.ClientRequest,
+        cookie_jar=aiohttp.DummyCookieJar(),
+    )
+    for action, lookup in LOOKUPS.items():
+        token = main.current_source.set(action)
+        try:
+            await lookup(values[action])
+        except Exception as e:
+            print(f"{action}: {e!r}")
+        finally:
+            main.current_source.reset(token)
+    await main.close_http_session()
+    if mock is not None:
+        await mock.stop()
+    print(f"записано ответов: {recorder.saved} → {FIXTURES}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    for action in LOOKUPS:
+        parser.add_argument(f"--{action}", help=f"значение для поиска «{action}»")
+    parser.add_argument("--mock", action="store_true", help="писать ответы локального макета")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,78 @@
+"""Память на один закэшированный результат: строка DAMAGE против упакованной модели.
+
+В кэше страниц (result_pages) бот хранит PagedResult с упакованной моделью;
+строка DAMAGE — то, что лежало там раньше.
+
+Запуск: python -m bench.result_memory [количество]
+"""
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+async def _const(value):
+    return value
+
+
+async def email_result(i):
+    email = f"user{i}@example.com"
+    hudson = {"message": "This email address is associated with a computer that was infected by an info-stealer",
+              "total_corporate_services": 3, "total_user_services": 12,
+              "stealers": [{"date_compromised": "2023-05-0%dT10:00:00.000Z" % (n + 1), "ip": f"10.0.{i % 250}.{n}",
+                            "operating_system": "Windows 10 Pro x64", "top_logins": [f"login{n}{i}", "admin", "root"]}
+                           for n in range(3)]}
+    leakcheck = {"success": True, "found": 4,
+                 "sources": [{"name": f"Breach{n}.com", "date": f"2019-0{n + 1}"} for n in range(4)]}
+    proxynova = {"count": 42, "lines": [f"{email}:password{n}{i}" for n in range(10)]}
+    psbdmp = [{"id": f"p{i}x{n}", "tags": "email,leak"} for n in range(5)]
+    results = await asyncio.gather(
+        main.timed_source("Hudson Rock", _const(hudson), lambda d: main.format_hudson_standard(d, "email", email)),
+        main.timed_source("LeakCheck", _const(leakcheck), lambda d: main.format_leakcheck(d, email)),
+        main.timed_source("ProxyNova", _const(proxynova), lambda d: main.format_proxynova(d, email)),
+        main.timed_source("PSBDmp", _const(psbdmp), lambda d: main.format_psbdmp(d, email, "email")),
+        main.timed_source("Gravatar", _const(main.Section("✅ Gravatar", {"Name": f"User {i}"}))),
+        main.timed_source("Imgur", _const(main.Section("✅ Imgur"))),
+    )
+    return list(results)
+
+
+def paged(results):
+    text = main.render(results, title="📧 email")
+    return main.PagedResult.pack(results, text, len(main.split_into_pages(text)), "📧 email")
+
+
+def measure(build, n):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = [build(i) for i in range(n)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / n, store
+
+
+async def run(n):
+    sources = [await email_result(i) for i in range(n)]
+    cases = [
+        ("строка DAMAGE (как раньше)", lambda i: main.render(sources[i], title="📧 email")),
+        ("SourceResult в памяти", lambda i: main.unpack_results(main.pack_results(sources[i]))),
+        ("pack_results (JSON+zlib)", lambda i: main.pack_results(sources[i])),
+        ("PagedResult в result_pages", lambda i: paged(sources[i])),
+    ]
+    print(f"{n} результатов поиска по email")
+    for name, build in cases:
+        per_item, store = measure(build, n)
+        print(f"  {name:<28} {per_item:8.0f} байт на результат")
+        del store
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
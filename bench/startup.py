@@ -0,0 +1,98 @@
+"""Холодный старт: время до первого обработанного апдейта и цена первых поисков.
+
+Бот запускается отдельным процессом, как в bench.loadtest, а апдейт /help
+кладётся в очередь поддельного Bot API ещё до запуска — первый же getUpdates
+его получит. Замеряется время от запуска процесса до ответа на /help, затем
+сразу (или через --settle секунд) — полный ответ на первый поиск по нику
+и по телефону: первый поиск по нику платит за манифест Sherlock и новые
+соединения, по телефону — за данные phonenumbers. Отдельно меряется
+импорт main в свежем интерпретаторе.
+
+Запуск: python -m bench.startup [--runs 3] [--settle 0] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+from bench.loadtest import ROOT, FakeBotAPI
+from bench.mock_upstream import MockConfig, MockUpstream
+
+REPLY_TIMEOUT = 60.0
+
+
+def import_seconds() -> float:
+    code = ("import os, time; os.environ.setdefault('BOT_TOKEN', '1:bench'); t = time.perf_counter(); "
+            "import main; print(time.perf_counter() - t)")
+    return float(subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip().splitlines()[-1])
+
+
+async def reply(api: FakeBotAPI, user_id: int, final: bool) -> float:
+    """Время ответа боту; final — ждать сообщение с меню (итог поиска), а не первый статус."""
+    queue = api.replies.setdefault(user_id, asyncio.Queue())
+    while True:
+        stamp, _, _, has_menu = await asyncio.wait_for(queue.get(), REPLY_TIMEOUT)
+        if has_menu or not final:
+            return stamp
+
+
+async def lookup(api: FakeBotAPI, user_id: int, text: str) -> float:
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+    started = time.perf_counter()
+    api.send_text(user, text)
+    return await reply(api, user_id, final=True) - started
+
+
+async def one_run(args, run: int):
+    api = FakeBotAPI()
+    mock = MockUpstream(MockConfig(latency=args.latency, sherlock_sites=args.sites))
+    api_url = await api.start()
+    upstream_url = await mock.start()
+    first_user = {"id": 100 + run, "is_bot": False, "first_name": "first"}
+    api.send_text(first_user, "/help")
+    started = time.perf_counter()
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bench.loadtest", "--serve-bot", api_url, upstream_url, cwd=ROOT)
+    try:
+        first_update = await reply(api, first_user["id"], final=False) - started
+        if args.settle:
+            await asyncio.sleep(args.settle)
+        nick = await lookup(api, 200 + run, "mockuser")
+        phone = await lookup(api, 300 + run, "+79123456789")
+        return first_update, nick, phone
+    finally:
+        bot.terminate()
+        await bot.wait()
+        await mock.stop()
+        await api.stop()
+
+
+async def run(args):
+    imports = [import_seconds() for _ in range(args.runs)]
+    print(f"импорт main: медиана {statistics.median(imports) * 1000:.0f} мс "
+          f"(мин {min(imports) * 1000:.0f}, макс {max(imports) * 1000:.0f})")
+    print(f"задержка API {args.latency * 1000:.0f} мс, сайтов Sherlock {args.sites}, пауза перед поисками {args.settle:g} с\n")
+    print(f"{'запуск':>6} {'1-й апдейт, с':>14} {'1-й ник, с':>11} {'1-й телефон, с':>15}")
+    rows = []
+    for n in range(args.runs):
+        row = await one_run(args, n)
+        rows.append(row)
+        print(f"{n + 1:6d} {row[0]:14.3f} {row[1]:11.3f} {row[2]:15.3f}")
+    medians = [statistics.median(column) for column in zip(*rows)]
+    print(f"{'медиана':>6} {medians[0]:14.3f} {medians[1]:11.3f} {medians[2]:15.3f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=3, help="запусков бота")
+    parser.add_argument("--settle", type=float, default=0.0, help="пауза между первым ответом и поисками, с")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка макета внешних API, с")
+    parser.add_argument("--sites", type=int, default=50, help="сайтов в манифесте Sherlock")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
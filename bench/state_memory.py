@@ -0,0 +1,91 @@
+"""Память под состояние пользователей: словари «как раньше» против TTLMap со слотами.
+
+«После» включает и registrations.Registrations — регистрацию, которая
+переживает вытеснение записей из users.
+
+Запуск: python -m bench.state_memory [количество_пользователей]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+ACTIONS = ["nick", "email", "ip", "phone", "tgid"]
+
+
+def build_before(n):
+    today = datetime.now().date().isoformat()
+    user_limits, user_state, last_request_time = {}, {}, {}
+    now = time.time()
+    for uid in range(n):
+        user_limits[uid] = {"date": today, "count": 1, "bonus": 0, "referrals": 0}
+        user_state[uid] = ACTIONS[uid % 5]
+        last_request_time[uid] = now + uid
+    return user_limits, user_state, last_request_time
+
+
+def build_after(n):
+    users = main.TTLMap(main.USER_TTL_SECONDS, keep=lambda r: r.bonus > 0 or r.referrals > 0)
+    registered = main.registrations.Registrations(ttl_days=main.REGISTRATION_TTL_DAYS)
+    today = main._today()
+    now = time.time()
+    for uid in range(n):
+        record = users[uid] = main.UserRecord()
+        record.day = today
+        record.count = 1
+        record.action = ACTIONS[uid % 5]
+        record.tokens = 5.0
+        record.stamp = now + uid
+        registered.mark(uid, today)
+    registered.compact(today)
+    return users, registered
+
+
+def measure(build, n):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    state = build(n)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used, elapsed, state
+
+
+def main_bench(n):
+    print(f"{n:,} синтетических пользователей")
+    used, elapsed, state = measure(build_before, n)
+    print(f"  до (dict на пользователя):    {used / 2**20:8.1f} МиБ, {used / n:6.0f} байт/польз., {elapsed:.2f} с")
+    del state
+    used, elapsed, state = measure(build_after, n)
+    print(f"  после (TTLMap + __slots__):   {used / 2**20:8.1f} МиБ, {used / n:6.0f} байт/польз., {elapsed:.2f} с")
+
+    # Первые 90% пользователей (самые давние по обращению) простаивают дольше TTL
+    users, registered = state
+    stale = time.monotonic() - main.USER_TTL_SECONDS - 1
+    for n_seen, record in enumerate(users.values()):
+        if n_seen >= n * 9 // 10:
+            break
+        record.touched = stale
+    started = time.perf_counter()
+    removed = users.sweep()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    print(f"  sweep(): снято {removed:,} записей за {elapsed:.2f} с, осталось {len(users):,}")
+    # Регистрации sweep() не снимает: они уже посчитаны в «после» и остаются
+    size = sum(map(sys.getsizeof, (registered._ids, registered._days, registered._pending)))
+    as_set = sys.getsizeof(set(range(n))) + n * sys.getsizeof(2 ** 40)
+    print(f"  из них регистрации:           {size / 2**20:8.1f} МиБ на {len(registered):,} id "
+          f"(set тех же id — {as_set / 2**20:.1f} МиБ)")
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
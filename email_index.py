@@ -0,0 +1,193 @@
+"""Локальный индекс почтовых доменов и кэш MX-записей.
+
+Одноразовые и бесплатные домены хранятся не строками, а 64-битными хешами
+в отсортированном array('Q'): 100 тыс. доменов занимают ~0,9 МБ против
+~13 МБ у frozenset строк. Домен проверяется вместе с родительскими
+суффиксами (a.b.mailinator.com → b.mailinator.com → mailinator.com),
+каждый — бинарным поиском по хешу.
+
+Списки читаются из каталога: disposable.txt и free.txt, по домену на
+строку, # — комментарий. EmailDomainIndex.load() можно вызвать повторно,
+чтобы подхватить обновлённые файлы.
+
+В репозитории лежат только короткие списки самых частых доменов; полные
+(около 100 тыс. одноразовых) скачиваются из открытых источников SOURCES
+при сборке образа и вливаются в те же файлы:
+
+    python -m email_index update [каталог]
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+import urllib.request
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Открытые списки: одноразовые — построчно, бесплатные — JSON-массив
+SOURCES = {
+    "disposable.txt": "https://raw.githubusercontent.com/disposable/disposable-email-domains/master/domains.txt",
+    "free.txt": "https://raw.githubusercontent.com/Kikobeats/free-email-domains/master/domains.json",
+}
+
+ROLE_LOCAL_PARTS = frozenset(
+    "abuse admin administrator billing contact contacts help hello hostmaster info inquiries jobs mail "
+    "mailer-daemon marketing media news newsletter no-reply noc noreply office orders postmaster press "
+    "privacy reception root sales security service support team webmaster".split()
+)
+
+
+def domain_hash(domain: str) -> int:
+    return int.from_bytes(hashlib.blake2b(domain.encode(), digest_size=8).digest(), "little")
+
+
+class DomainSet:
+    """Множество доменов в виде отсортированных хешей; совпадение — по домену или его родителю."""
+    __slots__ = ("_hashes",)
+
+    def __init__(self, domains=()):
+        self._hashes = array("Q", sorted({domain_hash(d.strip().lower().rstrip(".")) for d in domains if d.strip()}))
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    @property
+    def nbytes(self) -> int:
+        return self._hashes.itemsize * len(self._hashes)
+
+    def has_hash(self, h: int) -> bool:
+        i = bisect_left(self._hashes, h)
+        return i < len(self._hashes) and self._hashes[i] == h
+
+    def matches(self, domain: str) -> bool:
+        return any(self.has_hash(h) for h in suffix_hashes(domain))
+
+
+def suffix_hashes(domain: str) -> list:
+    """Хеши домена и его родителей; одноуровневый суффикс («com») не берём — это TLD."""
+    hashes = []
+    while "." in domain:
+        hashes.append(domain_hash(domain))
+        domain = domain.split(".", 1)[1]
+    return hashes
+
+
+@dataclass(slots=True)
+class EmailVerdict:
+    valid: bool
+    domain: str
+    disposable: bool = False
+    free: bool = False
+    role: bool = False
+
+
+def _read_domains(path: str):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.split("#", 1)[0] for line in f]
+
+
+class EmailDomainIndex:
+    def __init__(self, disposable=(), free=(), source: str = None):
+        self.disposable = DomainSet(disposable)
+        self.free = DomainSet(free)
+        self.source = source
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, directory: str) -> "EmailDomainIndex":
+        return cls(_read_domains(os.path.join(directory, "disposable.txt")),
+                   _read_domains(os.path.join(directory, "free.txt")), source=directory)
+
+    def check(self, email: str, is_valid=None) -> EmailVerdict:
+        """is_valid — проверка формата адреса; по умолчанию достаточно «@» и точки в домене."""
+        local, _, domain = email.strip().lower().rpartition("@")
+        valid = bool(local) and "." in domain and (is_valid is None or is_valid(email))
+        if not valid:
+            return EmailVerdict(False, domain)
+        # Хеши суффиксов считаются один раз на оба множества
+        hashes = suffix_hashes(domain)
+        return EmailVerdict(True, domain, any(self.disposable.has_hash(h) for h in hashes),
+                            any(self.free.has_hash(h) for h in hashes), local.split("+", 1)[0] in ROLE_LOCAL_PARTS)
+
+    def stats(self) -> str:
+        return (f"одноразовых доменов: {len(self.disposable)}, бесплатных: {len(self.free)}, "
+                f"память: {(self.disposable.nbytes + self.free.nbytes) / 1024:.0f} КиБ, "
+                f"загружен {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.loaded_at))} из {self.source or '—'}")
+
+
+class MxCache:
+    """MX-хосты домена с TTL из DNS-ответа (в пределах [MIN_TTL, MAX_TTL]); «нет MX» живёт NEGATIVE_TTL."""
+    MIN_TTL = 300
+    MAX_TTL = 86400
+    NEGATIVE_TTL = 600
+
+    def __init__(self, max_size: int = 50000):
+        self.max_size = max_size
+        self._data = OrderedDict()     # домен -> (истекает, кортеж MX-хостов), в порядке вставки
+
+    def get(self, domain: str, now: float = None):
+        """Кортеж MX-хостов (пустой — MX нет) или None, если записи нет или она истекла."""
+        entry = self._data.get(domain)
+        if entry is None:
+            return None
+        if entry[0] < (now if now is not None else time.monotonic()):
+            del self._data[domain]
+            return None
+        return entry[1]
+
+    def put(self, domain: str, hosts, ttl: float = 0, now: float = None):
+        now = now if now is not None else time.monotonic()
+        ttl = min(max(ttl, self.MIN_TTL), self.MAX_TTL) if hosts else self.NEGATIVE_TTL
+        self._data.pop(domain, None)
+        if len(self._data) >= self.max_size:
+            self._data.popitem(last=False)
+        self._data[domain] = (now + ttl, tuple(hosts))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _parse_remote(body: str) -> list:
+    if body.lstrip().startswith("["):
+        return json.loads(body)
+    return [line.split("#", 1)[0] for line in body.splitlines()]
+
+
+def update(directory: str, sources: dict = SOURCES, timeout: float = 60) -> dict:
+    """Скачивает списки и дописывает их к локальным файлам; {файл: доменов после обновления}.
+
+    Домены из репозитория сохраняются. Файл пишется через временный, так что
+    при обрыве загрузки или записи остаётся прежний список.
+    """
+    counts = {}
+    for name, url in sources.items():
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            remote = _parse_remote(resp.read().decode("utf-8"))
+        path = os.path.join(directory, name)
+        header = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                header = [line.rstrip("\n") for line in f if line.startswith("#") and "источник:" not in line]
+        domains = sorted({d.strip().lower().rstrip(".") for d in [*_read_domains(path), *remote] if d.strip()})
+        header.append(f"# источник: {url}, {time.strftime('%Y-%m-%d')}")
+        tmp = f"{path}.tmp"
+        os.makedirs(directory, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(header + domains) + "\n")
+        os.replace(tmp, path)
+        counts[name] = len(domains)
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "update":
+        sys.exit("Использование: python -m email_index update [каталог]")
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                "data", "email_domains")
+    for name, count in update(target).items():
+        print(f"{name}: {count} доменов")
@@ -0,0 +1,78 @@
+"""Взвешенная справедливая очередь исходящих HTTP-запросов.
+
+Пул соединений общий для всех поисков, и один скан ника с сотнями
+проверок может занять его целиком — поиск по IP или ИНН тогда ждёт за
+всеми его запросами. Планировщик делит слоты пула между потоками (flow):
+поток — это один поиск, у него свой вес.
+
+Пока свободные слоты есть, запрос получает слот сразу. Когда пул занят,
+запрос встаёт в очередь с меткой max(виртуальное время, метка
+предыдущего запроса потока) + 1 / вес, а освободившийся слот получает
+запрос с наименьшей меткой. Поток с весом 8 обслуживается в 8 раз чаще
+потока с весом 1, а первый запрос нового поиска встаёт впереди хвоста
+длинного скана, а не за ним. Виртуальное время — метка последнего
+обслуженного из очереди запроса, поэтому поток, простаивавший или
+бравший свободные слоты, не копит ни долга, ни запаса.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class Flow:
+    __slots__ = ("name", "weight", "finish", "queued")
+
+    def __init__(self, name: str, weight: float = 1.0):
+        self.name = name
+        self.weight = weight
+        self.finish = 0.0       # метка последнего запроса потока, поставленного в очередь
+        self.queued = 0
+
+
+class FairScheduler:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.virtual = 0.0
+        self._heap = []         # (метка, порядковый номер, поток, future)
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for entry in self._heap if not entry[3].done())
+
+    async def acquire(self, flow: Flow) -> float:
+        """Ждёт слот для запроса потока flow; возвращает время ожидания в секундах."""
+        while self._heap and self._heap[0][3].done():
+            heapq.heappop(self._heap)   # запросы, отменённые в очереди
+        if self.in_use < self.capacity and not self._heap:
+            self.in_use += 1
+            return 0.0
+        started = time.perf_counter()
+        tag = max(self.virtual, flow.finish) + 1.0 / flow.weight
+        flow.finish = tag
+        flow.queued += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (tag, next(self._seq), flow, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже передан этому запросу, но задачу отменили раньше, чем она его заняла
+                self.release()
+            raise
+        finally:
+            flow.queued -= 1
+        return time.perf_counter() - started
+
+    def release(self):
+        """Освобождённый слот переходит первому живому запросу очереди, иначе возвращается в пул."""
+        while self._heap:
+            tag, _, _, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            self.virtual = tag
+            future.set_result(None)
+            return
+        self.in_use -= 1
@@ -0,0 +1,119 @@
+"""Регулятор нагрузки поисков.
+
+По глубине очереди апдейтов, лагу event loop и доле ошибок внешних API
+выбирается уровень обслуживания:
+full — все источники; reduced — без малополезных источников и с
+ограниченным числом сайтов для ника; essential — только локальные данные,
+без запросов к внешним API.
+
+Вверх уровень поднимается сразу, вниз — на одну ступень и только после
+COOLDOWN секунд, в течение которых нагрузка держится ниже порога.
+"""
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import metrics
+
+FULL, REDUCED, ESSENTIAL = 0, 1, 2
+TIER_NAMES = ("full", "reduced", "essential")
+
+TIER = metrics.Gauge("bot_load_tier", "Уровень обслуживания: 0 full, 1 reduced, 2 essential")
+TIER_CHANGES = metrics.Counter("bot_load_tier_changes_total", "Переключения уровня обслуживания", ["tier"])
+
+log = logging.getLogger("governor")
+
+
+@dataclass
+class Thresholds:
+    queue_reduced: int = 50          # апдейтов в очереди
+    queue_essential: int = 200
+    lag_reduced: float = 0.25        # сглаженный лаг event loop, с
+    lag_essential: float = 1.0
+    errors_reduced: float = 0.3      # доля ошибок внешних API за окно
+    errors_essential: float = 0.6
+    min_requests: int = 20           # при меньшем числе запросов в окне доля ошибок не учитывается
+
+
+class LoadGovernor:
+    def __init__(self, thresholds: Thresholds = None, window: float = 30.0, cooldown: float = 30.0):
+        self.thresholds = thresholds or Thresholds()
+        self.window = window
+        self.cooldown = cooldown
+        self.tier = FULL
+        TIER.set(self.tier)
+        self.reason = ""
+        self.changed_at = time.monotonic()
+        self.signals = {"queue": 0, "lag": 0.0, "errors": 0.0, "requests": 0}
+        self._calm_since = None
+        # Посекундные корзины [секунда, запросов, ошибок] — без записи на каждый запрос
+        self._buckets = deque()
+
+    def record(self, ok: bool, now: float = None):
+        second = int(now if now is not None else time.monotonic())
+        if self._buckets and self._buckets[-1][0] == second:
+            bucket = self._buckets[-1]
+        else:
+            bucket = [second, 0, 0]
+            self._buckets.append(bucket)
+        bucket[1] += 1
+        if not ok:
+            bucket[2] += 1
+
+    def error_rate(self, now: float = None):
+        now = now if now is not None else time.monotonic()
+        while self._buckets and self._buckets[0][0] < now - self.window:
+            self._buckets.popleft()
+        total = sum(bucket[1] for bucket in self._buckets)
+        errors = sum(bucket[2] for bucket in self._buckets)
+        return (errors / total if total else 0.0), total
+
+    def _target(self, queue_depth: int, loop_lag: float, errors: float, requests: int):
+        t = self.thresholds
+        errors = errors if requests >= t.min_requests else 0.0
+        if queue_depth >= t.queue_essential:
+            return ESSENTIAL, f"очередь {queue_depth}"
+        if loop_lag >= t.lag_essential:
+            return ESSENTIAL, f"лаг loop {loop_lag * 1000:.0f} мс"
+        if errors >= t.errors_essential:
+            return ESSENTIAL, f"ошибки API {errors:.0%}"
+        if queue_depth >= t.queue_reduced:
+            return REDUCED, f"очередь {queue_depth}"
+        if loop_lag >= t.lag_reduced:
+            return REDUCED, f"лаг loop {loop_lag * 1000:.0f} мс"
+        if errors >= t.errors_reduced:
+            return REDUCED, f"ошибки API {errors:.0%}"
+        return FULL, "норма"
+
+    def evaluate(self, queue_depth: int, loop_lag: float, now: float = None) -> int:
+        now = now if now is not None else time.monotonic()
+        errors, requests = self.error_rate(now)
+        self.signals = {"queue": queue_depth, "lag": loop_lag, "errors": errors, "requests": requests}
+        target, reason = self._target(queue_depth, loop_lag, errors, requests)
+        if target > self.tier:
+            self._switch(target, reason, now)
+        elif target < self.tier:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.cooldown:
+                self._switch(self.tier - 1, reason, now)
+        else:
+            self._calm_since = None
+        return self.tier
+
+    def _switch(self, tier: int, reason: str, now: float):
+        log.warning("уровень обслуживания %s → %s (%s)", TIER_NAMES[self.tier], TIER_NAMES[tier], reason)
+        self.tier = tier
+        self.reason = reason
+        self.changed_at = now
+        self._calm_since = None
+        TIER.set(tier)
+        TIER_CHANGES.inc(TIER_NAMES[tier])
+
+    def report(self) -> str:
+        s = self.signals
+        return (f"Уровень: {TIER_NAMES[self.tier]} ({self.reason or 'с запуска'}, "
+                f"{time.monotonic() - self.changed_at:.0f} с назад)\n"
+                f"Очередь: {s['queue']}, лаг loop: {s['lag'] * 1000:.0f} мс, "
+                f"ошибки API: {s['errors']:.0%} из {s['requests']} за {self.window:.0f} с")
@@ -0,0 +1,106 @@
+"""История недавних поисков пользователя.
+
+Запись — уже отрисованный текст результата, сжатый zlib, вместе с
+действием, запросом и временем поиска. На пользователя хранится не
+больше per_user записей, запись живёт ttl секунд, а все записи вместе
+занимают не больше max_bytes: при переполнении вытесняются самые старые
+записи всех пользователей. Повторный поиск того же запроса заменяет
+прежнюю запись. Показ из истории не ходит в источники и не тратит лимит.
+"""
+import itertools
+import time
+import zlib
+from collections import OrderedDict
+
+
+class HistoryEntry:
+    __slots__ = ("id", "user_id", "action", "query", "created", "blob", "parse_mode", "disable_preview")
+
+    def __init__(self, entry_id: int, user_id: int, action: str, query: str, created: float, blob: bytes,
+                 parse_mode=None, disable_preview=None):
+        self.id = entry_id
+        self.user_id = user_id
+        self.action = action
+        self.query = query
+        self.created = created      # wall-clock: показывается пользователю
+        self.blob = blob
+        self.parse_mode = parse_mode
+        self.disable_preview = disable_preview
+
+    def text(self) -> str:
+        return zlib.decompress(self.blob).decode()
+
+
+class LookupHistory:
+    def __init__(self, per_user: int = 10, ttl: float = 24 * 3600, max_bytes: int = 16 * 1024 * 1024):
+        self.per_user = per_user
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()   # id -> запись, от старых к новым по всем пользователям
+        self._by_user = {}              # user_id -> [id] от старых к новым
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, entry: HistoryEntry):
+        del self._entries[entry.id]
+        ids = self._by_user[entry.user_id]
+        ids.remove(entry.id)
+        if not ids:
+            del self._by_user[entry.user_id]
+        self.bytes -= len(entry.blob)
+
+    def add(self, user_id: int, action: str, query: str, text: str, parse_mode=None, disable_preview=None,
+            now: float = None) -> HistoryEntry:
+        now = now if now is not None else time.time()
+        for entry_id in list(self._by_user.get(user_id, ())):
+            entry = self._entries[entry_id]
+            if entry.action == action and entry.query == query:
+                self._remove(entry)
+        entry = HistoryEntry(next(self._ids), user_id, action, query, now, zlib.compress(text.encode(), 6),
+                             parse_mode, disable_preview)
+        self._entries[entry.id] = entry
+        ids = self._by_user.setdefault(user_id, [])
+        ids.append(entry.id)
+        self.bytes += len(entry.blob)
+        while len(ids) > self.per_user:
+            self._remove(self._entries[ids[0]])
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries.values())))
+        return entry
+
+    def _expired(self, entry: HistoryEntry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def get(self, user_id: int, entry_id: int, now: float = None):
+        """Запись entry_id этого пользователя или None: чужая, вытесненная или устаревшая."""
+        entry = self._entries.get(entry_id)
+        if entry is None or entry.user_id != user_id:
+            return None
+        if self._expired(entry, now if now is not None else time.time()):
+            self._remove(entry)
+            return None
+        return entry
+
+    def recent(self, user_id: int, now: float = None) -> list:
+        """Живые записи пользователя, новые первыми."""
+        now = now if now is not None else time.time()
+        entries = [self._entries[entry_id] for entry_id in self._by_user.get(user_id, ())]
+        for entry in entries:
+            if self._expired(entry, now):
+                self._remove(entry)
+        return [entry for entry in reversed(entries) if not self._expired(entry, now)]
+
+    def sweep(self, now: float = None) -> int:
+        """Снимает устаревшие записи с головы: записи упорядочены по времени добавления."""
+        now = now if now is not None else time.time()
+        removed = 0
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if not self._expired(entry, now):
+                break
+            self._remove(entry)
+            removed += 1
+        return removed
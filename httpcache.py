@@ -0,0 +1,82 @@
+"""HTTP-кэш с условными запросами.
+
+Ответ 200 хранится вместе с ETag/Last-Modified. Пока не истёк max-age из
+Cache-Control, он отдаётся без запроса в сеть; после — запрос уходит с
+If-None-Match/If-Modified-Since, и 304 подтверждает сохранённое тело.
+GitHub не списывает 304 с лимита запросов, поэтому повторный поиск того же
+пользователя лимит почти не расходует.
+"""
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    status: int
+    body: bytes
+    headers: dict
+    cache: str          # miss, fresh, revalidated или bypass (ответ не кэшируется)
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", "replace")
+
+
+class _Entry:
+    __slots__ = ("etag", "last_modified", "body", "expires")
+
+    def __init__(self, etag, last_modified, body, expires):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self.expires = expires
+
+
+def _max_age(headers) -> int:
+    control = headers.get("Cache-Control", "")
+    if "no-store" in control or "no-cache" in control:
+        return 0
+    match = _MAX_AGE.search(control)
+    return int(match.group(1)) if match else 0
+
+
+class ConditionalCache:
+    def __init__(self, max_entries: int = 2000, max_body: int = 256 * 1024):
+        self.max_entries = max_entries
+        self.max_body = max_body
+        self._entries = OrderedDict()   # url -> _Entry, последние обращения в конце
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, session, url: str, headers: dict = None, timeout: float = None, now: float = None):
+        """GET с учётом кэша; возвращает CachedResponse. Заголовки ответа — только на сетевом запросе."""
+        now = now if now is not None else time.monotonic()
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+            if entry.expires > now:
+                return CachedResponse(200, entry.body, {}, "fresh")
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag:
+                request_headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request_headers["If-Modified-Since"] = entry.last_modified
+        async with session.get(url, headers=request_headers, timeout=timeout) as resp:
+            if resp.status == 304 and entry is not None:
+                entry.expires = now + _max_age(resp.headers)
+                return CachedResponse(200, entry.body, resp.headers, "revalidated")
+            body = await resp.read()
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if resp.status == 200 and (etag or last_modified) and len(body) <= self.max_body:
+            self._entries[url] = _Entry(etag, last_modified, body, now + _max_age(resp.headers))
+            self._entries.move_to_end(url)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return CachedResponse(resp.status, body, resp.headers, "miss")
+        self._entries.pop(url, None)
+        return CachedResponse(resp.status, body, resp.headers, "bypass")
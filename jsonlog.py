@@ -0,0 +1,208 @@
+"""Структурные JSON-логи без ввода-вывода в event loop.
+
+Обработчики бота только кладут запись в очередь (QueueHandler), в файл
+её пишет фоновый поток QueueListener: одна JSON-строка на запись, файл
+ротируется по размеру. Очередь DEBUG/INFO ограничена: если поток записи
+не успевает, лишние записи отбрасываются и считаются, а не копятся в
+памяти. WARNING и выше идут отдельной неограниченной очередью со своим
+потоком записи: их мало, и терять их нельзя даже при всплеске отладки.
+
+Каждая запись несёт correlation id поиска (trace_id из tracing, тот же,
+что в /trace), id пользователя и действие — их связывает bind() в
+run_lookup, а ContextFilter снимает из contextvar ещё в потоке вызова.
+Частые события (проверка одного сайта, ответ источника) пишутся с долей
+из sample_rates — только DEBUG и INFO, предупреждения и ошибки не
+отбрасываются никогда.
+Доля попадает в запись полем sample, чтобы при разборе можно было
+пересчитать настоящие количества. В горячем пути sampled() решает до
+создания LogRecord — отброшенная запись почти ничего не стоит.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+import metrics
+
+QUEUE_SIZE = 10000
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+# Поля LogRecord, которые не попадают в JSON как дополнительные (extra)
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+DROPPED = metrics.Counter("log_records_dropped_total", "Записи лога, не дошедшие до файла: sampled или queue_full",
+                          ["reason"])
+
+# (correlation id, id пользователя, действие) текущего поиска
+log_context = contextvars.ContextVar("log_context", default=None)
+
+
+def bind(correlation_id: str, user_id: int = None, action: str = None):
+    return log_context.set((correlation_id, user_id, action))
+
+
+def unbind(token):
+    log_context.reset(token)
+
+
+# Доли событий; задаются setup(), читаются SamplingFilter и sampled()
+sample_rates = {}
+
+
+def _keep(event):
+    """Доля события, если запись оставлена, иначе 0.0; None — у события доли нет, пишется всегда."""
+    rate = sample_rates.get(event)
+    if rate is None or random.random() < rate:
+        return rate
+    DROPPED.inc("sampled")
+    return 0.0
+
+
+def sampled(logger: logging.Logger, event: str, msg: str, *args, level: int = logging.DEBUG, **fields):
+    """Запись частого события: уровень и доля проверяются раньше, чем собирается LogRecord."""
+    if not logger.isEnabledFor(level):
+        return
+    rate = _keep(event) if level < logging.WARNING else None
+    if rate != 0.0:
+        fields["event"] = event
+        fields["sample"] = rate
+        logger.log(level, msg, *args, extra=fields)
+
+
+class SamplingFilter(logging.Filter):
+    """Сэмплирует записи с extra event, пришедшие мимо sampled(); WARNING и выше — всегда."""
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING or hasattr(record, "sample"):
+            return True
+        rate = _keep(getattr(record, "event", None))
+        if rate == 0.0:
+            return False
+        record.sample = rate
+        return True
+
+
+class ContextFilter(logging.Filter):
+    """Копирует контекст поиска в запись: в потоке записи contextvar уже не виден."""
+
+    def filter(self, record) -> bool:
+        bound = log_context.get()
+        if bound is not None:
+            record.cid, record.user_id, record.action = bound
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and value is not None:
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в потоке вызова и без блокировки на полной очереди.
+
+    urgent — неограниченная очередь для WARNING и выше; без неё они идут в общую.
+    """
+
+    def __init__(self, queue, urgent=None):
+        super().__init__(queue)
+        self.urgent = urgent
+
+    def prepare(self, record):
+        # Аргументы подставляются сразу: к моменту записи изменяемые объекты могли поменяться
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            # Трассировка форматируется здесь, пока кадры живы; в потоке записи — готовая строка
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.urgent is not None and record.levelno >= logging.WARNING:
+            self.urgent.put_nowait(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc("queue_full")
+
+
+class QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # На полной очереди put_nowait упал бы: ждём, пока поток записи освободит место
+        self.queue.put(self._sentinel)
+
+
+_listeners = ()
+
+
+def setup(path: str, level: str = "INFO", console_level: str = "WARNING", rates: dict = None,
+          loggers=("bot",), max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT):
+    """Подключает очередь к корневому логгеру и запускает поток записи.
+
+    loggers получают уровень level; остальные (библиотеки) пишут только от WARNING.
+    """
+    global _listeners
+    if _listeners:
+        return _listeners
+    sample_rates.update(rates or {})
+    handlers = []
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                            encoding="utf-8", delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    console = logging.StreamHandler(sys.stderr)
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handlers.append(console)
+
+    records, urgent = queue.Queue(QUEUE_SIZE), queue.SimpleQueue()
+    handler = AsyncQueueHandler(records, urgent)
+    handler.addFilter(SamplingFilter())
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.WARNING)
+    for name in loggers:
+        logging.getLogger(name).setLevel(level)
+    # Два потока пишут в одни обработчики: Handler.handle берёт их блокировку
+    _listeners = tuple(QueueListener(q, *handlers, respect_handler_level=True) for q in (records, urgent))
+    for listener in _listeners:
+        listener.start()
+    return _listeners
+
+
+def shutdown():
+    """Дописывает очереди и останавливает потоки записи."""
+    global _listeners
+    if not _listeners:
+        return
+    for listener in _listeners:
+        listener.stop()
+    for handler in _listeners[0].handlers:
+        handler.close()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, AsyncQueueHandler):
+            root.removeHandler(handler)
+    _listeners = ()
@@ -0,0 +1,142 @@
+"""Сторож event loop: замер задержки планирования и стеки блокирующих вызовов.
+
+Корутина просыпается каждые interval секунд и считает, насколько позже срока
+её разбудили, — это и есть лаг цикла. Отдельный поток следит за отметкой
+последнего пробуждения: если цикл молчит дольше threshold, поток снимает стек
+потока цикла через sys._current_frames() и засчитывает выборку месту вызова —
+первому кадру из кода бота, считая от самого глубокого. Поток только
+складывает стеки в очередь под замком; разбирает их, обновляет sites и
+метрики корутина в потоке цикла при следующем пробуждении.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+import metrics
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STACK_DEPTH = 8
+
+LOOP_LAG = metrics.Histogram("loop_lag_seconds", "Задержка планирования event loop", buckets=LAG_BUCKETS)
+LOOP_STALLS = metrics.Counter("loop_stalls_total", "Остановки event loop дольше порога")
+LOOP_STALL_SAMPLES = metrics.Counter("loop_stall_samples_total",
+                                     "Выборки стека во время остановок цикла по месту вызова", ["site"])
+
+
+class CallSite:
+    __slots__ = ("samples", "stalls", "worst", "stack", "last_seen")
+
+    def __init__(self):
+        self.samples = 0
+        self.stalls = 0
+        self.worst = 0.0
+        self.stack = []
+        self.last_seen = 0.0
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, root: str = None):
+        self.interval = interval
+        self.threshold = threshold
+        # Кадры из этого каталога считаются «своим» кодом при выборе места вызова
+        self.root = os.path.abspath(root or os.path.dirname(__file__)) + os.sep
+        self.sites = {}
+        self.max_lag = 0.0
+        # Сглаженный лаг за последние секунды — сигнал для регулятора нагрузки
+        self.recent_lag = 0.0
+        self._heartbeat = time.perf_counter()
+        self._pending = []          # (стек, время) от потока-сэмплера; под _lock
+        self._lock = threading.Lock()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._thread = threading.Thread(target=self._sample, name="loopwatch", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _measure(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.recent_lag += (lag - self.recent_lag) * 0.2
+            # Выборки, снятые потоком за время остановки, забираем целиком
+            with self._lock:
+                pending, self._pending = self._pending, []
+            stall_sites = {self._record(stack, seen) for stack, seen in pending}
+            if lag >= self.threshold:
+                LOOP_STALLS.inc()
+                for key in stall_sites:
+                    site = self.sites[key]
+                    site.stalls += 1
+                    site.worst = max(site.worst, lag)
+
+    def _sample(self):
+        # Проверяем чаще порога, чтобы успеть поймать стек внутри остановки
+        period = min(self.interval, self.threshold) / 2
+        while not self._stopped.wait(period):
+            stalled = time.perf_counter() - self._heartbeat - self.interval
+            if stalled < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                stack = traceback.extract_stack(frame, limit=64)
+                with self._lock:
+                    self._pending.append((stack, time.time()))
+
+    def _record(self, stack, seen: float) -> str:
+        """Засчитывает выборку месту вызова; только из потока цикла."""
+        innermost = stack[-1]
+        own = next((f for f in reversed(stack) if f.filename.startswith(self.root)), innermost)
+        key = f"{os.path.basename(own.filename)}:{own.lineno} {own.name}"
+        if own is not innermost:
+            key += f" → {os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name}"
+        site = self.sites.get(key)
+        if site is None:
+            site = self.sites[key] = CallSite()
+        site.samples += 1
+        site.last_seen = seen
+        site.stack = [f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in stack[-STACK_DEPTH:]]
+        LOOP_STALL_SAMPLES.inc(key)
+        return key
+
+    def report(self, limit: int = 5) -> str:
+        lines = [f"⏱ Лаг event loop: p50 ≤ {_fmt(LOOP_LAG.quantile(0.5))}, p99 ≤ {_fmt(LOOP_LAG.quantile(0.99))}, "
+                 f"максимум {self.max_lag * 1000:.0f} мс",
+                 f"Остановок дольше {self.threshold * 1000:.0f} мс: {LOOP_STALLS.value()}"]
+        top = sorted(self.sites.items(), key=lambda item: item[1].samples, reverse=True)[:limit]
+        for key, site in top:
+            lines.append(f"\n{key}\nвыборок {site.samples}, остановок {site.stalls}, худшая {site.worst * 1000:.0f} мс")
+            lines += [f"  {frame}" for frame in site.stack]
+        if not top:
+            lines.append("Блокирующих вызовов не замечено.")
+        return "\n".join(lines)
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return "—"
+    if value == float("inf"):
+        return "∞"
+    return f"{value * 1000:.0f} мс"
@@ -1,22 +1,50 @@
 import os
 import re
 import time
+# Отсчёт бюджета запуска — до тяжёлых импортов
+PROCESS_STARTED = time.monotonic()
 import aiohttp
+from yarl import URL
 import json
 import asyncio
 import hashlib
+import secrets
+import functools
+import importlib
+import contextlib
+import contextvars
+import logging
+import zlib
 import urllib.parse
-import phonenumbers
-from phonenumbers import carrier, geocoder, timezone
-from bs4 import BeautifulSoup
 from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters,
-    ContextTypes, CallbackQueryHandler, ConversationHandler
+    ContextTypes, CallbackQueryHandler, ConversationHandler, TypeHandler
 )
 
+import metrics
+import tracing
+import loopwatch
+import timeouts
+import governor
+import classifier
+import email_index
+import httpcache
+import userindex
+import assets
+import probes
+import sitestats
+import fairqueue
+import history
+import jsonlog
+import registrations
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
@@ -25,10 +53,28 @@ DADATA_API_KEY = os.getenv('DADATA_API_KEY')
 DADATA_SECRET_KEY = os.getenv('DADATA_SECRET_KEY')
 OFDATA_API_KEY = os.getenv('OFDATA_API_KEY')
 VERIPHONE_API_KEY = os.getenv('VERIPHONE_API_KEY')
-EMAIL_VALIDATION_API_KEY = os.getenv('EMAIL_VALIDATION_API_KEY')
 EMAIL_REPUTATION_API_KEY = os.getenv('EMAIL_REPUTATION_API_KEY')
 IPGEOLOCATION_API_KEY = os.getenv('IPGEOLOCATION_API_KEY')
 IP2LOCATION_API_KEY = os.getenv('IP2LOCATION_API_KEY')
+# Эндпоинт /metrics для Prometheus; METRICS_PORT=0 отключает его
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+# Для бенчмарков: все запросы к внешним API уходят на этот адрес (см. bench/mock_upstream.py)
+UPSTREAM_OVERRIDE = os.getenv('UPSTREAM_OVERRIDE', '')
+# Остановка event loop дольше порога (в секундах) попадает в отчёт /loop со стеком
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.1'))
+# JSON-логи (jsonlog): файл с ротацией, уровень файла и консоли
+LOG_PATH = os.getenv('LOG_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'logs', 'bot.jsonl')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'INFO')
+# Доля записей частых событий, которая доходит до файла
+LOG_SAMPLE_RATES = {
+    "nick.probe": 0.01,
+    "upstream.request": 0.01,
+    "source.result": 0.1,
+}
+
+log = logging.getLogger("bot")
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не задан! Создайте файл .env и укажите токен.")
@@ -43,73 +89,416 @@ ADMIN_ID = 8359674526
  TYPING_ADMIN_USER_ID, TYPING_ADMIN_AMOUNT) = range(14)
 
 # ---------- Хранилище лимитов и защиты ----------
-user_limits = {}
-user_state = {}
-last_request_time = {}
-last_notify_time = {}
-
 MAX_REQUESTS_PER_DAY = 5
-MIN_INTERVAL_SECONDS = 2
 MAX_INPUT_LENGTH = 500
 
+# Token bucket: rate — сколько единиц восстанавливается в секунду, burst — ёмкость корзины.
+# Меняются админом на лету командой /limits.
+RATE_LIMITS = {
+    "user_rate": 0.2,
+    "user_burst": 15.0,
+    "global_rate": 20.0,
+    "global_burst": 200.0,
+}
+# Стоимость действия в единицах корзины: скан ника по ~400 сайтам дороже поиска ID
+ACTION_WEIGHTS = {
+    "nick": 10.0,
+    "email": 5.0,
+    "domain": 3.0,
+    "phone": 3.0,
+    "ip": 2.0,
+    "github_user": 2.0,
+    "tiktok": 2.0,
+    "mnp": 1.0,
+    "inn": 1.0,
+    "fio": 1.0,
+    "tgid": 1.0,
+}
+# Вес поиска в очереди исходящих HTTP-запросов (fairqueue): у точечных поисков с парой
+# запросов он выше, чем у массовых сканов, — их запросы обслуживаются раньше
+HTTP_FLOW_WEIGHTS = {
+    "nick": 1.0,
+    "email": 4.0,
+    "domain": 4.0,
+    "phone": 4.0,
+}
+HTTP_FLOW_WEIGHT_DEFAULT = 8.0
+
+USER_TTL_SECONDS = 30 * 24 * 3600
+PANELS_TTL_SECONDS = 6 * 3600
+STATE_SWEEP_INTERVAL_SECONDS = 10 * 60
+# Регистрация без новых запросов забывается через год: реферальный бонус за давно ушедшего — не потеря
+REGISTRATION_TTL_DAYS = 365
+REGISTRATIONS_PATH = os.getenv('REGISTRATIONS_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'registrations.bin')
+
+class TTLMap:
+    """Словарь с вытеснением записей, к которым не обращались дольше ttl секунд.
+
+    Значения — объекты со слотом touched. Ключи упорядочены по последнему обращению
+    (при обращении ключ переставляется в конец), поэтому sweep() снимает устаревшие
+    записи с головы и останавливается на первой живой.
+    keep(value) защищает записи, которые нельзя терять (например, с бонусами).
+    """
+    __slots__ = ("ttl", "keep", "_data")
+
+    def __init__(self, ttl, keep=None):
+        self.ttl = ttl
+        self.keep = keep
+        self._data = {}
+
+    def _expired(self, value, now):
+        return now - value.touched > self.ttl and not (self.keep and self.keep(value))
+
+    def get(self, key, default=None):
+        data = self._data
+        value = data.get(key)
+        if value is None:
+            return default
+        now = time.monotonic()
+        if self._expired(value, now):
+            del data[key]
+            return default
+        value.touched = now
+        del data[key]
+        data[key] = value
+        return value
+
+    def setdefault(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = self[key] = factory()
+        return value
+
+    def __setitem__(self, key, value):
+        value.touched = time.monotonic()
+        self._data.pop(key, None)
+        self._data[key] = value
+
+    def __contains__(self, key):
+        value = self._data.get(key)
+        return value is not None and not self._expired(value, time.monotonic())
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def values(self):
+        return self._data.values()
+
+    def sweep(self, now=None) -> int:
+        now = time.monotonic() if now is None else now
+        deadline = now - self.ttl
+        data = self._data
+        stale = []
+        for key, value in data.items():
+            if value.touched > deadline:
+                break
+            stale.append(key)
+        removed = 0
+        for key in stale:
+            value = data.pop(key)
+            if self.keep and self.keep(value):
+                value.touched = now
+                data[key] = value
+            else:
+                removed += 1
+        return removed
+
+class UserRecord:
+    """Всё, что бот держит о пользователе: дневной лимит, бонусы и оперативное состояние диалога."""
+    __slots__ = ("day", "count", "bonus", "referrals", "action", "tokens", "stamp", "admin_target", "lookup", "touched")
+
+    def __init__(self):
+        self.day = 0            # ordinal даты последнего учтённого запроса; 0 — лимиты ещё не заводились
+        self.count = 0
+        self.bonus = 0
+        self.referrals = 0
+        self.action = None
+        self.tokens = -1.0      # корзина лимитера; -1 — ещё не заводилась (полная)
+        self.stamp = 0.0
+        self.admin_target = None
+        self.lookup = None      # ActiveLookup текущего поиска
+        self.touched = 0.0
+
+def _today() -> int:
+    return datetime.now().date().toordinal()
+
+# Запись без бонусов и рефералов, не тронутая больше USER_TTL_SECONDS (30 дней), ничем не
+# отличается от новой: дневной лимит за это время всё равно обнулился бы
+users = TTLMap(USER_TTL_SECONDS, keep=lambda record: record.bonus > 0 or record.referrals > 0)
+# Кто заводил лимиты за последний год; переживает вытеснение записи из users и перезапуск,
+# чтобы вернувшийся пользователь не считался новым по реферальной ссылке.
+# Пустой до прогрева: снимок с диска читается в потоке и сливается с новыми отметками
+registered = registrations.Registrations(REGISTRATIONS_PATH, REGISTRATION_TTL_DAYS)
+last_notify_time = {}
+
+def user_record(user_id: int) -> UserRecord:
+    return users.setdefault(user_id, UserRecord)
+
+def is_registered(user_id: int) -> bool:
+    return user_id in registered
+
+async def load_registrations():
+    global registered
+    loaded = await asyncio.to_thread(registrations.Registrations.load, REGISTRATIONS_PATH, REGISTRATION_TTL_DAYS)
+    loaded.merge(registered)
+    registered = loaded
+
+async def compact_registrations():
+    """Вливает новые регистрации в массивы, снимает устаревшие и пишет снимок — в потоке."""
+    if not registered.loaded or not registered.dirty:
+        return
+    target = registered
+    ids, days, pending = target.snapshot()
+    target.dirty = False
+    try:
+        ids, days = await asyncio.to_thread(target.compacted, ids, days, pending, _today(), target.ttl_days)
+    except BaseException:
+        target.abort()
+        raise
+    target.install(ids, days, pending)
+    await asyncio.to_thread(target.save, target.pack(ids, days))
+
+# ---------- Ограничение частоты (token bucket) ----------
+class Bucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self):
+        self.tokens = -1.0
+        self.stamp = 0.0
+
+global_bucket = Bucket()
+
+def _refill(bucket, rate: float, burst: float, now: float) -> float:
+    # Пополнение за O(1): начисляем всё, что накопилось с прошлого обращения
+    if bucket.tokens < 0:
+        return burst
+    return min(burst, bucket.tokens + (now - bucket.stamp) * rate)
+
+def _wait_for(tokens: float, cost: float, rate: float) -> float:
+    if tokens >= cost:
+        return 0.0
+    return (cost - tokens) / rate if rate > 0 else float("inf")
+
+def acquire_rate_limit(record, action: str) -> float:
+    """Списывает стоимость действия из корзины пользователя и общей корзины.
+
+    Возвращает 0, если запрос разрешён, иначе — через сколько секунд он станет возможен.
+    """
+    now = time.monotonic()
+    cost = ACTION_WEIGHTS.get(action, 1.0)
+    user_rate, user_burst = RATE_LIMITS["user_rate"], RATE_LIMITS["user_burst"]
+    global_rate, global_burst = RATE_LIMITS["global_rate"], RATE_LIMITS["global_burst"]
+    user_tokens = _refill(record, user_rate, user_burst, now)
+    global_tokens = _refill(global_bucket, global_rate, global_burst, now)
+    # Действие дороже ёмкости корзины всё равно можно выполнить с полной корзины
+    wait = max(_wait_for(user_tokens, min(cost, user_burst), user_rate),
+               _wait_for(global_tokens, min(cost, global_burst), global_rate))
+    if wait == 0:
+        user_tokens -= cost
+        global_tokens -= cost
+    record.tokens, record.stamp = max(user_tokens, 0.0), now
+    global_bucket.tokens, global_bucket.stamp = max(global_tokens, 0.0), now
+    return wait
+
+def refund_rate_limit(record, action: str):
+    """Возвращает в корзины стоимость действия, которое после acquire_rate_limit так и не выполнилось."""
+    cost = ACTION_WEIGHTS.get(action, 1.0)
+    # acquire обрезает остаток до нуля, поэтому вернуть больше ёмкости нельзя — корзина была полной
+    record.tokens = min(record.tokens + cost, RATE_LIMITS["user_burst"])
+    global_bucket.tokens = min(global_bucket.tokens + cost, RATE_LIMITS["global_burst"])
+
+def format_wait(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "⏳ Запросы временно приостановлены. Попробуйте позже."
+    seconds = max(1, int(seconds + 0.999))
+    at = datetime.fromtimestamp(time.time() + seconds).strftime('%H:%M:%S')
+    return f"⏳ Слишком часто. Следующий запрос будет доступен через {seconds} с (в {at})."
+
+# ---------- Постраничный вывод ----------
+PAGE_SIZE = 4096
+PAGES_TTL_SECONDS = 30 * 60
+PROXYNOVA_PAGE_SIZE = 10
+
+result_pages = TTLMap(PAGES_TTL_SECONDS)
+
+# ---------- История недавних поисков ----------
+HISTORY_PER_USER = 10
+HISTORY_TTL_SECONDS = 24 * 3600
+HISTORY_MAX_BYTES = int(os.getenv('HISTORY_MAX_BYTES', 16 * 1024 * 1024))
+HISTORY_LABELS = {
+    "nick": "🔍", "tgid": "🆔", "github_user": "🐙", "ip": "🌐", "email": "📧", "domain": "🌍",
+    "phone": "📞", "mnp": "🔄", "tiktok": "🎵", "inn": "🔎", "fio": "👤",
+}
+
+lookup_history = history.LookupHistory(HISTORY_PER_USER, HISTORY_TTL_SECONDS, HISTORY_MAX_BYTES)
+# Куда show_result складывает показанный результат, пока идёт поиск (задаётся в run_lookup)
+lookup_shown = contextvars.ContextVar("lookup_shown", default=None)
+HISTORY_BYTES = metrics.Gauge("bot_history_bytes", "Сжатый объём истории поисков всех пользователей",
+                              function=lambda: lookup_history.bytes)
+
+# ---------- Меню (разметка собирается один раз при старте) ----------
+MENU_TEXT = "Что хотите найти?"
+MENU_TEXT_AGAIN = "Что хотите найти ещё?"
+
+def build_menu_markup(admin: bool = False) -> InlineKeyboardMarkup:
+    keyboard = [
+        [
+            InlineKeyboardButton("🔍 Поиск по нику", callback_data="nick"),
+            InlineKeyboardButton("🆔 Telegram ID", callback_data="tgid"),
+            InlineKeyboardButton("🐙 GitHub", callback_data="github_user"),
+        ],
+        [
+            InlineKeyboardButton("🌐 Поиск по IP", callback_data="ip"),
+            InlineKeyboardButton("📧 Поиск по email", callback_data="email"),
+            InlineKeyboardButton("🌍 Поиск по домену", callback_data="domain"),
+        ],
+        [
+            InlineKeyboardButton("📞 Поиск по номеру", callback_data="phone"),
+            InlineKeyboardButton("🔄 Поиск MNP", callback_data="mnp"),
+            InlineKeyboardButton("🎵 TikTok", callback_data="tiktok"),
+        ],
+        [
+            InlineKeyboardButton("🔎 Поиск по ИНН", callback_data="inn"),
+            InlineKeyboardButton("👤 Поиск по ФИО", callback_data="fio"),
+        ],
+        # Длинная кнопка профиля
+        [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")],
+    ]
+    if admin:
+        keyboard.append([InlineKeyboardButton("🔧 Админ: пополнить запросы", callback_data="admin_add_bonus")])
+    return InlineKeyboardMarkup(keyboard)
+
+def build_profile_markup() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🕘 Недавние поиски", callback_data="hist")],
+        [InlineKeyboardButton("💳 Пополнить запросы", callback_data="buy_requests")],
+        [InlineKeyboardButton("👥 Пригласить друга", callback_data="referral_link")],
+    ])
+
+# ---------- Статические ассеты: баннер по file_id и готовые клавиатуры ----------
+ASSETS_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_FILE_IDS_PATH = os.getenv('ASSET_FILE_IDS_PATH') or os.path.join(ASSETS_DIR, 'data', 'file_ids.json')
+ASSET_SENDS = metrics.Counter("bot_asset_sends_total", "Отправки статических картинок: по file_id или загрузкой", ["asset", "mode"])
+
+static_assets = assets.AssetRegistry(ASSET_FILE_IDS_PATH)
+static_assets.add_file("banner", os.path.join(ASSETS_DIR, "anonimms.jpg"))
+static_assets.add_keyboard("menu", build_menu_markup())
+static_assets.add_keyboard("admin_menu", build_menu_markup(admin=True))
+static_assets.add_keyboard("profile", build_profile_markup())
+
+def menu_markup(user_id: int) -> InlineKeyboardMarkup:
+    return static_assets.keyboard("admin_menu" if user_id == ADMIN_ID else "menu")
+
+class Panel:
+    """Одно сообщение на чат, в котором статус «⏳» заменяется результатом с меню."""
+    __slots__ = ("message_id", "update_id", "touched")
+
+    def __init__(self, message_id, update_id=None):
+        self.message_id = message_id
+        # update_id, в ответ на который панель уже показала меню
+        self.update_id = update_id
+        self.touched = 0.0
+
+chat_panels = TTLMap(PANELS_TTL_SECONDS)
+
+async def sweep_state(context: ContextTypes.DEFAULT_TYPE):
+    for state in (users, chat_panels, result_pages, lookup_history):
+        state.sweep()
+    await compact_registrations()
+
+# ---------- Активные поиски и их отмена ----------
+LOOKUP_DEADLINE_SECONDS = int(os.getenv('LOOKUP_DEADLINE_SECONDS', 90))
+
+class ActiveLookup:
+    """Задача поиска пользователя; отменяется по /cancel, новым запросом или по сроку."""
+    __slots__ = ("action", "task", "deadline", "reason")
+
+    def __init__(self, action):
+        self.action = action
+        self.task = None
+        self.deadline = None    # TimerHandle срока
+        self.reason = None      # почему отменён: cancel, superseded, deadline
+
+    def cancel(self, reason: str):
+        if self.task.done():
+            return
+        self.reason = reason
+        self.task.cancel()
+
+    def finished(self, task):
+        self.deadline.cancel()
+        active_lookups.discard(self)
+
+active_lookups = set()
+
+async def cancel_lookup(state: UserRecord, reason: str) -> bool:
+    lookup = state.lookup
+    if lookup is None or lookup.task.done():
+        return False
+    lookup.cancel(reason)
+    # Ждём, пока задача освободит соединения и поправит своё сообщение — только потом новый ответ в чат
+    await asyncio.wait({lookup.task})
+    return True
+
 # ---------- Отправка уведомлений админу ----------
 def safe_send_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, error_text: str):
+    log.error(error_text, extra={"event": "admin.notify"})
     now = time.time()
     last = last_notify_time.get('admin', 0)
     if now - last > 60:
         last_notify_time['admin'] = now
         try:
-            context.bot.send_message(chat_id=ADMIN_ID, text=f"⚠️ Ошибка в боте:\n{error_text[:500]}")
-        except:
-            pass
+            context.application.create_task(
+                context.bot.send_message(chat_id=ADMIN_ID, text=f"⚠️ Ошибка в боте:\n{error_text[:500]}"))
+        except Exception:
+            log.warning("уведомление админу не отправлено", exc_info=True, extra={"event": "admin.notify_failed"})
 
 def check_and_increment_limit(user_id: int) -> bool:
     if user_id == ADMIN_ID:
         return True
-    today = datetime.now().date().isoformat()
-    data = user_limits.get(user_id)
-    if data is None:
-        user_limits[user_id] = {"date": today, "count": 1, "bonus": 0, "referrals": 0}
+    today = _today()
+    data = user_record(user_id)
+    if data.day == 0:
+        data.day = today
+        data.count = 1
+        registered.mark(user_id, today)
         return True
     else:
-        if data["bonus"] > 0:
-            data["bonus"] -= 1
+        if data.bonus > 0:
+            data.bonus -= 1
             return True
         else:
-            if data["date"] == today:
-                if data["count"] < MAX_REQUESTS_PER_DAY:
-                    data["count"] += 1
+            if data.day == today:
+                if data.count < MAX_REQUESTS_PER_DAY:
+                    data.count += 1
                     return True
                 else:
                     return False
             else:
-                data["date"] = today
-                data["count"] = 1
+                data.day = today
+                data.count = 1
+                registered.mark(user_id, today)
                 return True
 
 # ---------- Вспомогательные функции проверки ----------
-def is_telegram_username(text: str):
-    if text.startswith('@'):
-        return text[1:]
-    return None
-
+# Проверки ввода для выбранного действия; свободный текст разбирает classifier.classify
 def is_ip(text: str):
-    pattern = r'^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$'
-    return re.match(pattern, text) is not None
+    return classifier.is_ip(text)
 
 def is_email(text: str):
-    pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
-    return re.match(pattern, text) is not None
+    return classifier.is_email(text)
 
 def is_phone(text: str):
-    cleaned = re.sub(r'[^\d+]', '', text)
-    if cleaned.startswith('+'):
-        return cleaned[1:].isdigit() and 8 <= len(cleaned[1:]) <= 15
-    else:
-        return cleaned.isdigit() and 8 <= len(cleaned) <= 15
+    return classifier.is_phone(text)
 
 def is_inn(text: str):
-    return text.isdigit() and len(text) in (10, 12)
+    return classifier.inn_checksum_ok(text)
 
 # ---------- Вспомогательная функция форматирования в стиле DAMAGE ----------
 def format_dict_as_damage(data_dict: dict, title: str = None, indent: int = 0) -> str:
@@ -133,94 +522,828 @@ def format_dict_as_damage(data_dict: dict, title: str = None, indent: int = 0) -
             lines.append(f"{'│' * indent}├{key}: {value}")
     return "\n".join(lines)
 
+# ---------- Метрики и общая HTTP-сессия ----------
+LOOKUP_SECONDS = metrics.Histogram("bot_lookup_seconds", "Время обработки поиска от ввода до ответа", ["action"])
+LOOKUPS = metrics.Counter("bot_lookups_total", "Поиски по действию и исходу", ["action", "outcome"])
+LOOKUPS_IN_FLIGHT = metrics.Gauge("bot_lookups_in_flight", "Поиски, выполняющиеся прямо сейчас")
+UPDATE_QUEUE_DEPTH = metrics.Gauge("bot_update_queue_depth", "Апдейты, ожидающие обработки")
+SOURCE_RESULTS = metrics.Counter("source_results_total", "Ответы источников: ok, empty или error", ["source", "status"])
+SOURCE_SECONDS = metrics.Histogram("source_seconds", "Время опроса источника целиком", ["source"])
+SOURCE_ERRORS = metrics.Counter("source_errors_total", "Исключения, перехваченные внутри источников", ["source", "error"])
+UPSTREAM_REQUESTS = metrics.Counter("upstream_requests_total", "HTTP-запросы к внешним API по коду ответа", ["source", "status"])
+UPSTREAM_SECONDS = metrics.Histogram("upstream_request_seconds", "Время HTTP-запроса до получения заголовков", ["source"])
+UPSTREAM_TIMEOUTS = metrics.Counter("upstream_timeouts_total", "Таймауты запросов к внешним API", ["source"])
+LOOKUPS_CANCELLED = metrics.Counter("bot_lookups_cancelled_total", "Прерванные поиски: cancel, superseded или deadline",
+                                    ["action", "reason"])
+CANCEL_SAVED_SECONDS = metrics.Counter("bot_lookup_cancel_saved_seconds_total",
+                                       "Оценка сэкономленного отменой времени поиска (медиана минус прошедшее)", ["action"])
+UPSTREAM_ABORTED = metrics.Counter("upstream_requests_aborted_total", "HTTP-запросы, оборванные отменой поиска", ["source"])
+CACHE_REQUESTS = metrics.Counter("cache_requests_total", "Обращения к кэшам: hit или miss", ["cache", "result"])
+TELEGRAM_SECONDS = metrics.Histogram("telegram_api_seconds", "Время вызова Bot API", ["method"])
+TELEGRAM_REQUESTS = metrics.Counter("telegram_api_requests_total", "Вызовы Bot API по коду ответа", ["method", "status"])
+
+# Источник, от имени которого сейчас идут HTTP-запросы (задаётся timed_source и @upstream)
+current_source = contextvars.ContextVar("current_source", default="other")
+# Поток очереди HTTP-запросов: свой у каждого поиска (задаётся в run_lookup); фоновые задачи делят один
+http_flow = contextvars.ContextVar("http_flow", default=fairqueue.Flow("background", 1.0))
+# Сколько последний запрос задачи ждал слота в очереди: в задержку источника это время не входит
+http_queue_wait = contextvars.ContextVar("http_queue_wait", default=0.0)
+HTTP_QUEUE_SECONDS = metrics.Histogram("upstream_queue_seconds", "Ожидание слота пула соединений в очереди", ["flow"])
+HTTP_QUEUE_DEPTH = metrics.Gauge("upstream_queue_depth", "Запросы, ждущие слота пула соединений")
+
+def record_error(e: BaseException):
+    """Учитывает исключение, которое источник проглатывает и превращает в «нет данных»."""
+    source = current_source.get()
+    SOURCE_ERRORS.inc(source, type(e).__name__)
+    if isinstance(e, asyncio.TimeoutError):
+        UPSTREAM_TIMEOUTS.inc(source)
+
+def upstream(source: str):
+    """Декоратор для функций, которые сами ходят в один источник (не через timed_source)."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = current_source.set(source)
+            started = time.perf_counter()
+            try:
+                with tracing.span(source):
+                    return await func(*args, **kwargs)
+            except Exception as e:
+                record_error(e)
+                raise
+            finally:
+                SOURCE_SECONDS.observe(time.perf_counter() - started, source)
+                current_source.reset(token)
+        return wrapper
+    return decorator
+
+def source_timeout(ceiling: float) -> float:
+    """Таймаут запроса для текущего источника; ceiling — прежняя константа, выше которой он не поднимается."""
+    return timeouts.policy.timeout(current_source.get(), ceiling)
+
+# Запросы, которые не говорят о здоровье внешних API: проверки сотен сайтов Sherlock
+# (таймауты и 5xx мёртвых сайтов — норма) и прогрев соединений
+GOVERNOR_IGNORED_SOURCES = {"Sherlock", "Прогрев"}
+
+async def _on_request_start(session, ctx, params):
+    ctx.source = current_source.get()
+    ctx.started = time.perf_counter()
+    http_queue_wait.set(0.0)
+
+async def _on_request_end(session, ctx, params):
+    elapsed = time.perf_counter() - ctx.started - http_queue_wait.get()
+    UPSTREAM_SECONDS.observe(elapsed, ctx.source)
+    timeouts.policy.observe(ctx.source, elapsed)
+    status = params.response.status
+    if ctx.source not in GOVERNOR_IGNORED_SOURCES:
+        load_governor.record(status < 500 and status != 429)
+    UPSTREAM_REQUESTS.inc(ctx.source, str(params.response.status))
+    jsonlog.sampled(log, "upstream.request", "%s %s", params.method, params.url.host,
+                    source=ctx.source, status=status, ms=round(elapsed * 1000, 1))
+
+async def _on_request_exception(session, ctx, params):
+    if isinstance(params.exception, asyncio.CancelledError):
+        # Соединение закрывается вместе с отменённой задачей; это не ошибка источника
+        UPSTREAM_ABORTED.inc(ctx.source)
+        return
+    status = "timeout" if isinstance(params.exception, asyncio.TimeoutError) else "error"
+    UPSTREAM_REQUESTS.inc(ctx.source, status)
+    jsonlog.sampled(log, "upstream.request", "%s %s: %r", params.method, params.url.host, params.exception,
+                    source=ctx.source, status=status)
+    if ctx.source not in GOVERNOR_IGNORED_SOURCES:
+        load_governor.record(False)
+    if status == "timeout":
+        # Таймаут — нижняя оценка настоящей задержки; без неё окно помнило бы только быстрые ответы
+        timeouts.policy.observe(ctx.source, time.perf_counter() - ctx.started - http_queue_wait.get())
+
+class OverrideRequest(aiohttp.ClientRequest):
+    """Переписывает https://host/path?query в {UPSTREAM_OVERRIDE}/host/path?query."""
+
+    def __init__(self, method, url, *args, **kwargs):
+        url = URL(f"{UPSTREAM_OVERRIDE.rstrip('/')}/{url.host}{url.raw_path_qs}", encoded=True)
+        super().__init__(method, url, *args, **kwargs)
+
+HTTP_POOL_LIMIT = 100
+http_scheduler = fairqueue.FairScheduler(HTTP_POOL_LIMIT)
+
+class FairConnector(aiohttp.TCPConnector):
+    """TCPConnector, выдающий слоты пула через http_scheduler — по весу поиска, а не в порядке прихода."""
+
+    async def connect(self, req, traces, timeout):
+        flow = http_flow.get()
+        started = time.perf_counter()
+        HTTP_QUEUE_DEPTH.inc()
+        waited = None
+        try:
+            # 0.0, если слот выдан сразу: время самого вызова ожиданием не считается
+            waited = await http_scheduler.acquire(flow)
+        finally:
+            HTTP_QUEUE_DEPTH.dec()
+            if waited is None:
+                # Отменён или упёрся в таймаут, стоя в очереди: ждал всё это время
+                waited = time.perf_counter() - started
+            # Редиректы берут слот заново: ожидание копится за весь запрос
+            http_queue_wait.set(http_queue_wait.get() + waited)
+            tracing.pool_wait(waited)
+        HTTP_QUEUE_SECONDS.observe(waited, flow.name)
+        try:
+            conn = await super().connect(req, traces, timeout)
+        except BaseException:
+            http_scheduler.release()
+            raise
+        # Слот возвращается, когда соединение отпущено: тело прочитано или ответ закрыт
+        conn.add_callback(http_scheduler.release)
+        return conn
+
+_http_session = None
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Одна сессия на процесс: пул соединений и DNS-кэш общие для всех поисков."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(_on_request_start)
+        trace_config.on_request_end.append(_on_request_end)
+        trace_config.on_request_exception.append(_on_request_exception)
+        _http_session = aiohttp.ClientSession(
+            connector=FairConnector(limit=HTTP_POOL_LIMIT, ttl_dns_cache=300),
+            # куки сайтов не должны переходить из поиска одного пользователя в поиск другого
+            cookie_jar=aiohttp.DummyCookieJar(),
+            trace_configs=[trace_config, tracing.trace_config()],
+            request_class=OverrideRequest if UPSTREAM_OVERRIDE else aiohttp.ClientRequest,
+        )
+    return _http_session
+
+@contextlib.asynccontextmanager
+async def http_session():
+    # Общая сессия не закрывается на выходе из блока — её закрывает post_shutdown
+    yield get_http_session()
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, замеряющий время и коды ответов каждого метода Bot API."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        status = "error"
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            status = str(code)
+            return code, payload
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, endpoint)
+            TELEGRAM_REQUESTS.inc(endpoint, status)
+
+# ---------- Регулятор нагрузки ----------
+load_governor = governor.LoadGovernor()
+# Уровень обслуживания, с которым выполняется текущий поиск (задаётся в handle_input)
+lookup_tier = contextvars.ContextVar("lookup_tier", default=governor.FULL)
+DEGRADED_LOOKUPS = metrics.Counter("bot_degraded_lookups_total", "Поиски, выполненные в урезанном виде", ["action", "tier"])
+
+# Источники, которые на reduced пропускаются, пока по ним мало статистики;
+# дальше решает доля ответов с данными из SOURCE_RESULTS
+LOW_YIELD_SOURCES = {"Imgur", "Bitmoji", "Twitter", "Instagram", "Duolingo", "ProtonMail",
+                     "AbstractAPI (репутация)", "phoneradar.ru"}
+REDUCED_MIN_YIELD = 0.1
+YIELD_MIN_SAMPLES = 20
+# На essential без внешних API этим действиям показать нечего
+NETWORK_ONLY_ACTIONS = {"ip", "github_user", "domain", "mnp", "tiktok", "inn"}
+DEGRADED_NOTICE = {
+    governor.REDUCED: "⚠️ Бот под нагрузкой: результат сокращён, часть источников не опрашивалась.",
+    governor.ESSENTIAL: "⚠️ Бот перегружен: показаны только локальные данные, внешние источники не опрашивались.",
+}
+
+def skip_when_reduced(source: str) -> bool:
+    ok, empty, error = (SOURCE_RESULTS.value(source, status) for status in ("ok", "empty", "error"))
+    total = ok + empty + error
+    if total < YIELD_MIN_SAMPLES:
+        return source in LOW_YIELD_SOURCES
+    return ok / total < REDUCED_MIN_YIELD
+
+async def govern_load(context: ContextTypes.DEFAULT_TYPE):
+    watchdog = context.bot_data.get("loop_watchdog")
+    lag = watchdog.recent_lag if watchdog is not None else 0.0
+    load_governor.evaluate(context.application.update_queue.qsize(), lag)
+
+# ---------- Модель результата (рендер в DAMAGE — только при отправке) ----------
+@dataclass(slots=True)
+class Section:
+    title: Optional[str]
+    items: dict = field(default_factory=dict)
+
+    def render(self) -> str:
+        return format_dict_as_damage(self.items, title=self.title).lstrip("\n")
+
+@dataclass(slots=True)
+class SourceResult:
+    source: str
+    sections: list = field(default_factory=list)
+    elapsed: float = 0.0
+    fetched_at: float = 0.0
+    error: Optional[str] = None
+
+async def timed_source(source: str, coro, formatter=None) -> SourceResult:
+    """Выполняет запрос к источнику и упаковывает ответ в SourceResult с временем выполнения."""
+    fetched_at = time.time()
+    started = time.perf_counter()
+    error = None
+    token = current_source.set(source)
+    try:
+        with tracing.span(source) as span:
+            data = await coro
+    except Exception as e:
+        record_error(e)
+        data, error = None, str(e) or type(e).__name__
+    finally:
+        current_source.reset(token)
+    if isinstance(data, dict) and "error" in data and isinstance(data["error"], str):
+        error = data["error"]
+    section = formatter(data) if formatter is not None and error is None else data
+    sections = [section] if isinstance(section, Section) else []
+    elapsed = time.perf_counter() - started
+    SOURCE_SECONDS.observe(elapsed, source)
+    status = "error" if error else "ok" if sections else "empty"
+    SOURCE_RESULTS.inc(source, status)
+    if error:
+        log.info("источник %s: %s", source, error, extra={"event": "source.error", "source": source,
+                                                          "ms": round(elapsed * 1000, 1)})
+    else:
+        jsonlog.sampled(log, "source.result", "источник %s: %s", source, status,
+                        source=source, status=status, ms=round(elapsed * 1000, 1))
+    if span is not None:
+        span.attrs["status"] = status
+    return SourceResult(source, sections, elapsed, fetched_at, error)
+
+def render_results(results, title: str = None) -> str:
+    parts = [title] if title else []
+    for result in results:
+        parts.extend(section.render() for section in result.sections)
+    return "\n\n".join(parts)
+
+def pack_results(results) -> bytes:
+    """Компактная сериализация для кэша: JSON без пробелов + zlib."""
+    payload = [[r.source, round(r.elapsed, 3), int(r.fetched_at), r.error,
+                [[s.title, s.items] for s in r.sections]] for r in results]
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode())
+
+def unpack_results(blob: bytes) -> list:
+    return [SourceResult(source, [Section(title, items) for title, items in sections], elapsed, fetched_at, error)
+            for source, elapsed, fetched_at, error, sections in json.loads(zlib.decompress(blob))]
+
+# ---------- Разбиение результата на страницы ----------
+class PagedResult:
+    """Результат для листания ◀/▶, хранится упакованным.
+
+    Список SourceResult лежит в blob через pack_results, остальное — сжатым текстом;
+    страница заново рендерится из blob при нажатии. more() догружает следующие
+    страницы с источника, они копятся в extra.
+    """
+    __slots__ = ("blob", "packed", "title", "notice", "count", "extra", "parse_mode", "disable_preview", "more",
+                 "user_id", "touched")
+
+    def __init__(self, blob, packed, count, title=None, notice=None, parse_mode=None, disable_preview=None,
+                 more=None, user_id=None):
+        self.blob = blob
+        self.packed = packed
+        self.count = count          # страниц в самом результате, без догруженных
+        self.title = title
+        self.notice = notice
+        self.extra = []
+        self.parse_mode = parse_mode
+        self.disable_preview = disable_preview
+        self.more = more
+        self.user_id = user_id
+        self.touched = 0.0
+
+    @classmethod
+    def pack(cls, result, text: str, count: int, title=None, **kwargs):
+        """text — уже отрисованный result; модель хранится, только если из неё выходит тот же текст."""
+        if not isinstance(result, (str, Section)):
+            blob = pack_results(result)
+            # Значения, которые JSON не сохраняет как есть (кортежи, множества), рендерились бы иначе
+            if render_results(unpack_results(blob), title) == text:
+                return cls(blob, True, count, title, **kwargs)
+        return cls(zlib.compress(text.encode()), False, count, title, **kwargs)
+
+    @property
+    def total(self) -> int:
+        return self.count + len(self.extra)
+
+    def page(self, index: int) -> str:
+        if index >= self.count:
+            return self.extra[index - self.count]
+        if self.packed:
+            text = render_results(unpack_results(self.blob), self.title)
+        else:
+            text = zlib.decompress(self.blob).decode()
+        if self.notice:
+            text = f"{self.notice}\n\n{text}"
+        return split_into_pages(text)[index]
+
+def _split_long_section(section: str, limit: int) -> list:
+    chunks = []
+    current = ""
+    for line in section.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = line
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_into_pages(text: str, limit: int = PAGE_SIZE) -> list:
+    # Режем по границам секций (пустая строка), длинные секции — по строкам
+    pages = []
+    current = ""
+    for section in text.split("\n\n"):
+        section = section.strip("\n")
+        if not section:
+            continue
+        chunks = [section] if len(section) <= limit else _split_long_section(section, limit)
+        for chunk in chunks:
+            candidate = f"{current}\n\n{chunk}" if current else chunk
+            if len(candidate) <= limit:
+                current = candidate
+            else:
+                pages.append(current)
+                current = chunk
+    if current:
+        pages.append(current)
+    return pages or [text[:limit] or "❌ Информация не найдена"]
+
+def page_keyboard(token, index: int, paged: PagedResult) -> InlineKeyboardMarkup:
+    rows = []
+    total = paged.total
+    if total > 1 or paged.more:
+        row = []
+        if index > 0:
+            row.append(InlineKeyboardButton("◀", callback_data=f"pg:{token}:{index - 1}"))
+        row.append(InlineKeyboardButton(f"{index + 1}/{total}{'+' if paged.more else ''}", callback_data="pg:noop"))
+        if index < total - 1 or paged.more:
+            row.append(InlineKeyboardButton("▶", callback_data=f"pg:{token}:{index + 1}"))
+        rows.append(row)
+    if paged.user_id is not None:
+        rows.extend(menu_markup(paged.user_id).inline_keyboard)
+    return InlineKeyboardMarkup(rows)
+
+async def show_status(update: Update, text: str):
+    """Отправляет статус «⏳ …»; это сообщение становится панелью чата и потом заменяется результатом."""
+    message = await update.effective_message.reply_text(text)
+    chat_panels[update.effective_chat.id] = Panel(message.message_id)
+    return message
+
+def render(result, title: str = None) -> str:
+    if isinstance(result, str):
+        return result
+    if isinstance(result, Section):
+        return result.render()
+    return render_results(result, title)
+
+async def show_result(update: Update, result, parse_mode=None, disable_web_page_preview=None, more=None, title=None,
+                      notice=None):
+    """Показывает первую страницу результата вместе с меню.
+
+    result — текст, Section или список SourceResult; в текст он превращается только здесь.
+    notice — строка над результатом (например, что он урезан из-за нагрузки).
+    Если в чате есть панель со статусом — она редактируется, иначе отправляется одно новое сообщение.
+    Остальные страницы листаются кнопками ◀/▶ в том же сообщении.
+    """
+    chat_id = update.effective_chat.id
+    rendered = render(result, title)
+    text = f"{notice}\n\n{rendered}" if notice else rendered
+    shown = lookup_shown.get()
+    if shown is not None:
+        shown.append((text, parse_mode, disable_web_page_preview))
+    pages = split_into_pages(text)
+    token = None
+    if len(pages) > 1 or more is not None:
+        # В кэше страниц — упакованная модель, а не готовые страницы
+        paged = PagedResult.pack(result, rendered, len(pages), title, notice=notice, parse_mode=parse_mode,
+                                 disable_preview=disable_web_page_preview, more=more, user_id=update.effective_user.id)
+        token = secrets.token_urlsafe(6)
+        result_pages[token] = paged
+    else:
+        paged = PagedResult(None, False, 1, user_id=update.effective_user.id)
+    reply_markup = page_keyboard(token, 0, paged)
+
+    panel = chat_panels.get(chat_id)
+    if panel and panel.update_id is None:
+        try:
+            await update.get_bot().edit_message_text(
+                pages[0], chat_id=chat_id, message_id=panel.message_id, parse_mode=parse_mode,
+                disable_web_page_preview=disable_web_page_preview, reply_markup=reply_markup)
+            panel.update_id = update.update_id
+            return
+        except Exception as e:
+            # Панель удалена или текст не изменился — отвечаем новым сообщением
+            log.debug("панель не отредактирована: %r", e, extra={"event": "panel.edit_failed"})
+    message = await update.effective_message.reply_text(pages[0], parse_mode=parse_mode,
+                                                        disable_web_page_preview=disable_web_page_preview,
+                                                        reply_markup=reply_markup)
+    chat_panels[chat_id] = Panel(message.message_id, update.update_id)
+
+async def page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    parts = query.data.split(":")
+    if len(parts) != 3 or not parts[2].isdigit():
+        await query.answer()
+        return
+    token, index = parts[1], int(parts[2])
+    paged = result_pages.get(token)
+    CACHE_REQUESTS.inc("pages", "miss" if paged is None else "hit")
+    if paged is None:
+        await query.answer("⌛ Результат устарел, повторите поиск.", show_alert=True)
+        return
+
+    if index >= paged.total and paged.more:
+        # Следующая страница источника запрашивается только по нажатию ▶
+        try:
+            text, paged.more = await paged.more()
+        except Exception:
+            log.warning("не удалось догрузить страницу", exc_info=True, extra={"event": "pages.more_failed"})
+            text = None
+        if text:
+            paged.extra.extend(split_into_pages(text))
+    if index >= paged.total:
+        await query.answer("Больше данных нет.")
+        index = paged.total - 1
+    else:
+        await query.answer()
+
+    try:
+        await query.edit_message_text(paged.page(index), parse_mode=paged.parse_mode,
+                                      disable_web_page_preview=paged.disable_preview,
+                                      reply_markup=page_keyboard(token, index, paged))
+    except Exception as e:
+        log.debug("страница не показана: %r", e, extra={"event": "pages.edit_failed"})
+
+def history_markup(entries) -> InlineKeyboardMarkup:
+    now = time.time()
+    rows = []
+    for entry in entries:
+        minutes = int((now - entry.created) // 60)
+        age = f"{minutes} мин" if minutes < 60 else f"{minutes // 60} ч"
+        query = entry.query if len(entry.query) <= 32 else entry.query[:31] + "…"
+        rows.append([InlineKeyboardButton(f"{HISTORY_LABELS.get(entry.action, '•')} {query} · {age}",
+                                          callback_data=f"hist:{entry.id}")])
+    return InlineKeyboardMarkup(rows)
+
+async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Список недавних поисков (hist) и показ одного из них (hist:<id>) — без источников и без лимита."""
+    query = update.callback_query
+    user_id = query.from_user.id
+    _, _, entry_id = query.data.partition(":")
+    if not entry_id:
+        await query.answer()
+        entries = lookup_history.recent(user_id)
+        if not entries:
+            await query.message.reply_text(f"🕘 Недавних поисков нет. Результаты хранятся {HISTORY_TTL_SECONDS // 3600} ч.")
+            return
+        await query.message.reply_text("🕘 Недавние поиски — открываются без нового запроса и без списания лимита:",
+                                       reply_markup=history_markup(entries))
+        return
+    entry = lookup_history.get(user_id, int(entry_id)) if entry_id.isdigit() else None
+    CACHE_REQUESTS.inc("history", "miss" if entry is None else "hit")
+    if entry is None:
+        await query.answer("⌛ Запись устарела, повторите поиск.", show_alert=True)
+        return
+    await query.answer()
+    at = datetime.fromtimestamp(entry.created).strftime('%H:%M')
+    await show_result(update, entry.text(), parse_mode=entry.parse_mode, disable_web_page_preview=entry.disable_preview,
+                      notice=f"🕘 Из истории, поиск в {at}")
+
 # ---------- Поиск по нику (соцсети) – улучшенная версия из Sherlock ----------
-async def check_social_media(nick: str):
-    fallback_sites = {
-        "Twitter": f"https://twitter.com/{nick}",
-        "Instagram": f"https://instagram.com/{nick}",
-        "TikTok": f"https://tiktok.com/@{nick}",
-        "GitHub": f"https://github.com/{nick}",
-        "Reddit": f"https://reddit.com/user/{nick}",
-        "Pinterest": f"https://pinterest.com/{nick}",
-        "Twitch": f"https://twitch.tv/{nick}",
-        "YouTube": f"https://youtube.com/@{nick}",
-        "Facebook": f"https://facebook.com/{nick}",
-        "Telegram": f"https://t.me/{nick}",
-        "VK": f"https://vk.com/{nick}",
-        "Snapchat": f"https://snapchat.com/add/{nick}",
-        "Tumblr": f"https://{nick}.tumblr.com",
-        "Steam": f"https://steamcommunity.com/id/{nick}",
-    }
+SHERLOCK_URL = "https://raw.githubusercontent.com/sherlock-project/sherlock/master/sherlock_project/resources/data.json"
+
+# Манифест — отдельный источник: у raw.githubusercontent.com своя задержка, не как у HEAD по сайтам
+@upstream("Sherlock manifest")
+async def load_sherlock_manifest():
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+    async with http_session() as session:
+        async with session.get(SHERLOCK_URL, headers=headers, timeout=source_timeout(10)) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.json()
+    data.pop('$schema', None)
+    return data
+
+SHERLOCK_MANIFEST_TTL_SECONDS = 3600
+_sherlock_manifest = None       # (time.monotonic() загрузки, манифест)
+_sherlock_manifest_task = None
+
+async def sherlock_manifest():
+    """Манифест из кэша; при промахе все поиски ждут одну общую загрузку.
+
+    Загрузка ждётся через asyncio.shield: отмена одного поиска не обрывает её для остальных,
+    а если отменились все — манифест всё равно докачается в кэш.
+    """
+    global _sherlock_manifest_task
+    if _sherlock_manifest is not None and time.monotonic() - _sherlock_manifest[0] < SHERLOCK_MANIFEST_TTL_SECONDS:
+        CACHE_REQUESTS.inc("sherlock_manifest", "hit")
+        return _sherlock_manifest[1]
+    if _sherlock_manifest_task is None:
+        CACHE_REQUESTS.inc("sherlock_manifest", "miss")
+        _sherlock_manifest_task = asyncio.ensure_future(_refresh_sherlock_manifest())
+    else:
+        CACHE_REQUESTS.inc("sherlock_manifest", "joined")
+    return await asyncio.shield(_sherlock_manifest_task)
 
-    sherlock_url = "https://raw.githubusercontent.com/sherlock-project/sherlock/master/sherlock_project/resources/data.json"
-    sites = {}
+async def _refresh_sherlock_manifest():
+    global _sherlock_manifest, _sherlock_manifest_task
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(sherlock_url, headers=headers, timeout=10) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    data.pop('$schema', None)
-                    for site_name, site_info in data.items():
-                        url_template = site_info.get('url')
-                        if url_template:
-                            url = url_template.replace('{}', nick)
-                            sites[site_name] = url
-                else:
-                    sites = fallback_sites
+        data = await load_sherlock_manifest()
     except Exception:
-        sites = fallback_sites
+        data = None     # уже учтено в @upstream
+    finally:
+        _sherlock_manifest_task = None
+    if data is not None:
+        _sherlock_manifest = (time.monotonic(), data)
+    elif _sherlock_manifest is not None:
+        # Лучше устаревший манифест, чем запасной список из 14 сайтов
+        data = _sherlock_manifest[1]
+    return data
+
+# Популярные сайты: запасной список без манифеста и первые кандидаты при урезанной проверке
+POPULAR_SITES = {
+    "Twitter": "https://twitter.com/{}",
+    "Instagram": "https://instagram.com/{}",
+    "TikTok": "https://tiktok.com/@{}",
+    "GitHub": "https://github.com/{}",
+    "Reddit": "https://reddit.com/user/{}",
+    "Pinterest": "https://pinterest.com/{}",
+    "Twitch": "https://twitch.tv/{}",
+    "YouTube": "https://youtube.com/@{}",
+    "Facebook": "https://facebook.com/{}",
+    "Telegram": "https://t.me/{}",
+    "VK": "https://vk.com/{}",
+    "Snapchat": "https://snapchat.com/add/{}",
+    "Tumblr": "https://{}.tumblr.com",
+    "Steam": "https://steamcommunity.com/id/{}",
+}
+NICK_SITES_REDUCED = 100
+# Одновременных проверок сайтов в одном скане; остальное пулу соединений делит http_scheduler
+NICK_PROBE_CONCURRENCY = 16
+# Таймаут проверки не засчитывается сайту, если больше этой доли срока ушло на очередь к пулу
+PROBE_QUEUE_WAIT_SHARE = 0.5
+NICK_SITES_SKIPPED = metrics.Counter("nick_sites_skipped_total", "Сайты, пропущенные из-за карантина или ложных «найден»")
+SITE_CONTROLS = metrics.Counter("nick_site_controls_total", "Контрольные проверки сайтов случайным ником", ["result"])
+SITE_STATS_PATH = os.getenv('SITE_STATS_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'site_stats.json')
+SITE_STATS_SAVE_SECONDS = 300
+SITE_CONTROL_INTERVAL_SECONDS = int(os.getenv('SITE_CONTROL_INTERVAL_SECONDS', 600))
+SITE_CONTROLS_PER_RUN = 20
+# Пустой до прогрева, как и индекс username: файл читается в потоке и сливается с новыми замерами
+site_reliability = sitestats.SiteReliability(SITE_STATS_PATH)
+NICK_PROBES = metrics.Counter("nick_probes_total", "Проверки сайтов при поиске по нику", ["method", "kind"])
+NICK_SCAN_SAVED_REQUESTS = metrics.Histogram("nick_scan_requests_saved", "Запросов за поиск по нику, отсечённых regexCheck",
+                                             buckets=(0, 5, 10, 25, 50, 100, 200, 400))
+NICK_SCAN_SAVED_BYTES = metrics.Histogram("nick_scan_bytes_saved", "Байт за поиск по нику, не прочитанных благодаря HEAD "
+                                          "и раннему выходу (по Content-Length)",
+                                          buckets=(0, 2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26))
+NICK_SCAN_BYTES_READ = metrics.Histogram("nick_scan_bytes_read", "Байт тел ответов, прочитанных за поиск по нику",
+                                         buckets=(0, 2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26))
+
+def popular_profile_links(nick: str) -> dict:
+    return {name: url.replace('{}', nick) for name, url in POPULAR_SITES.items()}
+
+@upstream("Sherlock")
+async def check_social_media(nick: str):
+    fallback_sites = popular_profile_links(nick)
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
 
-    found = []
-    async with aiohttp.ClientSession() as session:
-        for name, url in sites.items():
-            try:
-                async with session.head(url, headers=headers, allow_redirects=True, timeout=5) as resp:
-                    if resp.status == 200:
-                        found.append((name, url))
-            except Exception:
-                continue
+    stats = probes.ScanStats()
+    data = await sherlock_manifest()
+    if data is not None:
+        plan = probes.plan(data, nick, stats)
+    else:
+        plan = probes.plain_probes(fallback_sites)
+    # Надёжные и быстрые сайты — первыми; карантин и сайты, находящие любой ник, — не проверяем
+    by_name = {probe.name: probe for probe in plan}
+    usable, skipped = site_reliability.order(by_name)
+    plan = [by_name[name] for name in usable]
+    if skipped:
+        NICK_SITES_SKIPPED.inc(amount=len(skipped))
+    if lookup_tier.get() >= governor.REDUCED and len(plan) > NICK_SITES_REDUCED:
+        # Под нагрузкой проверяем сначала популярные сайты, остальные — до лимита
+        popular = [probe for probe in plan if probe.name in POPULAR_SITES]
+        plan = (popular + [probe for probe in plan if probe.name not in POPULAR_SITES])[:NICK_SITES_REDUCED]
+
+    outcomes = [None] * len(plan)
+    pending = iter(enumerate(plan))
+
+    async def worker(session):
+        for i, probe in pending:
+            NICK_PROBES.inc(probe.method, probe.kind)
+            outcomes[i] = await probe_site(session, probe, stats, headers)
+
+    try:
+        async with http_session() as session:
+            await asyncio.gather(*(worker(session) for _ in range(min(NICK_PROBE_CONCURRENCY, len(plan)))))
+        # Порядок ответа — порядок плана, а не завершения проверок
+        found = [(probe.name, probe.url) for probe, outcome in zip(plan, outcomes) if outcome == probes.FOUND]
+    finally:
+        NICK_SCAN_SAVED_REQUESTS.observe(stats.skipped_regex)
+        NICK_SCAN_SAVED_BYTES.observe(stats.bytes_saved)
+        NICK_SCAN_BYTES_READ.observe(stats.bytes_read)
     return found
 
+async def probe_site(session, probe, stats, headers) -> str:
+    """Проверка одного сайта с записью исхода и задержки в статистику надёжности."""
+    started = time.perf_counter()
+    timeout = source_timeout(5)
+    try:
+        outcome = await probes.run_probe(session, probe, stats, headers=headers, timeout=timeout)
+    except Exception as e:
+        record_error(e)
+        outcome = sitestats.TIMEOUT if isinstance(e, asyncio.TimeoutError) else sitestats.ERROR
+    waited = http_queue_wait.get()
+    elapsed = time.perf_counter() - started - waited
+    jsonlog.sampled(log, "nick.probe", "сайт %s: %s", probe.name, outcome,
+                    site=probe.name, outcome=outcome, ms=round(elapsed * 1000, 1))
+    if outcome == sitestats.TIMEOUT and waited > PROBE_QUEUE_WAIT_SHARE * timeout:
+        # Срок съела наша же очередь к пулу соединений — сайт тут ни при чём
+        return outcome
+    site_reliability.record(probe.name, outcome, elapsed)
+    return outcome
+
+def control_nick() -> str:
+    # Строчные латинские буквы проходят regexCheck почти всех сайтов; такого ника ни у кого нет
+    return "".join(secrets.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(14))
+
+async def control_probe_sites(context: ContextTypes.DEFAULT_TYPE = None):
+    """Проверяет часть сайтов случайным ником: «найден» на нём — ложное срабатывание сайта."""
+    if load_governor.tier != governor.FULL or not site_reliability.loaded:
+        return
+    data = await sherlock_manifest()
+    if data is None:
+        return
+    nick = control_nick()
+    plan = {probe.name: probe for probe in probes.plan(data, nick)}
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+    stats = probes.ScanStats()
+    token = current_source.set("Sherlock")
+    try:
+        async with http_session() as session:
+            for name in site_reliability.control_candidates(plan, SITE_CONTROLS_PER_RUN):
+                outcome = await probe_site(session, plan[name], stats, headers)
+                if outcome in (probes.FOUND, probes.ABSENT):
+                    site_reliability.record_control(name, outcome == probes.FOUND)
+                    SITE_CONTROLS.inc(outcome)
+    finally:
+        current_source.reset(token)
+
+async def load_site_reliability():
+    global site_reliability
+    loaded = await asyncio.to_thread(sitestats.SiteReliability.load, SITE_STATS_PATH)
+    loaded.merge(site_reliability)
+    site_reliability = loaded
+
+async def save_site_reliability(context: ContextTypes.DEFAULT_TYPE = None):
+    if site_reliability.loaded and site_reliability.dirty:
+        await asyncio.to_thread(site_reliability.save, site_reliability.serialize())
+
 # ---------- Получение Telegram ID ----------
+USERNAME_INDEX_PATH = os.getenv('USERNAME_INDEX_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'usernames.idx')
+USERNAME_INDEX_SAVE_SECONDS = 60
+# Пустой до прогрева: снимок с диска читается в потоке и сливается с тем, что успели собрать апдейты
+username_index = userindex.UsernameIndex(USERNAME_INDEX_PATH)
+resolved_usernames = userindex.ResolveCache()
+
+def index_users(update: Update):
+    """Все пары (id, username), которые видны в апдейте: отправитель, пересланное, ответ, публичный чат."""
+    user = update.effective_user
+    if user is not None:
+        username_index.observe(user.id, user.username)
+    message = update.effective_message
+    if message is not None:
+        for other in (message.forward_from, message.reply_to_message and message.reply_to_message.from_user):
+            if other is not None:
+                username_index.observe(other.id, other.username)
+    chat = update.effective_chat
+    if chat is not None and chat.type != chat.PRIVATE and chat.username:
+        username_index.observe(chat.id, chat.username)
+
+async def observe_update(update: object, context: ContextTypes.DEFAULT_TYPE):
+    mark_first_update()
+    if isinstance(update, Update):
+        index_users(update)
+
+async def load_username_index():
+    global username_index
+    loaded = await asyncio.to_thread(userindex.UsernameIndex.load, USERNAME_INDEX_PATH)
+    loaded.merge(username_index)
+    username_index = loaded
+
+async def save_username_index(context: ContextTypes.DEFAULT_TYPE = None):
+    if username_index.loaded and username_index.dirty:
+        await asyncio.to_thread(username_index.save, username_index.serialize())
+
 async def get_telegram_id(username: str, context: ContextTypes.DEFAULT_TYPE):
+    # Сначала индекс из апдейтов, потом кэш ответов get_chat и только затем Bot API
+    user_id = username_index.lookup(username)
+    CACHE_REQUESTS.inc("username_index", "miss" if user_id is None else "hit")
+    if user_id is not None:
+        return user_id, None
+    known, user_id = resolved_usernames.get(username)
+    CACHE_REQUESTS.inc("get_chat", "hit" if known else "miss")
+    if known:
+        return (user_id, None) if user_id is not None else (None, "Chat not found")
     try:
         chat = await context.bot.get_chat(chat_id=f"@{username}")
-        return chat.id, None
+    except BadRequest as e:
+        # «Chat not found» — окончательный ответ, его тоже запоминаем
+        resolved_usernames.put(username, None)
+        return None, str(e)
     except Exception as e:
         return None, str(e)
+    resolved_usernames.put(username, chat.id)
+    if chat.username:
+        username_index.observe(chat.id, chat.username)
+    return chat.id, None
+
+def username_index_report() -> str:
+    index_hits = CACHE_REQUESTS.value("username_index", "hit")
+    index_total = index_hits + CACHE_REQUESTS.value("username_index", "miss")
+    cache_hits = CACHE_REQUESTS.value("get_chat", "hit")
+    cache_total = cache_hits + CACHE_REQUESTS.value("get_chat", "miss")
+    lines = [f"Записей: {len(username_index)}, смен username: {username_index.renames}"]
+    if index_total:
+        lines.append(f"Попаданий в индекс: {index_hits:.0f} из {index_total:.0f} ({index_hits / index_total:.0%})")
+        lines.append(f"Без get_chat: {index_hits + cache_hits:.0f} из {index_total:.0f} "
+                     f"({(index_hits + cache_hits) / index_total:.0%}), кэш get_chat: {cache_hits:.0f} из {cache_total:.0f}")
+    else:
+        lines.append("Поисков по @username пока не было.")
+    return "\n".join(lines)
 
 # ---------- Поиск по GitHub ----------
+# Ответы GitHub кэшируются с ETag/Last-Modified: повторный запрос уходит условным, а 304 не тратит лимит
+github_cache = httpcache.ConditionalCache()
+GITHUB_RATELIMIT_REMAINING = metrics.Gauge("github_ratelimit_remaining", "Остаток лимита запросов GitHub API", ["resource"])
+GITHUB_RATELIMIT_LIMIT = metrics.Gauge("github_ratelimit_limit", "Лимит запросов GitHub API на окно", ["resource"])
+GITHUB_RATELIMIT_RESET = metrics.Gauge("github_ratelimit_reset_seconds", "Секунд до сброса лимита GitHub API", ["resource"])
+
+def record_github_ratelimit(headers):
+    remaining = headers.get("X-RateLimit-Remaining")
+    if remaining is None:
+        return
+    resource = headers.get("X-RateLimit-Resource", "core")
+    with contextlib.suppress(ValueError):
+        GITHUB_RATELIMIT_REMAINING.set(int(remaining), resource)
+        GITHUB_RATELIMIT_LIMIT.set(int(headers.get("X-RateLimit-Limit", 0)), resource)
+        GITHUB_RATELIMIT_RESET.set(max(0, int(headers.get("X-RateLimit-Reset", 0)) - int(time.time())), resource)
+
+async def github_get(session, url: str, headers: dict = None) -> httpcache.CachedResponse:
+    resp = await github_cache.get(session, url, headers, timeout=source_timeout(10))
+    CACHE_REQUESTS.inc("github", resp.cache)
+    record_github_ratelimit(resp.headers)
+    return resp
+
+@upstream("GitHub")
 async def github_find_info_by_username(username: str):
     result = {}
-    output_lines = []
 
     url = f'https://api.github.com/users/{username}'
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                fields = ['login', 'id', 'avatar_url', 'name', 'blog', 'location',
-                          'twitter_username', 'company', 'bio',
-                          'public_repos', 'followers', 'following', 'created_at', 'updated_at']
-                for f in fields:
-                    if data.get(f):
-                        result[f] = data[f]
-                result['public_gists'] = f'https://gist.github.com/{username}'
-            else:
-                return None, "Пользователь не найден или ошибка API"
-
     gpg_url = f'https://github.com/{username}.gpg'
     ssh_url = f'https://github.com/{username}.keys'
-    async with aiohttp.ClientSession() as session:
-        async with session.get(gpg_url) as resp:
-            if resp.status == 200:
-                gpg_text = await resp.text()
-                if "hasn't uploaded any GPG keys" not in gpg_text:
-                    result['GPG_keys'] = gpg_url
-        async with session.get(ssh_url) as resp:
-            if resp.status == 200 and await resp.text():
-                result['SSH_keys'] = ssh_url
+    async with http_session() as session:
+        # Все три запроса сразу: ключи не зависят от ответа API
+        profile, gpg, ssh = await asyncio.gather(
+            github_get(session, url), github_get(session, gpg_url), github_get(session, ssh_url),
+            return_exceptions=True)
+    if isinstance(profile, BaseException):
+        raise profile
+    if profile.status != 200:
+        return None, "Пользователь не найден или ошибка API"
+    data = json.loads(profile.body)
+    fields = ['login', 'id', 'avatar_url', 'name', 'blog', 'location',
+              'twitter_username', 'company', 'bio',
+              'public_repos', 'followers', 'following', 'created_at', 'updated_at']
+    for f in fields:
+        if data.get(f):
+            result[f] = data[f]
+    result['public_gists'] = f'https://gist.github.com/{username}'
+
+    for resp in (gpg, ssh):
+        if isinstance(resp, Exception):
+            record_error(resp)
+    if not isinstance(gpg, BaseException) and gpg.status == 200 and "hasn't uploaded any GPG keys" not in gpg.text():
+        result['GPG_keys'] = gpg_url
+    if not isinstance(ssh, BaseException) and ssh.status == 200 and ssh.body.strip():
+        result['SSH_keys'] = ssh_url
 
     if not result:
         return None, "Пользователь не найден"
@@ -246,12 +1369,28 @@ async def search_leakcheck(session, query):
     params = {'key': LEAKCHECK_KEY, 'check': query}
     return await _make_request(session, url, params, "LeakCheck")
 
-async def search_proxynova_email(session, email):
-    import urllib.parse
+async def search_proxynova_email(session, email, start=0, limit=PROXYNOVA_PAGE_SIZE):
     encoded = urllib.parse.quote(email)
-    url = f"{PROXYNOVA_URL}?query={encoded}&start=0&limit=100"
+    url = f"{PROXYNOVA_URL}?query={encoded}&start={start}&limit={limit}"
     return await _make_request(session, url, {}, "ProxyNova")
 
+def proxynova_pager(email, start, total):
+    """Загрузчик следующей страницы ProxyNova (start/limit) — вызывается только по кнопке ▶."""
+    if start >= total:
+        return None
+
+    @upstream("ProxyNova")
+    async def load():
+        async with http_session() as session:
+            data = await search_proxynova_email(session, email, start=start)
+        lines = _proxynova_lines(data)
+        if not lines:
+            return None, None
+        end = start + len(lines)
+        section = Section("✅ ProxyNova", {f"Записи {start + 1}–{end} из {total}": lines})
+        return section.render(), proxynova_pager(email, end, total)
+    return load
+
 async def search_psbdmp_email(session, email):
     url = f"{PSBDMP_URL}/email/{email}"
     return await _make_request(session, url, {}, "PSBDmp")
@@ -262,15 +1401,17 @@ async def search_psbdmp_domain(session, domain):
 
 async def _make_request(session, url, params, source):
     try:
-        timeout = aiohttp.ClientTimeout(total=20)
+        timeout = aiohttp.ClientTimeout(total=source_timeout(20))
         async with session.get(url, params=params, timeout=timeout) as resp:
             if resp.status == 200:
                 return await resp.json()
             else:
                 return {"error": f"{source}: HTTP {resp.status}"}
-    except asyncio.TimeoutError:
+    except asyncio.TimeoutError as e:
+        record_error(e)
         return {"error": f"{source}: Таймаут запроса"}
     except Exception as e:
+        record_error(e)
         return {"error": f"{source}: {str(e)}"}
 
 # ---------- Модули из EYES ----------
@@ -279,7 +1420,7 @@ async def search_duolingo(session, email):
     params = {'email': email}
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
     try:
-        async with session.get(url, params=params, headers=headers, timeout=10) as resp:
+        async with session.get(url, params=params, headers=headers, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 data = await resp.json()
                 if data.get('users') and len(data['users']) > 0:
@@ -290,9 +1431,9 @@ async def search_duolingo(session, email):
                         "Total XP": user.get('totalXp', 0),
                         "From": user.get('courses', [{}])[0].get('fromLanguage', '?') if user.get('courses') else '?'
                     }
-                    return format_dict_as_damage(result, title="✅ Duolingo")
-    except Exception:
-        pass
+                    return Section("✅ Duolingo", result)
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_gravatar(session, email):
@@ -300,17 +1441,17 @@ async def search_gravatar(session, email):
     url = f"https://en.gravatar.com/{email_hash}.json"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with session.get(url, headers=headers, timeout=10) as resp:
+        async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 data = await resp.json()
                 if data.get('entry') and len(data['entry']) > 0:
                     display_name = data['entry'][0].get('displayName')
                     if display_name:
-                        return format_dict_as_damage({"Name": display_name}, title="✅ Gravatar")
+                        return Section("✅ Gravatar", {"Name": display_name})
                     else:
-                        return "✅ Gravatar"
-    except Exception:
-        pass
+                        return Section("✅ Gravatar")
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_imgur(session, email):
@@ -318,33 +1459,33 @@ async def search_imgur(session, email):
     headers = {'User-Agent': 'Mozilla/5.0'}
     data = {'email': email}
     try:
-        async with session.post(url, headers=headers, data=data, timeout=10) as resp:
+        async with session.post(url, headers=headers, data=data, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 text = await resp.text()
                 if '"data":{"available":false}' in text:
-                    return "✅ Imgur"
-    except Exception:
-        pass
+                    return Section("✅ Imgur")
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_mailru(session, email):
     url = f"https://account.mail.ru/api/v1/user/exists?email={email}"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with session.get(url, headers=headers, timeout=10) as resp:
+        async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 data = await resp.json()
                 if data.get('body', {}).get('exists') is True:
-                    return "✅ Mail.ru"
-    except Exception:
-        pass
+                    return Section("✅ Mail.ru")
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_protonmail(session, email):
     url = f"https://api.protonmail.ch/pks/lookup?op=index&search={email}"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with session.get(url, headers=headers, timeout=10) as resp:
+        async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 text = await resp.text()
                 if "info:1:1" in text:
@@ -352,11 +1493,11 @@ async def search_protonmail(session, email):
                     if match:
                         timestamp = int(match.group(1))
                         date = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-                        return format_dict_as_damage({"PGP created (UTC)": date}, title="✅ ProtonMail")
+                        return Section("✅ ProtonMail", {"PGP created (UTC)": date})
                     else:
-                        return "✅ ProtonMail"
-    except Exception:
-        pass
+                        return Section("✅ ProtonMail")
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_bitmoji(session, email):
@@ -364,20 +1505,20 @@ async def search_bitmoji(session, email):
     headers = {'User-Agent': 'Mozilla/5.0'}
     data = {'email': email}
     try:
-        async with session.post(url, headers=headers, data=data, timeout=10) as resp:
+        async with session.post(url, headers=headers, data=data, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 text = await resp.text()
                 if '{"account_type":"snapchat"}' in text:
-                    return "✅ Bitmoji (Snapchat)"
-    except Exception:
-        pass
+                    return Section("✅ Bitmoji (Snapchat)")
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_instagram(session, email):
     url = f"https://www.instagram.com/web/search/topsearch/?context=blended&query={email}"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with session.get(url, headers=headers, timeout=10) as resp:
+        async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 data = await resp.json()
                 users = data.get('users', [])
@@ -387,40 +1528,40 @@ async def search_instagram(session, email):
                     pic = user_info.get('profile_pic_url')
                     if username:
                         result = {"Username": username, "Profile pic": pic}
-                        return format_dict_as_damage(result, title="✅ Instagram")
-    except Exception:
-        pass
+                        return Section("✅ Instagram", result)
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_twitter(session, email):
     url = f"https://api.twitter.com/i/users/email_available.json?email={email}"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with session.get(url, headers=headers, timeout=10) as resp:
+        async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 data = await resp.json()
                 if data.get('taken') is True:
-                    return "✅ X (Twitter)"
-    except Exception:
-        pass
+                    return Section("✅ X (Twitter)")
+    except Exception as e:
+        record_error(e)
     return None
 
 async def search_github_email(session, email):
     url = f"https://api.github.com/search/users?q={email}+in:email"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with session.get(url, headers=headers, timeout=10) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                if data.get('total_count', 0) > 0:
-                    items = data.get('items', [])
-                    if items:
-                        login = items[0].get('login')
-                        avatar = items[0].get('avatar_url')
-                        result = {"Username": login, "Avatar": avatar}
-                        return format_dict_as_damage(result, title="✅ GitHub")
-    except Exception:
-        pass
+        resp = await github_get(session, url, headers)
+        if resp.status == 200:
+            data = json.loads(resp.body)
+            if data.get('total_count', 0) > 0:
+                items = data.get('items', [])
+                if items:
+                    login = items[0].get('login')
+                    avatar = items[0].get('avatar_url')
+                    result = {"Username": login, "Avatar": avatar}
+                    return Section("✅ GitHub", result)
+    except Exception as e:
+        record_error(e)
     return None
 
 # ---------- Форматирование для Hudson и др. ----------
@@ -449,7 +1590,7 @@ def format_hudson_standard(data, search_type, query):
     else:
         items["Зараженные устройства"] = "не найдены"
     if items:
-        return format_dict_as_damage(items, title="🔍 Hudson Rock")
+        return Section("🔍 Hudson Rock", items)
     return None
 
 def format_hudson_domain(data, query):
@@ -467,7 +1608,7 @@ def format_hudson_domain(data, query):
         if d.get("clients_urls"):
             items["URL клиентов"] = [u['url'] for u in d['clients_urls'][:5]]
     if items:
-        return format_dict_as_damage(items, title="🔍 Hudson Rock (домен)")
+        return Section("🔍 Hudson Rock (домен)", items)
     return None
 
 def format_leakcheck(data, query):
@@ -485,22 +1626,25 @@ def format_leakcheck(data, query):
                 date = s.get('date', '?')
                 sources_list.append(f"{name} ({date})")
             items["Источники"] = sources_list
-        return format_dict_as_damage(items, title="✅ LeakCheck")
+        return Section("✅ LeakCheck", items)
     return None
 
-def format_proxynova(data, query):
+def _proxynova_lines(data):
     if not isinstance(data, dict) or "error" in data:
-        return None
-    proxies = []
+        return []
     if 'lines' in data:
-        proxies = data['lines']
+        return data['lines']
     elif 'proxies' in data:
-        proxies = data['proxies']
+        return data['proxies']
     elif 'results' in data:
-        proxies = data['results']
+        return data['results']
+    return []
+
+def format_proxynova(data, query):
+    proxies = _proxynova_lines(data)
     if proxies:
-        items = {"Найдено записей": len(proxies), "Примеры": proxies[:10]}
-        return format_dict_as_damage(items, title="✅ ProxyNova")
+        items = {"Найдено записей": data.get('count', len(proxies)), "Примеры": proxies[:10]}
+        return Section("✅ ProxyNova", items)
     return None
 
 def format_psbdmp(data, query, search_type):
@@ -513,7 +1657,7 @@ def format_psbdmp(data, query, search_type):
         tags = p.get('tags', '?')
         pastes.append(f"ID: {paste_id} | Теги: {tags}")
     items["Пасты"] = pastes
-    return format_dict_as_damage(items, title="✅ PSBDmp")
+    return Section("✅ PSBDmp", items)
 
 # ---------- Объединённый поиск по номеру телефона ----------
 async def get_phone_info_combined(phone: str):
@@ -521,72 +1665,110 @@ async def get_phone_info_combined(phone: str):
     if not clean_phone:
         return None, "❌ Некорректный номер"
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            _htmlweb_number_scan(session, clean_phone),
-            _phoneradar_rating(clean_phone),
-            _veriphone_scan(clean_phone)
+    tier = lookup_tier.get()
+    if tier >= governor.ESSENTIAL:
+        section = phone_offline_section(clean_phone)
+        if section is None:
+            return None, "❌ Информация не найдена"
+        return [SourceResult("phonenumbers", [section], fetched_at=time.time())], None
+
+    async with http_session() as session:
+        sources = [
+            ("htmlweb.ru", lambda: _htmlweb_number_scan(session, clean_phone), format_htmlweb_phone),
+            ("phoneradar.ru", lambda: _phoneradar_rating(clean_phone), format_phoneradar),
+            ("Veriphone", lambda: _veriphone_scan(clean_phone), format_veriphone),
         ]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(*(
+            timed_source(name, fetch(), fmt)
+            for name, fetch, fmt in sources
+            if tier == governor.FULL or not skip_when_reduced(name)
+        ))
 
-    htmlweb_data, phoneradar_result, veriphone_data = results[:3]
+    if not any(r.sections for r in results):
+        return None, "❌ Информация не найдена"
+    return results, None
 
+def phone_offline_section(phone: str):
+    """Страна, оператор и часовой пояс из локальной базы phonenumbers — без внешних запросов."""
+    # Импорт при первом поиске по телефону (или в прогреве): один geocoder грузит данные ~0,4 с
+    import phonenumbers
+    from phonenumbers import carrier, geocoder, timezone
+    try:
+        number = phonenumbers.parse(phone if phone.startswith('+') else '+' + phone)
+    except phonenumbers.NumberParseException:
+        return None
+    items = {"Валидный": "Да" if phonenumbers.is_valid_number(number) else "Нет"}
+    region = geocoder.description_for_number(number, "ru")
+    if region:
+        items["Регион"] = region
+    operator = carrier.name_for_number(number, "ru")
+    if operator:
+        items["Оператор (исходный)"] = operator
+    zones = timezone.time_zones_for_number(number)
+    # Для кода страны целиком библиотека отдаёт все зоны страны — такой список бесполезен
+    if zones and len(zones) <= 3:
+        items["Часовой пояс"] = ", ".join(zones)
+    return Section("📍 Локальная база номеров", items)
+
+def format_htmlweb_phone(data):
+    if not data:
+        return None
     items = {}
+    if data.get('country'):
+        items["Страна (htmlweb)"] = data['country']
+    if data.get('country_code'):
+        items["Код страны"] = data['country_code']
+    if data.get('city'):
+        items["Город"] = data['city']
+    if data.get('postal_code'):
+        items["Почтовый индекс"] = data['postal_code']
+    if data.get('currency_code'):
+        items["Код валюты"] = data['currency_code']
+    if data.get('operator'):
+        oper = data['operator']
+        oper_str = oper.get('brand', '')
+        if oper.get('name'):
+            oper_str += f" ({oper['name']})"
+        if oper.get('url'):
+            oper_str += f" - {oper['url']}"
+        items["Оператор"] = oper_str
+    if data.get('region'):
+        items["Регион"] = data['region']
+    if data.get('district'):
+        items["Округ"] = data['district']
+    if data.get('latitude') and data.get('longitude'):
+        items["Координаты"] = f"{data['latitude']}, {data['longitude']}"
+        items["Карта Google"] = f"https://www.google.com/maps/place/{data['latitude']}+{data['longitude']}"
+    if items:
+        return Section("📍 htmlweb.ru", items)
+    return None
 
-    # htmlweb.ru
-    if htmlweb_data and not isinstance(htmlweb_data, Exception):
-        if htmlweb_data.get('country'):
-            items["Страна (htmlweb)"] = htmlweb_data['country']
-        if htmlweb_data.get('country_code'):
-            items["Код страны"] = htmlweb_data['country_code']
-        if htmlweb_data.get('city'):
-            items["Город"] = htmlweb_data['city']
-        if htmlweb_data.get('postal_code'):
-            items["Почтовый индекс"] = htmlweb_data['postal_code']
-        if htmlweb_data.get('currency_code'):
-            items["Код валюты"] = htmlweb_data['currency_code']
-        if htmlweb_data.get('operator'):
-            oper = htmlweb_data['operator']
-            oper_str = oper.get('brand', '')
-            if oper.get('name'):
-                oper_str += f" ({oper['name']})"
-            if oper.get('url'):
-                oper_str += f" - {oper['url']}"
-            items["Оператор"] = oper_str
-        if htmlweb_data.get('region'):
-            items["Регион"] = htmlweb_data['region']
-        if htmlweb_data.get('district'):
-            items["Округ"] = htmlweb_data['district']
-        if htmlweb_data.get('latitude') and htmlweb_data.get('longitude'):
-            items["Координаты"] = f"{htmlweb_data['latitude']}, {htmlweb_data['longitude']}"
-            items["Карта Google"] = f"https://www.google.com/maps/place/{htmlweb_data['latitude']}+{htmlweb_data['longitude']}"
-
-    # phoneradar.ru
-    if phoneradar_result and not isinstance(phoneradar_result, Exception):
-        rating, link = phoneradar_result
-        if rating and rating != "Информация отсутствует":
-            items["Оценка номера"] = f"{rating} ({link})"
-
-    # Veriphone
-    if veriphone_data and not isinstance(veriphone_data, Exception) and veriphone_data.get('status') == 'success':
-        items["Валидность (Veriphone)"] = "Да" if veriphone_data.get('phone_valid') else "Нет"
-        if veriphone_data.get('carrier'):
-            items["Оператор (Veriphone)"] = veriphone_data['carrier']
-        if veriphone_data.get('phone_type'):
-            items["Тип номера"] = veriphone_data['phone_type']
-        if veriphone_data.get('phone_region'):
-            items["Регион (Veriphone)"] = veriphone_data['phone_region']
-        if veriphone_data.get('international_number'):
-            items["Международный формат"] = veriphone_data['international_number']
-
-    if not items:
-        return None, "❌ Информация не найдена"
-    return format_dict_as_damage(items, title=f"📞 Результаты по номеру {phone}"), None
+def format_phoneradar(data):
+    if not data:
+        return None
+    rating, link = data
+    if rating and rating != "Информация отсутствует":
+        return Section("⭐ phoneradar.ru", {"Оценка номера": f"{rating} ({link})"})
+    return None
+
+def format_veriphone(data):
+    if not data or data.get('status') != 'success':
+        return None
+    items = {"Валидность (Veriphone)": "Да" if data.get('phone_valid') else "Нет"}
+    if data.get('carrier'):
+        items["Оператор (Veriphone)"] = data['carrier']
+    if data.get('phone_type'):
+        items["Тип номера"] = data['phone_type']
+    if data.get('phone_region'):
+        items["Регион (Veriphone)"] = data['phone_region']
+    if data.get('international_number'):
+        items["Международный формат"] = data['international_number']
+    return Section("✔️ Veriphone", items)
 
 async def _htmlweb_number_scan(session, phone: str):
     try:
         url = f"https://htmlweb.ru/geo/api.php?json&telcod={phone}"
-        async with session.get(url, timeout=10) as resp:
+        async with session.get(url, timeout=source_timeout(10)) as resp:
             if resp.status == 200:
                 try:
                     data = await resp.json()
@@ -616,7 +1798,8 @@ async def _htmlweb_number_scan(session, phone: str):
                 if 'capital' in data:
                     result['capital'] = data['capital'].get('name', '')
                 return result
-    except Exception:
+    except Exception as e:
+        record_error(e)
         return None
 
 async def _phoneradar_rating(phone: str):
@@ -624,34 +1807,42 @@ async def _phoneradar_rating(phone: str):
     url = f"https://phoneradar.ru/phone/{clean_phone}"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
+        async with http_session() as session:
+            async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
                 if resp.status == 200:
                     html = await resp.text()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    target_block = soup.find('a', href=f"/phone/{clean_phone[1:]}")
-                    if target_block:
-                        card_body = target_block.find_parent('div', class_='card-body')
-                        if card_body:
-                            comment = card_body.find('p').text.strip()
-                            name = card_body.find('p').find_next().find_next().text
-                            return (f"{comment} / {name}", url)
-    except Exception:
-        pass
+                    rating = parse_phoneradar(html, clean_phone)
+                    if rating:
+                        return (rating, url)
+    except Exception as e:
+        record_error(e)
     return ("Информация отсутствует", url)
 
+def parse_phoneradar(html: str, clean_phone: str):
+    """Оценка номера со страницы phoneradar.ru в виде «комментарий / категория»."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    target_block = soup.find('a', href=f"/phone/{clean_phone[1:]}")
+    if target_block:
+        card_body = target_block.find_parent('div', class_='card-body')
+        if card_body:
+            comment = card_body.find('p').text.strip()
+            name = card_body.find('p').find_next().find_next().text
+            return f"{comment} / {name}"
+    return None
+
 async def _veriphone_scan(phone: str):
     if not VERIPHONE_API_KEY:
         return None
     clean_phone = re.sub(r'[^\d+]', '', phone)
     url = f"https://api.veriphone.io/v2/verify?phone={clean_phone}&key={VERIPHONE_API_KEY}"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
+        async with http_session() as session:
+            async with session.get(url, timeout=source_timeout(10)) as resp:
                 if resp.status == 200:
                     return await resp.json()
-    except:
-        pass
+    except Exception as e:
+        record_error(e)
     return None
 
 # ---------- Объединённый поиск по IP ----------
@@ -666,50 +1857,52 @@ async def get_ip_info_combined(ip: str):
     if not is_ip(ip):
         return None, "❌ Некорректный IP-адрес."
     results = []
-    async with aiohttp.ClientSession() as session:
+    async with http_session() as session:
         for api in IP_APIS:
             url = api['url'].format(ip=ip)
-            try:
-                async with session.get(url, timeout=10) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        results.append((api['name'], data))
-                    else:
-                        results.append((api['name'], None))
-            except Exception:
-                results.append((api['name'], None))
-    lines = [f"🌐 Результаты поиска по IP {ip}"]
-    for name, data in results:
-        if data:
-            lines.append(f"\n├─── {name}")
-            if data.get('country'):
-                lines.append(f"│   ├Страна: {data.get('country')}")
-            if data.get('region') or data.get('region_name') or data.get('regionName'):
-                region = data.get('region') or data.get('region_name') or data.get('regionName', 'Н/Д')
-                lines.append(f"│   ├Регион: {region}")
-            if data.get('city'):
-                lines.append(f"│   ├Город: {data.get('city')}")
-            if data.get('zip') or data.get('postal'):
-                zip_code = data.get('zip') or data.get('postal', 'Н/Д')
-                lines.append(f"│   ├Почтовый индекс: {zip_code}")
-            if data.get('timezone') or data.get('time_zone'):
-                tz = data.get('timezone') or data.get('time_zone', 'Н/Д')
-                lines.append(f"│   ├Часовой пояс: {tz}")
-            if data.get('isp') or data.get('org'):
-                isp = data.get('isp') or data.get('org', 'Н/Д')
-                lines.append(f"│   ├Провайдер: {isp}")
-            lat = data.get('latitude') or data.get('lat')
-            lon = data.get('longitude') or data.get('lon')
-            if lat and lon:
-                lines.append(f"│   ├Координаты: {lat}, {lon}")
-            if data.get('as') or data.get('asn'):
-                asn = data.get('as') or data.get('asn', 'Н/Д')
-                lines.append(f"│   └AS: {asn}")
-        else:
-            lines.append(f"\n├─── {name}: данные не получены")
-    return "\n".join(lines), None
+            name = api['name']
+            results.append(await timed_source(name, _ip_api_request(session, url),
+                                              lambda data, name=name: format_ip_provider(name, data)))
+            # Под нагрузкой хватает первого провайдера, который ответил
+            if lookup_tier.get() >= governor.REDUCED and any(section.items for section in results[-1].sections):
+                break
+    return results, None
+
+async def _ip_api_request(session, url):
+    try:
+        async with session.get(url, timeout=source_timeout(10)) as resp:
+            if resp.status == 200:
+                return await resp.json()
+    except Exception as e:
+        record_error(e)
+    return None
+
+def format_ip_provider(name, data):
+    if not data:
+        return Section(f"├─── {name}: данные не получены")
+    items = {}
+    if data.get('country'):
+        items["Страна"] = data.get('country')
+    if data.get('region') or data.get('region_name') or data.get('regionName'):
+        items["Регион"] = data.get('region') or data.get('region_name') or data.get('regionName', 'Н/Д')
+    if data.get('city'):
+        items["Город"] = data.get('city')
+    if data.get('zip') or data.get('postal'):
+        items["Почтовый индекс"] = data.get('zip') or data.get('postal', 'Н/Д')
+    if data.get('timezone') or data.get('time_zone'):
+        items["Часовой пояс"] = data.get('timezone') or data.get('time_zone', 'Н/Д')
+    if data.get('isp') or data.get('org'):
+        items["Провайдер"] = data.get('isp') or data.get('org', 'Н/Д')
+    lat = data.get('latitude') or data.get('lat')
+    lon = data.get('longitude') or data.get('lon')
+    if lat and lon:
+        items["Координаты"] = f"{lat}, {lon}"
+    if data.get('as') or data.get('asn'):
+        items["AS"] = data.get('as') or data.get('asn', 'Н/Д')
+    return Section(f"├─── {name}", items)
 
 # ---------- Поиск MNP ----------
+@upstream("htmlweb.ru MNP")
 async def get_mnp_info(phone: str):
     clean_phone = re.sub(r'[^\d+]', '', phone)
     if not clean_phone:
@@ -717,8 +1910,8 @@ async def get_mnp_info(phone: str):
     url = f"https://htmlweb.ru/json/mnp/phone/{clean_phone}"
     headers = {'User-Agent': 'Mozilla/5.0'}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
+        async with http_session() as session:
+            async with session.get(url, headers=headers, timeout=source_timeout(10)) as resp:
                 if resp.status == 200:
                     data = await resp.json()
                     if data.get('error'):
@@ -741,47 +1934,56 @@ async def get_mnp_info(phone: str):
                         if oper.get('url'):
                             oper_str += f" - {oper['url']}"
                         items["Оператор"] = oper_str
-                    return format_dict_as_damage(items, title=f"📡 MNP для номера {phone}"), None
+                    return Section(f"📡 MNP для номера {phone}", items), None
                 else:
                     return None, "❌ Ошибка API"
     except Exception as e:
+        record_error(e)
         return None, f"❌ Ошибка: {e}"
 
 # ---------- Поиск по TikTok ----------
+@upstream("TikTok")
 async def get_tiktok_info(username: str):
     clean_username = username.lstrip('@')
     url = f"https://www.tiktok.com/@{clean_username}"
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=15) as resp:
+        async with http_session() as session:
+            async with session.get(url, headers=headers, timeout=source_timeout(15)) as resp:
                 if resp.status != 200:
                     return None
                 html = await resp.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                script_tag = soup.find('script', attrs={'type': 'application/json', 'crossorigin': 'anonymous'})
-                if not script_tag:
-                    return None
-                data = json.loads(script_tag.string)
-                user_info = data['props']['pageProps']['userInfo']['user']
-                stats = data['props']['pageProps']['userInfo']['stats']
-                items = {
-                    "UserID": user_info['id'],
-                    "Username": user_info['uniqueId'],
-                    "Nickname": user_info['nickname'],
-                    "Bio": user_info.get('signature', ''),
-                    "Profile image": user_info['avatarLarger'],
-                    "Following": stats['followingCount'],
-                    "Followers": stats['followerCount'],
-                    "Likes": stats['heart'],
-                    "Videos": stats['videoCount'],
-                    "Verified": "Да" if user_info.get('verified') else "Нет"
-                }
-                return format_dict_as_damage(items, title="🎵 TikTok профиль")
-    except Exception:
+                return parse_tiktok_profile(html)
+    except Exception as e:
+        record_error(e)
+        return None
+
+def parse_tiktok_profile(html: str):
+    """Профиль из JSON, встроенного в страницу TikTok; None, если его там нет."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    script_tag = soup.find('script', attrs={'type': 'application/json', 'crossorigin': 'anonymous'})
+    if not script_tag:
         return None
+    data = json.loads(script_tag.string)
+    user_info = data['props']['pageProps']['userInfo']['user']
+    stats = data['props']['pageProps']['userInfo']['stats']
+    items = {
+        "UserID": user_info['id'],
+        "Username": user_info['uniqueId'],
+        "Nickname": user_info['nickname'],
+        "Bio": user_info.get('signature', ''),
+        "Profile image": user_info['avatarLarger'],
+        "Following": stats['followingCount'],
+        "Followers": stats['followerCount'],
+        "Likes": stats['heart'],
+        "Videos": stats['videoCount'],
+        "Verified": "Да" if user_info.get('verified') else "Нет"
+    }
+    return Section("🎵 TikTok профиль", items)
 
 # ---------- Поиск по ИНН (DaData) ----------
+@upstream("DaData")
 async def get_inn_info(inn: str):
     if not DADATA_API_KEY or not DADATA_SECRET_KEY:
         return None, "❌ API-ключи DaData не настроены. Добавьте их в файл .env"
@@ -793,8 +1995,8 @@ async def get_inn_info(inn: str):
     }
     data = {"query": inn}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, headers=headers, timeout=10) as resp:
+        async with http_session() as session:
+            async with session.post(url, json=data, headers=headers, timeout=source_timeout(10)) as resp:
                 if resp.status == 200:
                     result = await resp.json()
                     if not result.get("suggestions"):
@@ -835,12 +2037,14 @@ async def get_inn_info(inn: str):
                         items["Тип"] = "Юридическое лицо"
                     elif suggestion.get("type") == "INDIVIDUAL":
                         items["Тип"] = "Индивидуальный предприниматель"
-                    return format_dict_as_damage(items, title=f"📋 Данные по ИНН {inn}"), None
+                    return Section(f"📋 Данные по ИНН {inn}", items), None
                 else:
                     return None, f"❌ Ошибка DaData API: {resp.status}"
-    except asyncio.TimeoutError:
+    except asyncio.TimeoutError as e:
+        record_error(e)
         return None, "❌ Таймаут при запросе к DaData"
     except Exception as e:
+        record_error(e)
         return None, f"❌ Ошибка: {e}"
 
 # ---------- НОВАЯ ФУНКЦИЯ: ПОИСК ПО ФИО (ссылки на гос. ресурсы + соцсети + Google Dorks) ----------
@@ -921,129 +2125,218 @@ async def get_fio_info(fio: str):
 
     return "\n".join(lines), None
 
-# ---------- Объединённый поиск по email ----------
-async def get_email_info_combined(email: str):
-    if not is_email(email):
-        return None, "❌ Некорректный email."
-
-    async with aiohttp.ClientSession() as session:
-        # Старые задачи
-        tasks_old = [
-            search_hudson_email(session, email),
-            search_leakcheck(session, email),
-            search_proxynova_email(session, email),
-            search_psbdmp_email(session, email),
-            search_duolingo(session, email),
-            search_gravatar(session, email),
-            search_imgur(session, email),
-            search_mailru(session, email),
-            search_protonmail(session, email),
-            search_bitmoji(session, email),
-            search_instagram(session, email),
-            search_twitter(session, email),
-            search_github_email(session, email),
-        ]
-        # AbstractAPI задачи
-        val_url = f"https://emailvalidation.abstractapi.com/v1/?api_key={EMAIL_VALIDATION_API_KEY}&email={email}"
-        rep_url = f"https://emailreputation.abstractapi.com/v1/?api_key={EMAIL_REPUTATION_API_KEY}&email={email}"
-        tasks_abstract = [
-            session.get(val_url, timeout=10),
-            session.get(rep_url, timeout=10)
-        ]
-        # Запускаем всё параллельно
-        results_old = await asyncio.gather(*tasks_old, return_exceptions=True)
-        results_abstract = await asyncio.gather(*tasks_abstract[0], *tasks_abstract[1], return_exceptions=True)
+# ---------- Почтовый домен: локальный индекс и MX ----------
+EMAIL_INDEX_DIR = os.getenv('EMAIL_INDEX_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'email_domains')
+email_domains = None            # читается в потоке: прогревом после запуска или первым поиском по email
+_email_domains_task = None
+mx_cache = email_index.MxCache()
+DOH_URL = "https://dns.google/resolve"
+
+async def lookup_mx(session, domain: str):
+    """MX-хосты домена через DNS-over-HTTPS с кэшем по TTL; None — ответа нет."""
+    hosts = mx_cache.get(domain)
+    CACHE_REQUESTS.inc("mx", "miss" if hosts is None else "hit")
+    if hosts is not None or lookup_tier.get() >= governor.ESSENTIAL:
+        return hosts
+    token = current_source.set("DNS MX")
+    try:
+        async with session.get(DOH_URL, params={"name": domain, "type": "MX"}, timeout=source_timeout(5)) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.json(content_type=None)
+    except Exception as e:
+        record_error(e)
+        return None
+    finally:
+        current_source.reset(token)
+    if data.get("Status") not in (0, 3):    # 3 — NXDOMAIN, тоже окончательный ответ
+        return None
+    answers = [a for a in data.get("Answer", []) if a.get("type") == 15]
+    hosts = [a.get("data", "").split()[-1].rstrip(".").lower() for a in answers]
+    mx_cache.put(domain, hosts, min((a.get("TTL", 0) for a in answers), default=0))
+    return tuple(hosts)
+
+async def get_email_domains() -> email_index.EmailDomainIndex:
+    global email_domains, _email_domains_task
+    if email_domains is None:
+        if _email_domains_task is None:
+            _email_domains_task = asyncio.ensure_future(asyncio.to_thread(email_index.EmailDomainIndex.load, EMAIL_INDEX_DIR))
+        try:
+            email_domains = await asyncio.shield(_email_domains_task)
+        except Exception:
+            # Упавшая загрузка не кэшируется: следующий поиск по email попробует снова
+            _email_domains_task = None
+            raise
+    return email_domains
+
+async def search_email_domain(session, email, mx=None):
+    """Формат, одноразовость, бесплатность и ролевой адрес — из локального индекса; MX — из кэша или DNS."""
+    verdict = (await get_email_domains()).check(email, is_email)
+    items = {"Email": email, "Формат валидный": "Да" if verdict.valid else "Нет"}
+    if not verdict.valid:
+        return Section("📧 Почтовый домен", items)
+    items["Бесплатный email"] = "Да" if verdict.free else "Нет"
+    items["Одноразовый"] = "Да" if verdict.disposable else "Нет"
+    items["Ролевой"] = "Да" if verdict.role else "Нет"
+    hosts = await (mx if mx is not None else lookup_mx(session, verdict.domain))
+    if hosts is not None:
+        items["MX запись"] = ", ".join(hosts[:3]) if hosts else "Нет"
+    return Section("📧 Почтовый домен", items)
+
+# ---------- AbstractAPI ----------
+async def search_abstract_reputation(session, email):
+    url = f"https://emailreputation.abstractapi.com/v1/?api_key={EMAIL_REPUTATION_API_KEY}&email={email}"
+    return await _abstract_request(session, url)
+
+async def _abstract_request(session, url):
+    try:
+        async with session.get(url, timeout=source_timeout(10)) as resp:
+            if resp.status == 200:
+                return await resp.json()
+    except Exception as e:
+        record_error(e)
+    return None
 
-    # Распаковка старых
-    hudson, leakcheck, proxynova, psbdmp, duolingo, gravatar, imgur, mailru, protonmail, bitmoji, instagram, twitter, github = results_old[:13]
-    # Распаковка AbstractAPI
-    val_resp = results_abstract[0]
-    rep_resp = results_abstract[1]
+def format_abstract_reputation(rep_data):
+    if not isinstance(rep_data, dict):
+        return None
+    items = {}
+    if rep_data.get('reputation'):
+        items["Репутация"] = rep_data['reputation']
+    if rep_data.get('reputation_score') is not None:
+        items["Баллы репутации"] = rep_data['reputation_score']
+    if rep_data.get('is_suspicious') is not None:
+        items["Подозрительный"] = "Да" if rep_data['is_suspicious'] else "Нет"
+    if rep_data.get('is_spam') is not None:
+        items["Спам"] = "Да" if rep_data['is_spam'] else "Нет"
+    if rep_data.get('is_not_trusted') is not None:
+        items["Не доверенный"] = "Да" if rep_data['is_not_trusted'] else "Нет"
+    if items:
+        return Section("📧 AbstractAPI (репутация)", items)
+    return None
 
-    result_parts = []
+# ---------- Объединённый поиск по email ----------
+# (название, запрос(session, email), форматтер(data, email) или None, если запрос сразу отдаёт Section)
+EMAIL_SOURCES = [
+    ("Почтовый домен", search_email_domain, None),
+    ("Hudson Rock", search_hudson_email, lambda data, email: format_hudson_standard(data, "email", email)),
+    ("LeakCheck", search_leakcheck, format_leakcheck),
+    ("ProxyNova", search_proxynova_email, format_proxynova),
+    ("PSBDmp", search_psbdmp_email, lambda data, email: format_psbdmp(data, email, "email")),
+    ("Duolingo", search_duolingo, None),
+    ("Gravatar", search_gravatar, None),
+    ("Imgur", search_imgur, None),
+    ("Mail.ru", search_mailru, None),
+    ("ProtonMail", search_protonmail, None),
+    ("Bitmoji", search_bitmoji, None),
+    ("Instagram", search_instagram, None),
+    ("Twitter", search_twitter, None),
+    ("GitHub", search_github_email, None),
+    ("AbstractAPI (репутация)", search_abstract_reputation, lambda data, email: format_abstract_reputation(data)),
+]
 
-    for res in [hudson, leakcheck, proxynova, psbdmp, duolingo, gravatar, imgur, mailru, protonmail, bitmoji, instagram, twitter, github]:
-        if res and isinstance(res, str) and not res.startswith("❌"):
-            result_parts.append(res)
+# Проверка аккаунта у провайдера имеет смысл только для его доменов — собственных или с его MX
+PROVIDER_DOMAINS = {
+    "Mail.ru": ({"mail.ru", "bk.ru", "inbox.ru", "list.ru", "internet.ru"}, ("mail.ru",)),
+    "ProtonMail": ({"protonmail.com", "protonmail.ch", "proton.me", "pm.me"}, ("protonmail.ch", "proton.me")),
+}
+PROVIDER_CHECKS_SKIPPED = metrics.Counter("email_provider_checks_skipped_total",
+                                          "Проверки аккаунта, пропущенные из-за чужого почтового домена", ["provider"])
+
+async def provider_checked(provider, fetch, session, email, mx):
+    domains, mx_suffixes = PROVIDER_DOMAINS[provider]
+    if email.rpartition("@")[2].lower() not in domains:
+        hosts = await mx
+        # Без ответа DNS проверяем, как раньше
+        if hosts is not None and not any(host.endswith(mx_suffixes) for host in hosts):
+            PROVIDER_CHECKS_SKIPPED.inc(provider)
+            return None
+    return await fetch(session, email)
 
-    # AbstractAPI
-    if val_resp and not isinstance(val_resp, Exception):
-        try:
-            val_data = await val_resp.json() if val_resp.status == 200 else None
-            if val_data:
-                items = {}
-                if val_data.get('email'):
-                    items["Email"] = val_data['email']
-                if val_data.get('autocorrect'):
-                    items["Автокоррекция"] = val_data['autocorrect']
-                if val_data.get('deliverability'):
-                    items["Доставляемость"] = val_data['deliverability']
-                if val_data.get('quality_score'):
-                    items["Качество"] = val_data['quality_score']
-                if val_data.get('is_valid_format'):
-                    items["Формат валидный"] = val_data['is_valid_format'].get('text', 'Н/Д')
-                if val_data.get('is_free_email'):
-                    items["Бесплатный email"] = val_data['is_free_email'].get('text', 'Н/Д')
-                if val_data.get('is_disposable_email'):
-                    items["Одноразовый"] = val_data['is_disposable_email'].get('text', 'Н/Д')
-                if val_data.get('is_role_email'):
-                    items["Ролевой"] = val_data['is_role_email'].get('text', 'Н/Д')
-                if val_data.get('is_catchall_email'):
-                    items["Catch-all"] = val_data['is_catchall_email'].get('text', 'Н/Д')
-                if val_data.get('is_mx_found'):
-                    items["MX запись"] = val_data['is_mx_found'].get('text', 'Н/Д')
-                if val_data.get('is_smtp_valid'):
-                    items["SMTP валиден"] = val_data['is_smtp_valid'].get('text', 'Н/Д')
-                if items:
-                    result_parts.append(format_dict_as_damage(items, title="📧 AbstractAPI (валидация)"))
-        except:
-            pass
+async def get_email_info_combined(email: str):
+    if not is_email(email):
+        return None, "❌ Некорректный email.", None
+
+    tier = lookup_tier.get()
+    if tier >= governor.ESSENTIAL:
+        sources = [source for source in EMAIL_SOURCES if source[0] == "Почтовый домен"]
+    elif tier == governor.REDUCED:
+        sources = [source for source in EMAIL_SOURCES if not skip_when_reduced(source[0])]
+    else:
+        sources = EMAIL_SOURCES
+    async with http_session() as session:
+        # Один MX-запрос на весь поиск: его ждут и проверка домена, и проверки у провайдеров
+        mx = asyncio.ensure_future(lookup_mx(session, email.rpartition("@")[2].lower()))
+
+        def call(name, fetch):
+            if name == "Почтовый домен":
+                return fetch(session, email, mx)
+            if name in PROVIDER_DOMAINS:
+                return provider_checked(name, fetch, session, email, mx)
+            return fetch(session, email)
 
-    if rep_resp and not isinstance(rep_resp, Exception):
         try:
-            rep_data = await rep_resp.json() if rep_resp.status == 200 else None
-            if rep_data:
-                items = {}
-                if rep_data.get('reputation'):
-                    items["Репутация"] = rep_data['reputation']
-                if rep_data.get('reputation_score') is not None:
-                    items["Баллы репутации"] = rep_data['reputation_score']
-                if rep_data.get('is_suspicious') is not None:
-                    items["Подозрительный"] = "Да" if rep_data['is_suspicious'] else "Нет"
-                if rep_data.get('is_spam') is not None:
-                    items["Спам"] = "Да" if rep_data['is_spam'] else "Нет"
-                if rep_data.get('is_not_trusted') is not None:
-                    items["Не доверенный"] = "Да" if rep_data['is_not_trusted'] else "Нет"
-                if items:
-                    result_parts.append(format_dict_as_damage(items, title="📧 AbstractAPI (репутация)"))
-        except:
-            pass
+            # Запускаем всё параллельно
+            results = await asyncio.gather(*(
+                timed_source(name, call(name, fetch),
+                             (lambda data, fmt=fmt: fmt(data, email)) if fmt else None)
+                for name, fetch, fmt in sources
+            ))
+        finally:
+            mx.cancel()
+    results = list(results)
+
+    # Остальные страницы ProxyNova догружаются по запросу пользователя
+    more = None
+    for result in results:
+        if result.source == "ProxyNova" and result.sections:
+            items = result.sections[0].items
+            more = proxynova_pager(email, len(items["Примеры"]), items["Найдено записей"])
 
     pastebin_url = f"https://www.google.com/search?q=site:pastebin.com+{email}"
-    result_parts.append(f"🔍 Pastebin: [поиск в Google]({pastebin_url})")
-
-    if not result_parts:
+    results.append(SourceResult("Pastebin", [Section("🔍 Pastebin (поиск в Google)", {"Ссылка": pastebin_url})],
+                                fetched_at=time.time()))
+    return results, None, more
+
+# ---------- Объединённый поиск по домену ----------
+async def get_domain_info_combined(domain: str):
+    tier = lookup_tier.get()
+    if tier >= governor.ESSENTIAL:
+        # handle_input отказывает раньше; без внешних API по домену показать нечего
+        return None, "⚠️ Бот перегружен, поиск по домену временно недоступен."
+    async with http_session() as session:
+        sources = [
+            ("Hudson Rock", lambda: search_hudson_domain(session, domain), lambda data: format_hudson_domain(data, domain)),
+            ("LeakCheck", lambda: search_leakcheck(session, domain), lambda data: format_leakcheck(data, domain)),
+            ("PSBDmp", lambda: search_psbdmp_domain(session, domain), lambda data: format_psbdmp(data, domain, "domain")),
+        ]
+        results = await asyncio.gather(*(
+            timed_source(name, fetch(), fmt)
+            for name, fetch, fmt in sources
+            if tier == governor.FULL or not skip_when_reduced(name)
+        ))
+    if not any(r.sections for r in results):
         return None, "❌ Информация не найдена"
-    combined = "\n\n".join(result_parts)
-    return combined, None
+    return list(results), None
 
 # ---------- Профиль пользователя и реферальная система ----------
 def get_profile_info(user_id: int) -> str:
     if user_id == ADMIN_ID:
         return "👑 **Администратор**\nУ вас нет ограничений на запросы."
-    data = user_limits.get(user_id)
-    if data is None:
-        return f"📊 **Ваш профиль**\n• Использовано сегодня: 0 из {MAX_REQUESTS_PER_DAY}\n• Бонусных запросов: 0\n• Приглашено друзей: 0"
+    data = users.get(user_id)
+    recent = len(lookup_history.recent(user_id))
+    if data is None or data.day == 0:
+        return (f"📊 **Ваш профиль**\n• Использовано сегодня: 0 из {MAX_REQUESTS_PER_DAY}\n• Бонусных запросов: 0\n"
+                f"• Приглашено друзей: 0\n• Недавних поисков: {recent}")
     else:
-        today = datetime.now().date().isoformat()
-        if data["date"] == today:
-            used = data["count"]
+        if data.day == _today():
+            used = data.count
         else:
             used = 0
-        bonus = data["bonus"]
-        referrals = data.get("referrals", 0)
+        bonus = data.bonus
+        referrals = data.referrals
         return (f"📊 **Ваш профиль**\n• Использовано сегодня: {used} из {MAX_REQUESTS_PER_DAY}\n"
-                f"• Бонусных запросов: {bonus}\n• Приглашено друзей: {referrals}")
+                f"• Бонусных запросов: {bonus}\n• Приглашено друзей: {referrals}\n• Недавних поисков: {recent}")
 
 # ---------- Админ-команда: добавить бонусы ----------
 async def add_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1066,11 +2359,11 @@ async def add_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await apply_bonus(update, context, target_user_id, amount)
 
 async def apply_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int, amount: int):
-    if target_user_id not in user_limits:
-        today = datetime.now().date().isoformat()
-        user_limits[target_user_id] = {"date": today, "count": 0, "bonus": amount, "referrals": 0}
-    else:
-        user_limits[target_user_id]["bonus"] += amount
+    data = user_record(target_user_id)
+    if data.day == 0:
+        data.day = _today()
+        registered.mark(target_user_id, data.day)
+    data.bonus += amount
     try:
         await context.bot.send_message(
             chat_id=target_user_id,
@@ -1078,8 +2371,131 @@ async def apply_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE, target
         )
         await update.message.reply_text(f"✅ Бонусы добавлены пользователю {target_user_id}. Уведомление отправлено.")
     except Exception:
+        log.warning("уведомление о бонусах не отправлено", exc_info=True,
+                    extra={"event": "bonus.notify_failed", "target": target_user_id})
         await update.message.reply_text(f"⚠️ Бонусы добавлены, но уведомление не отправлено.")
 
+# ---------- Админ-команда: параметры лимитера ----------
+async def limits_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    args = context.args
+    try:
+        if len(args) == 2 and args[0] in RATE_LIMITS:
+            value = float(args[1])
+            if value < 0:
+                raise ValueError
+            RATE_LIMITS[args[0]] = value
+        elif len(args) == 3 and args[0] == "weight":
+            value = float(args[2])
+            if value < 0:
+                raise ValueError
+            ACTION_WEIGHTS[args[1]] = value
+        elif args:
+            await update.message.reply_text(
+                "❌ Использование:\n/limits — показать\n/limits <параметр> <значение>\n/limits weight <действие> <стоимость>")
+            return
+    except ValueError:
+        await update.message.reply_text("❌ Значение должно быть неотрицательным числом.")
+        return
+    lines = ["⚙️ Лимиты (token bucket):"]
+    lines += [f"• {name} = {value:g}" for name, value in RATE_LIMITS.items()]
+    lines.append("Стоимость действий:")
+    lines += [f"• {action} = {weight:g}" for action, weight in ACTION_WEIGHTS.items()]
+    await update.message.reply_text("\n".join(lines))
+
+# ---------- Админ-команда: трассы поисков ----------
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    args = context.args
+    if args and args[0] == "json":
+        await update.message.reply_document(document=tracing.dump().encode(), filename="traces.json")
+        return
+    if args:
+        trace = tracing.find(args[0])
+        traces = [trace] if trace else []
+    else:
+        traces = tracing.slowest()
+    if not traces:
+        await update.message.reply_text("Трасс нет. Использование:\n/trace — самые долгие поиски\n/trace <id>\n/trace json")
+        return
+    for trace in traces:
+        # Если водопад не влезает в сообщение, сокращаем число показанных HTTP-запросов
+        for http_limit in (tracing.WATERFALL_HTTP_LIMIT, 1, 0):
+            text = tracing.render_waterfall(trace, http_limit)
+            if len(text) <= PAGE_SIZE:
+                break
+        await update.message.reply_text(text, parse_mode='HTML')
+
+# ---------- Админ-команда: отчёт сторожа event loop ----------
+async def loop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    watchdog = context.bot_data.get("loop_watchdog")
+    if watchdog is None:
+        await update.message.reply_text("Сторож event loop не запущен.")
+        return
+    await update.message.reply_text(f"{watchdog.report()}\n\n⚖️ {load_governor.report()}"[:PAGE_SIZE])
+
+# ---------- Админ-команда: таймауты источников ----------
+async def timeouts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    args = context.args
+    if args:
+        # Имя источника может содержать пробелы («Hudson Rock»), значение — последний аргумент
+        source, value = " ".join(args[:-1]), args[-1]
+        try:
+            if not source:
+                raise ValueError
+            if value == "auto":
+                timeouts.policy.pin(source, None)
+            else:
+                seconds = float(value)
+                if seconds <= 0:
+                    raise ValueError
+                timeouts.policy.pin(source, seconds)
+        except ValueError:
+            await update.message.reply_text(
+                "❌ Использование:\n/timeouts — показать\n/timeouts <источник> <секунды>\n/timeouts <источник> auto")
+            return
+    await update.message.reply_text(f"⏱ Таймауты источников:\n{timeouts.policy.report()}"[:PAGE_SIZE])
+
+# ---------- Админ-команда: индекс почтовых доменов ----------
+async def emailindex_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global email_domains
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    if context.args == ["reload"]:
+        email_domains = await asyncio.to_thread(email_index.EmailDomainIndex.load, EMAIL_INDEX_DIR)
+    elif context.args:
+        await update.message.reply_text("❌ Использование:\n/emailindex — показать\n/emailindex reload — перечитать файлы")
+        return
+    await update.message.reply_text(f"📧 Индекс почтовых доменов: {(await get_email_domains()).stats()}\n"
+                                    f"MX в кэше: {len(mx_cache)}")
+
+async def sites_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    if context.args:
+        text = site_reliability.describe(" ".join(context.args))
+    else:
+        text = site_reliability.report()
+    await update.message.reply_text(f"🌐 Надёжность сайтов\n{text}"[:PAGE_SIZE])
+
+async def tgindex_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return
+    await update.message.reply_text(f"🆔 Индекс username → ID\n{username_index_report()}")
+
 # ---------- Обработчики команд и кнопок ----------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -1089,12 +2505,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         referrer_id_str = context.args[0][4:]
         if referrer_id_str.isdigit():
             referrer_id = int(referrer_id_str)
-            if referrer_id != user_id and referrer_id in user_limits:
-                if user_id not in user_limits:
-                    today = datetime.now().date().isoformat()
-                    user_limits[user_id] = {"date": today, "count": 0, "bonus": 0, "referrals": 0}
-                    user_limits[referrer_id]["bonus"] += 2
-                    user_limits[referrer_id]["referrals"] = user_limits[referrer_id].get("referrals", 0) + 1
+            if referrer_id != user_id and is_registered(referrer_id):
+                if not is_registered(user_id):
+                    user_record(user_id).day = _today()
+                    registered.mark(user_id, _today())
+                    referrer = user_record(referrer_id)
+                    referrer.bonus += 2
+                    referrer.referrals += 1
                     await context.bot.send_message(chat_id=referrer_id, text="🎉 Вы получили +2 бонусных запроса за приглашение нового пользователя!")
                     await update.message.reply_text("✅ Спасибо за переход по реферальной ссылке! Вам начислены стартовые бонусы (если вы впервые).")
                 else:
@@ -1104,49 +2521,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text("❌ Неверная реферальная ссылка.")
 
-    try:
-        with open('anonimms.jpg', 'rb') as f:
-            await update.message.reply_photo(
-                photo=f,
-                caption="Добро пожаловать в Телеграм-Бот поиска данных!\nВыбери действие:"
-            )
-    except FileNotFoundError:
+    # Баннер и меню — одним сообщением
+    reply_markup = menu_markup(user_id)
+    sent = await static_assets.send_photo(
+        update.message, "banner",
+        caption="Добро пожаловать в Телеграм-Бот поиска данных!\n" + MENU_TEXT,
+        reply_markup=reply_markup
+    )
+    if sent is not None:
+        ASSET_SENDS.inc("banner", sent[1])
+    else:
         await update.message.reply_text(
-            "Здравствуй! Я бот для поиска информации.\nВыбери действие:"
+            "Здравствуй! Я бот для поиска информации.\n" + MENU_TEXT,
+            reply_markup=reply_markup
         )
-
-    # Новая красивая клавиатура
-    keyboard = [
-        [
-            InlineKeyboardButton("🔍 Поиск по нику", callback_data="nick"),
-            InlineKeyboardButton("🆔 Telegram ID", callback_data="tgid"),
-            InlineKeyboardButton("🐙 GitHub", callback_data="github_user"),
-        ],
-        [
-            InlineKeyboardButton("🌐 Поиск по IP", callback_data="ip"),
-            InlineKeyboardButton("📧 Поиск по email", callback_data="email"),
-            InlineKeyboardButton("🌍 Поиск по домену", callback_data="domain"),
-        ],
-        [
-            InlineKeyboardButton("📞 Поиск по номеру", callback_data="phone"),
-            InlineKeyboardButton("🔄 Поиск MNP", callback_data="mnp"),
-            InlineKeyboardButton("🎵 TikTok", callback_data="tiktok"),
-        ],
-        [
-            InlineKeyboardButton("🔎 Поиск по ИНН", callback_data="inn"),
-            InlineKeyboardButton("👤 Поиск по ФИО", callback_data="fio"),
-        ],
-    ]
-    # Добавляем длинную кнопку профиля
-    profile_row = [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")]
-    keyboard.append(profile_row)
-
-    if user_id == ADMIN_ID:
-        # Админская кнопка под профилем (можно добавить отдельно)
-        keyboard.append([InlineKeyboardButton("🔧 Админ: пополнить запросы", callback_data="admin_add_bonus")])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Что хотите найти?", reply_markup=reply_markup)
     return CHOOSING
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1155,49 +2543,52 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     action = query.data
 
-    user_state[user_id] = action
+    user_record(user_id).action = action
+
+    # Меню на сообщении с результатом не затираем: подсказку шлём отдельным сообщением
+    if query.message.text not in (MENU_TEXT, MENU_TEXT_AGAIN):
+        async def prompt(text):
+            await query.message.reply_text(text)
+    else:
+        prompt = query.edit_message_text
 
     if action == "nick":
-        await query.edit_message_text("Введите ник (например, durov):")
+        await prompt("Введите ник (например, durov):")
         return TYPING_NICK
     elif action == "tgid":
-        await query.edit_message_text("Введите @username (например, @durov):")
+        await prompt("Введите @username (например, @durov):")
         return TYPING_TG_USERNAME
     elif action == "ip":
-        await query.edit_message_text("Введите IP-адрес (например, 8.8.8.8):")
+        await prompt("Введите IP-адрес (например, 8.8.8.8):")
         return TYPING_IP
     elif action == "github_user":
-        await query.edit_message_text("Введите username на GitHub (например, octocat):")
+        await prompt("Введите username на GitHub (например, octocat):")
         return TYPING_GITHUB_USERNAME
     elif action == "email":
-        await query.edit_message_text("Введите email для проверки:")
+        await prompt("Введите email для проверки:")
         return TYPING_EMAIL
     elif action == "domain":
-        await query.edit_message_text("Введите домен (например, example.com):")
+        await prompt("Введите домен (например, example.com):")
         return TYPING_DOMAIN
     elif action == "phone":
-        await query.edit_message_text("Введите номер телефона (например, +79123456789):")
+        await prompt("Введите номер телефона (например, +79123456789):")
         return TYPING_PHONE
     elif action == "mnp":
-        await query.edit_message_text("Введите номер телефона для MNP-поиска (например, +79123456789):")
+        await prompt("Введите номер телефона для MNP-поиска (например, +79123456789):")
         return TYPING_MNP
     elif action == "tiktok":
-        await query.edit_message_text("Введите username TikTok (можно с @ или без):")
+        await prompt("Введите username TikTok (можно с @ или без):")
         return TYPING_TIKTOK_USERNAME
     elif action == "inn":
-        await query.edit_message_text("Введите ИНН (10 или 12 цифр):")
+        await prompt("Введите ИНН (10 или 12 цифр):")
         return TYPING_INN
     elif action == "fio":
-        await query.edit_message_text("Введите ФИО для поиска (например, Иванов Иван Иванович):")
+        await prompt("Введите ФИО для поиска (например, Иванов Иван Иванович):")
         return TYPING_FIO
     elif action == "profile":
         info = get_profile_info(user_id)
         await query.message.reply_text(info, parse_mode='Markdown')
-        profile_keyboard = [
-            [InlineKeyboardButton("💳 Пополнить запросы", callback_data="buy_requests")],
-            [InlineKeyboardButton("👥 Пригласить друга", callback_data="referral_link")],
-        ]
-        await query.message.reply_text("Дополнительные действия:", reply_markup=InlineKeyboardMarkup(profile_keyboard))
+        await query.message.reply_text("Дополнительные действия:", reply_markup=static_assets.keyboard("profile"))
         return await return_to_menu(update)
     elif action == "buy_requests":
         await query.message.reply_text("💳 Покупка запросов находится в разработке. Скоро вы сможете приобрести дополнительные запросы.")
@@ -1216,263 +2607,291 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user_id != ADMIN_ID:
             await query.edit_message_text("⛔ У вас нет прав администратора.")
             return CHOOSING
-        await query.edit_message_text("Введите ID пользователя (число), которому хотите добавить бонусы:")
+        await prompt("Введите ID пользователя (число), которому хотите добавить бонусы:")
         return TYPING_ADMIN_USER_ID
     else:
         await query.edit_message_text("Неизвестное действие.")
         return CHOOSING
 
+# Тип из classifier -> действие; у URL ищется хост
+AUTO_ACTIONS = {"tgid": "tgid", "ip": "ip", "email": "email", "phone": "phone", "inn": "inn",
+                "domain": "domain", "url": "domain", "nick": "nick"}
+AUTO_ROUTE_MIN_CONFIDENCE = 0.5
+AUTO_ROUTED = metrics.Counter("bot_autoroute_total", "Автоопределение типа свободного ввода", ["kind"])
+
+# действие -> (проверка ввода, ответ на ошибку, состояние для повторного ввода)
+INPUT_CHECKS = {
+    "phone": (is_phone, "❌ Некорректный номер. Используйте международный формат, например +79123456789", TYPING_PHONE),
+    "mnp": (is_phone, "❌ Некорректный номер. Используйте международный формат, например +79123456789", TYPING_MNP),
+    "inn": (is_inn, "❌ ИНН должен содержать 10 или 12 цифр с верной контрольной суммой. Попробуйте снова.", TYPING_INN),
+    "fio": (bool, "❌ Введите ФИО для поиска.", TYPING_FIO),
+}
+
 async def handle_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text.strip()
 
     if len(text) > MAX_INPUT_LENGTH:
-        await update.message.reply_text(f"❌ Слишком длинный запрос (макс. {MAX_INPUT_LENGTH} символов).")
+        await show_result(update, f"❌ Слишком длинный запрос (макс. {MAX_INPUT_LENGTH} символов).")
         return await return_to_menu(update)
 
-    if user_id != ADMIN_ID:
-        now = time.time()
-        last = last_request_time.get(user_id, 0)
-        if now - last < MIN_INTERVAL_SECONDS:
-            await update.message.reply_text(f"⏳ Слишком часто. Подождите {MIN_INTERVAL_SECONDS} секунды.")
-            return await return_to_menu(update)
-        last_request_time[user_id] = now
-
-    action = user_state.get(user_id)
+    state = user_record(user_id)
+    action = state.action
 
-    # Если действие не выбрано, пытаемся определить автоматически
+    # Если действие не выбрано, определяем тип ввода; сомнительный текст не уходит в поиск по 400 сайтам
     if action is None:
-        if is_telegram_username(text):
-            action = "tgid"
-        elif is_ip(text):
+        guess = classifier.classify(text)
+        AUTO_ROUTED.inc(guess.kind)
+        if guess.confidence < AUTO_ROUTE_MIN_CONFIDENCE:
+            await show_result(update, "🤔 Не понял, что искать. Выберите тип поиска в меню.")
+            return await return_to_menu(update)
+        text = guess.value
+        action = AUTO_ACTIONS[guess.kind]
+        if guess.kind == "url" and is_ip(text):
             action = "ip"
-        elif is_email(text):
-            action = "email"
-        elif is_phone(text):
-            action = "phone"
-        else:
-            action = "nick"
+
+    if action == "admin_add_bonus":
+        return await admin_bonus_input(update, context, state, text)
+
+    # Проверка ввода — до списания лимитов, чтобы опечатка не стоила запроса
+    check = INPUT_CHECKS.get(action)
+    if check is not None and not check[0](text):
+        await update.message.reply_text(check[1])
+        return check[2]
+
+    tier = load_governor.tier
+    if tier >= governor.ESSENTIAL and action in NETWORK_ONLY_ACTIONS:
+        # Отказываем до списания токенов и дневного лимита
+        LOOKUPS.inc(action, "shed")
+        await show_result(update, "⚠️ Бот перегружен, этот поиск временно недоступен. Попробуйте через пару минут.")
+        return await return_to_menu(update)
+
+    charged = user_id != ADMIN_ID and action in ACTION_WEIGHTS
+    if charged:
+        wait = acquire_rate_limit(state, action)
+        if wait > 0:
+            LOOKUPS.inc(action, "rate_limited")
+            await show_result(update, format_wait(wait))
+            return await return_to_menu(update)
 
     if action not in ["admin_add_bonus", "buy_requests", "referral_link"]:
         if not check_and_increment_limit(user_id):
-            await update.message.reply_text(f"❌ Вы исчерпали дневной лимит ({MAX_REQUESTS_PER_DAY} запросов). Попробуйте завтра или используйте бонусы.")
+            # Отказ по дневному лимиту не должен опустошать ни свою, ни общую корзину
+            if charged:
+                refund_rate_limit(state, action)
+            LOOKUPS.inc(action, "quota")
+            await show_result(update, f"❌ Вы исчерпали дневной лимит ({MAX_REQUESTS_PER_DAY} запросов). Попробуйте завтра или используйте бонусы.")
             return await return_to_menu(update)
 
+    # Новый поиск того же пользователя прерывает предыдущий
+    await cancel_lookup(state, "superseded")
+    lookup = ActiveLookup(action)
+    lookup.task = asyncio.create_task(run_lookup(update, context, lookup, text, tier))
+    lookup.deadline = asyncio.get_running_loop().call_later(LOOKUP_DEADLINE_SECONDS, lookup.cancel, "deadline")
+    lookup.task.add_done_callback(lookup.finished)
+    state.lookup = lookup
+    active_lookups.add(lookup)
+    # Меню покажет задача поиска вместе с результатом; диалог уже сейчас ждёт выбора
+    return CHOOSING
+
+async def admin_bonus_input(update: Update, context: ContextTypes.DEFAULT_TYPE, state: UserRecord, text: str):
+    """Два шага ввода /addbonus из меню: сначала ID пользователя, затем количество."""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("⛔ У вас нет прав администратора.")
+        return await return_to_menu(update)
+    if state.admin_target is None:
+        try:
+            target_id = int(text)
+            state.admin_target = target_id
+            await update.message.reply_text(f"ID пользователя: {target_id}\nТеперь введите количество бонусов (целое положительное число):")
+            return TYPING_ADMIN_AMOUNT
+        except ValueError:
+            await update.message.reply_text("❌ Некорректный ID. Введите число.")
+            return TYPING_ADMIN_USER_ID
+    else:
+        try:
+            amount = int(text)
+            if amount <= 0:
+                await update.message.reply_text("❌ Количество должно быть положительным числом. Введите ещё раз:")
+                return TYPING_ADMIN_AMOUNT
+            target_id, state.admin_target = state.admin_target, None
+            await apply_bonus(update, context, target_id, amount)
+        except ValueError:
+            await update.message.reply_text("❌ Некорректное число. Введите целое положительное число:")
+            return TYPING_ADMIN_AMOUNT
+    return await return_to_menu(update)
+
+async def run_lookup(update: Update, context: ContextTypes.DEFAULT_TYPE, lookup, text: str, tier: int):
+    """Сам поиск; выполняется отдельной задачей, чтобы /cancel и новый запрос могли его прервать."""
+    action, user_id = lookup.action, update.effective_user.id
+    started = time.perf_counter()
+    outcome = "ok"
+    LOOKUPS_IN_FLIGHT.inc()
+    trace = tracing.begin(action, user_id)
+    # Correlation id логов — trace_id: по нему же поиск находится в /trace
+    log_token = jsonlog.bind(trace.trace_id, user_id, action)
+    log.info("поиск %s", action, extra={"event": "lookup.start", "tier": governor.TIER_NAMES[tier]})
+    tier_token = lookup_tier.set(tier)
+    flow_token = http_flow.set(fairqueue.Flow(action, HTTP_FLOW_WEIGHTS.get(action, HTTP_FLOW_WEIGHT_DEFAULT)))
+    shown = []
+    shown_token = lookup_shown.set(shown)
+    notice = None
+    if tier > governor.FULL and action in ("nick", "ip", "email", "phone"):
+        notice = DEGRADED_NOTICE[tier]
+        DEGRADED_LOOKUPS.inc(action, governor.TIER_NAMES[tier])
     try:
         if action == "nick":
-            await update.message.reply_text(f"🔍 Ищу профили с ником '{text}'...")
-            found = await check_social_media(text)
-            if found:
-                items = {name: url for name, url in found}
-                result = format_dict_as_damage(items, title=f"🔍 Найдены профили для '{text}'")
-                if len(result) <= 4096:
-                    await update.message.reply_text(result)
-                else:
-                    for i in range(0, len(result), 4096):
-                        await update.message.reply_text(result[i:i+4096])
+            if tier >= governor.ESSENTIAL:
+                # Без проверки сайтов — только ссылки, которые пользователь откроет сам
+                await show_result(update, Section(f"🔗 Где проверить ник '{text}'", popular_profile_links(text)),
+                                  notice=notice)
             else:
-                await update.message.reply_text("❌ Информация не найдена")
+                await show_status(update, f"🔍 Ищу профили с ником '{text}'...")
+                found = await check_social_media(text)
+                if found:
+                    items = {name: url for name, url in found}
+                    await show_result(update, Section(f"🔍 Найдены профили для '{text}'", items), notice=notice)
+                else:
+                    await show_result(update, "❌ Информация не найдена", notice=notice)
 
         elif action == "tgid":
             username = text.lstrip('@')
-            await update.message.reply_text(f"⏳ Получаю ID для @{username}...")
+            await show_status(update, f"⏳ Получаю ID для @{username}...")
             uid, err = await get_telegram_id(username, context)
             if err:
-                await update.message.reply_text("❌ Информация не найдена")
+                await show_result(update, "❌ Информация не найдена")
             else:
-                await update.message.reply_text(f"✅ ID пользователя @{username}: `{uid}`", parse_mode='Markdown')
+                await show_result(update, f"✅ ID пользователя @{username}: `{uid}`", parse_mode='Markdown')
 
         elif action == "ip":
-            await update.message.reply_text(f"⏳ Выполняю расширенный поиск по IP {text}...")
+            await show_status(update, f"⏳ Выполняю расширенный поиск по IP {text}...")
             info, err = await get_ip_info_combined(text)
             if err:
-                await update.message.reply_text(err)
+                await show_result(update, err)
             else:
-                if len(info) <= 4096:
-                    await update.message.reply_text(info)
-                else:
-                    for i in range(0, len(info), 4096):
-                        await update.message.reply_text(info[i:i+4096])
+                await show_result(update, info, title=f"🌐 Результаты поиска по IP {text}", notice=notice)
 
         elif action == "github_user":
-            await update.message.reply_text(f"⏳ Ищу информацию о пользователе GitHub '{text}'...")
+            await show_status(update, f"⏳ Ищу информацию о пользователе GitHub '{text}'...")
             result, err = await github_find_info_by_username(text)
             if err or not result:
-                await update.message.reply_text("❌ Информация не найдена")
+                await show_result(update, "❌ Информация не найдена")
             else:
-                info = format_dict_as_damage(result, title=f"🐙 GitHub: {text}")
-                await update.message.reply_text(info)
+                await show_result(update, Section(f"🐙 GitHub: {text}", result))
 
         elif action == "email":
-            info, err = await get_email_info_combined(text)
+            info, err, more = await get_email_info_combined(text)
             if err:
-                await update.message.reply_text(err)
+                await show_result(update, err)
             else:
-                if len(info) <= 4096:
-                    await update.message.reply_text(info, disable_web_page_preview=True)
-                else:
-                    for i in range(0, len(info), 4096):
-                        await update.message.reply_text(info[i:i+4096], disable_web_page_preview=True)
+                await show_result(update, info, disable_web_page_preview=True, more=more, notice=notice)
 
         elif action == "domain":
-            await update.message.reply_text(f"⏳ Проверяю домен {text}...")
-            async with aiohttp.ClientSession() as session:
-                tasks = [
-                    search_hudson_domain(session, text),
-                    search_leakcheck(session, text),
-                    search_psbdmp_domain(session, text)
-                ]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-            hudson, leakcheck, psbdmp = results[:3]
-            result_parts = []
-            for res in [hudson, leakcheck, psbdmp]:
-                if res and isinstance(res, str) and not res.startswith("❌"):
-                    result_parts.append(res)
-            if not result_parts:
-                await update.message.reply_text("❌ Информация не найдена")
+            await show_status(update, f"⏳ Проверяю домен {text}...")
+            info, err = await get_domain_info_combined(text)
+            if err:
+                await show_result(update, err)
             else:
-                await update.message.reply_text("🌍 **Результаты поиска по домену**", parse_mode='Markdown')
-                for part in result_parts:
-                    if len(part) <= 4096:
-                        await update.message.reply_text(part, disable_web_page_preview=True)
-                    else:
-                        for i in range(0, len(part), 4096):
-                            await update.message.reply_text(part[i:i+4096], disable_web_page_preview=True)
+                await show_result(update, info, title=f"🌍 Результаты поиска по домену {text}",
+                                  disable_web_page_preview=True)
 
         elif action == "phone":
-            if not is_phone(text):
-                await update.message.reply_text("❌ Некорректный номер. Используйте международный формат, например +79123456789")
-                return TYPING_PHONE
-            await update.message.reply_text(f"⏳ Анализирую номер {text}...")
+            await show_status(update, f"⏳ Анализирую номер {text}...")
             info, err = await get_phone_info_combined(text)
             if err:
-                await update.message.reply_text("❌ Информация не найдена")
+                await show_result(update, "❌ Информация не найдена", notice=notice)
             else:
-                if len(info) <= 4096:
-                    await update.message.reply_text(info, parse_mode='Markdown')
-                else:
-                    for i in range(0, len(info), 4096):
-                        await update.message.reply_text(info[i:i+4096], parse_mode='Markdown')
+                await show_result(update, info, title=f"📞 Результаты по номеру {text}", parse_mode='Markdown',
+                                  notice=notice)
 
         elif action == "mnp":
-            if not is_phone(text):
-                await update.message.reply_text("❌ Некорректный номер. Используйте международный формат, например +79123456789")
-                return TYPING_MNP
-            await update.message.reply_text(f"⏳ Ищу MNP для номера {text}...")
+            await show_status(update, f"⏳ Ищу MNP для номера {text}...")
             info, err = await get_mnp_info(text)
             if err:
-                await update.message.reply_text(err)
+                await show_result(update, err)
             else:
-                if len(info) <= 4096:
-                    await update.message.reply_text(info, parse_mode='Markdown')
-                else:
-                    for i in range(0, len(info), 4096):
-                        await update.message.reply_text(info[i:i+4096], parse_mode='Markdown')
+                await show_result(update, info, parse_mode='Markdown')
 
         elif action == "tiktok":
-            await update.message.reply_text(f"⏳ Ищу информацию о TikTok пользователе @{text.lstrip('@')}...")
+            await show_status(update, f"⏳ Ищу информацию о TikTok пользователе @{text.lstrip('@')}...")
             result = await get_tiktok_info(text)
             if not result:
-                await update.message.reply_text("❌ Информация не найдена")
+                await show_result(update, "❌ Информация не найдена")
             else:
-                if len(result) <= 4096:
-                    await update.message.reply_text(result, parse_mode='Markdown', disable_web_page_preview=True)
-                else:
-                    for i in range(0, len(result), 4096):
-                        await update.message.reply_text(result[i:i+4096], parse_mode='Markdown', disable_web_page_preview=True)
+                await show_result(update, result, parse_mode='Markdown', disable_web_page_preview=True)
 
         elif action == "inn":
-            if not is_inn(text):
-                await update.message.reply_text("❌ ИНН должен содержать 10 или 12 цифр. Попробуйте снова.")
-                return TYPING_INN
-            await update.message.reply_text(f"⏳ Ищу информацию по ИНН {text}...")
+            await show_status(update, f"⏳ Ищу информацию по ИНН {text}...")
             info, err = await get_inn_info(text)
             if err:
-                await update.message.reply_text(err)
+                await show_result(update, err)
             else:
-                if len(info) <= 4096:
-                    await update.message.reply_text(info, parse_mode='Markdown')
-                else:
-                    for i in range(0, len(info), 4096):
-                        await update.message.reply_text(info[i:i+4096], parse_mode='Markdown')
+                await show_result(update, info, parse_mode='Markdown')
 
         elif action == "fio":
-            if not text:
-                await update.message.reply_text("❌ Введите ФИО для поиска.")
-                return TYPING_FIO
-            await update.message.reply_text(f"⏳ Формирую ссылки для поиска по ФИО '{text}'...")
+            await show_status(update, f"⏳ Формирую ссылки для поиска по ФИО '{text}'...")
             info, err = await get_fio_info(text)
             if err:
-                await update.message.reply_text(err)
-            else:
-                await update.message.reply_text(info, parse_mode='Markdown', disable_web_page_preview=True)
-
-        elif action == "admin_add_bonus":
-            if user_id != ADMIN_ID:
-                await update.message.reply_text("⛔ У вас нет прав администратора.")
-                return await return_to_menu(update)
-            if "admin_target_id" not in context.user_data:
-                try:
-                    target_id = int(text)
-                    context.user_data["admin_target_id"] = target_id
-                    await update.message.reply_text(f"ID пользователя: {target_id}\nТеперь введите количество бонусов (целое положительное число):")
-                    return TYPING_ADMIN_AMOUNT
-                except ValueError:
-                    await update.message.reply_text("❌ Некорректный ID. Введите число.")
-                    return TYPING_ADMIN_USER_ID
+                await show_result(update, err)
             else:
-                try:
-                    amount = int(text)
-                    if amount <= 0:
-                        await update.message.reply_text("❌ Количество должно быть положительным числом. Введите ещё раз:")
-                        return TYPING_ADMIN_AMOUNT
-                    target_id = context.user_data.pop("admin_target_id")
-                    await apply_bonus(update, context, target_id, amount)
-                except ValueError:
-                    await update.message.reply_text("❌ Некорректное число. Введите целое положительное число:")
-                    return TYPING_ADMIN_AMOUNT
+                await show_result(update, info, parse_mode='Markdown', disable_web_page_preview=True)
 
         else:
-            await update.message.reply_text("Неизвестная команда.")
-
+            await show_result(update, "Неизвестная команда.")
+
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        reason = lookup.reason or "shutdown"
+        LOOKUPS_CANCELLED.inc(action, reason)
+        # Сколько поиск ещё работал бы — оценка по медиане времени этого действия
+        elapsed, median = time.perf_counter() - started, LOOKUP_SECONDS.quantile(0.5, action)
+        if median is not None and median > elapsed:
+            CANCEL_SAVED_SECONDS.inc(action, amount=median - elapsed)
+        if reason == "shutdown":
+            raise
+        # После /cancel сообщение и меню показывает сам обработчик команды
+        if reason == "deadline":
+            await show_result(update, f"⌛ Поиск не уложился в {LOOKUP_DEADLINE_SECONDS} с и остановлен. Попробуйте позже.")
+        elif reason == "superseded":
+            await show_result(update, "⏹ Поиск прерван новым запросом.")
     except Exception as e:
+        outcome = "error"
+        log.exception("ошибка поиска %s", action, extra={"event": "lookup.error"})
         safe_send_admin(update, context, f"Ошибка в действии {action}: {e}")
-        await update.message.reply_text("❌ Внутренняя ошибка. Попробуйте позже.")
-
-    return await return_to_menu(update)
+        await show_result(update, "❌ Внутренняя ошибка. Попробуйте позже.")
+    finally:
+        LOOKUPS_IN_FLIGHT.dec()
+        if outcome != "cancelled":
+            # Прерванные поиски исказили бы медиану, по которой оценивается сэкономленное время
+            LOOKUP_SECONDS.observe(time.perf_counter() - started, action)
+        LOOKUPS.inc(action, outcome)
+        tracing.finish(trace, outcome=outcome, tier=governor.TIER_NAMES[tier])
+        lookup_tier.reset(tier_token)
+        http_flow.reset(flow_token)
+        lookup_shown.reset(shown_token)
+        if outcome == "ok" and shown:
+            # Последнее показанное — итог поиска; догрузка страниц (more) в историю не попадает
+            lookup_history.add(user_id, action, text, *shown[-1])
+        log.info("поиск %s: %s", action, outcome, extra={
+            "event": "lookup.finish", "outcome": outcome, "reason": lookup.reason,
+            "ms": round((time.perf_counter() - started) * 1000, 1)})
+        jsonlog.unbind(log_token)
+
+    if outcome != "cancelled":
+        await return_to_menu(update)
 
 async def return_to_menu(update: Update):
-    user_id = update.effective_user.id
-    keyboard = [
-        [
-            InlineKeyboardButton("🔍 Поиск по нику", callback_data="nick"),
-            InlineKeyboardButton("🆔 Telegram ID", callback_data="tgid"),
-            InlineKeyboardButton("🐙 GitHub", callback_data="github_user"),
-        ],
-        [
-            InlineKeyboardButton("🌐 Поиск по IP", callback_data="ip"),
-            InlineKeyboardButton("📧 Поиск по email", callback_data="email"),
-            InlineKeyboardButton("🌍 Поиск по домену", callback_data="domain"),
-        ],
-        [
-            InlineKeyboardButton("📞 Поиск по номеру", callback_data="phone"),
-            InlineKeyboardButton("🔄 Поиск MNP", callback_data="mnp"),
-            InlineKeyboardButton("🎵 TikTok", callback_data="tiktok"),
-        ],
-        [
-            InlineKeyboardButton("🔎 Поиск по ИНН", callback_data="inn"),
-            InlineKeyboardButton("👤 Поиск по ФИО", callback_data="fio"),
-        ],
-        [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")],
-    ]
-    if user_id == ADMIN_ID:
-        keyboard.append([InlineKeyboardButton("🔧 Админ: пополнить запросы", callback_data="admin_add_bonus")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Что хотите найти ещё?", reply_markup=reply_markup)
+    # Если панель уже показала меню в ответ на этот апдейт — повторно ничего не отправляем
+    panel = chat_panels.get(update.effective_chat.id)
+    if panel and panel.update_id == update.update_id:
+        return CHOOSING
+    message = await update.effective_message.reply_text(MENU_TEXT_AGAIN, reply_markup=menu_markup(update.effective_user.id))
+    chat_panels[update.effective_chat.id] = Panel(message.message_id, update.update_id)
     return CHOOSING
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Действие отменено.")
+    await cancel_lookup(user_record(update.effective_user.id), "cancel")
+    await show_result(update, "Действие отменено.")
     return await return_to_menu(update)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1482,7 +2901,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Определять ID пользователя Telegram по @username\n"
         "• Показывать подробную информацию по IP (несколько источников)\n"
         "• Искать данные пользователя GitHub по username\n"
-        "• Искать по email (множество источников, включая AbstractAPI)\n"
+        "• Искать по email (множество источников, проверка почтового домена)\n"
         "• Искать информацию по домену\n"
         "• Анализировать номер телефона (htmlweb.ru + Veriphone + phoneradar.ru)\n"
         "• Искать MNP (переносимость номера)\n"
@@ -1499,14 +2918,113 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     info = get_profile_info(user_id)
     await update.message.reply_text(info, parse_mode='Markdown')
-    profile_keyboard = [
-        [InlineKeyboardButton("💳 Пополнить запросы", callback_data="buy_requests")],
-        [InlineKeyboardButton("👥 Пригласить друга", callback_data="referral_link")],
-    ]
-    await update.message.reply_text("Дополнительные действия:", reply_markup=InlineKeyboardMarkup(profile_keyboard))
+    await update.message.reply_text("Дополнительные действия:", reply_markup=static_assets.keyboard("profile"))
+
+# ---------- Холодный старт и прогрев ----------
+# Бюджет от запуска процесса до начала опроса апдейтов; превышение печатается при старте
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', '1.5'))
+STARTUP_SECONDS = metrics.Gauge("bot_startup_seconds", "От запуска процесса до этапа: ready или first_update", ["stage"])
+WARMUP_SECONDS = metrics.Gauge("bot_warmup_seconds", "Длительность шагов прогрева после запуска", ["step"])
+# Модули, которые импортируются при первом использовании; прогрев подгружает их в потоке заранее
+LAZY_MODULES = ("phonenumbers", "phonenumbers.carrier", "phonenumbers.geocoder", "phonenumbers.timezone", "bs4")
+# Хосты самых частых источников: прогрев заполняет DNS-кэш и открывает к ним соединения
+WARMUP_URLS = (
+    "https://cavalier.hudsonrock.com/", "https://leakcheck.net/", "https://api.proxynova.com/",
+    "https://psbdmp.ws/", "https://htmlweb.ru/", "https://api.veriphone.io/", "http://ip-api.com/",
+    "https://ipinfo.io/", "https://ipwhois.app/", "https://api.github.com/", "https://dns.google/",
+)
+_first_update_seen = False
 
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+async def warm_connections():
+    token = current_source.set("Прогрев")
+    try:
+        async with http_session() as session:
+            async def touch(url):
+                try:
+                    async with session.head(url, timeout=source_timeout(5)) as resp:
+                        await resp.release()
+                except Exception as e:
+                    record_error(e)
+            await asyncio.gather(*(touch(url) for url in WARMUP_URLS))
+    finally:
+        current_source.reset(token)
+
+def import_lazy_modules():
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+
+async def timed_step(step: str, coro):
+    started = time.perf_counter()
+    try:
+        await coro
+    except Exception:
+        log.warning("прогрев: шаг %s не удался", step, exc_info=True, extra={"event": "warmup.failed", "step": step})
+    WARMUP_SECONDS.set(time.perf_counter() - started, step)
+
+async def warmup(context: ContextTypes.DEFAULT_TYPE):
+    """Справочники, манифест и соединения — параллельно, пока бот уже отвечает; затем тяжёлые модули."""
+    started = time.perf_counter()
+    await asyncio.gather(
+        timed_step("username_index", load_username_index()),
+        timed_step("site_stats", load_site_reliability()),
+        timed_step("registrations", load_registrations()),
+        timed_step("email_domains", get_email_domains()),
+        timed_step("sherlock_manifest", sherlock_manifest()),
+        timed_step("connections", warm_connections()),
+        timed_step("assets", static_assets.prepare()),
+    )
+    # Импорт держит GIL — запускаем его последним, когда сетевые шаги уже не ждут event loop
+    await timed_step("imports", asyncio.to_thread(import_lazy_modules))
+    WARMUP_SECONDS.set(time.perf_counter() - started, "total")
+
+def mark_first_update():
+    global _first_update_seen
+    if not _first_update_seen:
+        _first_update_seen = True
+        STARTUP_SECONDS.set(time.monotonic() - PROCESS_STARTED, "first_update")
+
+async def post_init(application: Application):
+    UPDATE_QUEUE_DEPTH.function = application.update_queue.qsize
+    watchdog = loopwatch.LoopWatchdog(threshold=LOOP_LAG_THRESHOLD)
+    watchdog.start()
+    application.bot_data["loop_watchdog"] = watchdog
+    if METRICS_PORT:
+        application.bot_data["metrics_runner"] = await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+    application.job_queue.run_once(warmup, 0)
+    ready = time.monotonic() - PROCESS_STARTED
+    STARTUP_SECONDS.set(ready, "ready")
+    if ready > STARTUP_BUDGET_SECONDS:
+        log.warning("запуск занял %.2f с при бюджете %g с", ready, STARTUP_BUDGET_SECONDS,
+                    extra={"event": "startup.over_budget", "seconds": round(ready, 3)})
+
+async def post_shutdown(application: Application):
+    for lookup in list(active_lookups):
+        lookup.cancel("shutdown")
+    if active_lookups:
+        await asyncio.wait({lookup.task for lookup in active_lookups}, timeout=5)
+    watchdog = application.bot_data.pop("loop_watchdog", None)
+    if watchdog is not None:
+        await watchdog.stop()
+    runner = application.bot_data.pop("metrics_runner", None)
+    if runner is not None:
+        await runner.cleanup()
+    await close_http_session()
+    await save_username_index()
+    await save_site_reliability()
+    await compact_registrations()
+
+def build_application(token: str = BOT_TOKEN, base_url: Optional[str] = None) -> Application:
+    """Собирает Application со всеми обработчиками; base_url подменяет Bot API (нагрузочный тест)."""
+    builder = (
+        Application.builder()
+        .token(token)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
@@ -1529,14 +3047,48 @@ def main():
         fallbacks=[CommandHandler('cancel', cancel)],
     )
 
+    # Группа -1 видит каждый апдейт до остальных обработчиков и ничего не блокирует
+    application.add_handler(TypeHandler(Update, observe_update), group=-1)
+    # Листание страниц должно срабатывать раньше CallbackQueryHandler внутри диалога
+    application.add_handler(CallbackQueryHandler(page_handler, pattern=r"^pg:"))
+    application.add_handler(CallbackQueryHandler(history_handler, pattern=r"^hist(:|$)"))
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler('help', help_command))
     application.add_handler(CommandHandler('addbonus', add_bonus))
+    application.add_handler(CommandHandler('limits', limits_command))
+    application.add_handler(CommandHandler('trace', trace_command))
+    application.add_handler(CommandHandler('loop', loop_command))
+    application.add_handler(CommandHandler('timeouts', timeouts_command))
+    application.add_handler(CommandHandler('emailindex', emailindex_command))
+    application.add_handler(CommandHandler('tgindex', tgindex_command))
+    application.add_handler(CommandHandler('sites', sites_command))
     application.add_handler(CommandHandler('profile', profile_command))
+    # /cancel вне диалога (например, после перезапуска бота) тоже прерывает поиск
+    application.add_handler(CommandHandler('cancel', cancel))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_input))
 
-    print("Бот запущен и готов к работе (финальная версия с поиском по ФИО)")
-    application.run_polling()
+    # Периодическая чистка простаивающих записей в памяти
+    application.job_queue.run_repeating(sweep_state, interval=STATE_SWEEP_INTERVAL_SECONDS,
+                                        first=STATE_SWEEP_INTERVAL_SECONDS)
+    # Регулятор нагрузки пересматривает уровень обслуживания раз в секунду
+    application.job_queue.run_repeating(govern_load, interval=1, first=1)
+    application.job_queue.run_repeating(save_username_index, interval=USERNAME_INDEX_SAVE_SECONDS,
+                                        first=USERNAME_INDEX_SAVE_SECONDS)
+    application.job_queue.run_repeating(save_site_reliability, interval=SITE_STATS_SAVE_SECONDS,
+                                        first=SITE_STATS_SAVE_SECONDS)
+    if SITE_CONTROL_INTERVAL_SECONDS:
+        application.job_queue.run_repeating(control_probe_sites, interval=SITE_CONTROL_INTERVAL_SECONDS,
+                                            first=SITE_CONTROL_INTERVAL_SECONDS)
+    return application
+
+def main():
+    jsonlog.setup(LOG_PATH, LOG_LEVEL, LOG_CONSOLE_LEVEL, LOG_SAMPLE_RATES, loggers=("bot", "governor"))
+    application = build_application()
+    log.info("бот запущен и готов к работе", extra={"event": "startup"})
+    try:
+        application.run_polling()
+    finally:
+        jsonlog.shutdown()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
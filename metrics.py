@@ -0,0 +1,147 @@
+"""Метрики в текстовом формате Prometheus и HTTP-эндпоинт /metrics.
+
+Запись метрики — это поиск по словарю и сложение, без блокировок:
+всё обновляется из одного event loop.
+"""
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Значение задаётся set()/inc()/dec() или считается функцией в момент выгрузки."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, *labelvalues):
+        self._values[labelvalues] = value
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                self._values[()] = self.function()
+            except Exception:
+                pass
+        yield from super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [счётчики по корзинам..., +Inf, сумма]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        data = self._values.get(labelvalues)
+        if data is None:
+            data = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def count(self, *labelvalues):
+        data = self._values.get(labelvalues)
+        return sum(data[:-1]) if data else 0
+
+    def quantile(self, q, *labelvalues):
+        """Оценка квантиля по корзинам (верхняя граница корзины), None — если наблюдений нет."""
+        data = self._values.get(labelvalues)
+        if not data:
+            return None
+        total = sum(data[:-1])
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, hits in zip(self.buckets + (float("inf"),), data):
+            seen += hits
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        for labelvalues, data in self._values.items():
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), data):
+                cumulative += hits
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(data[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}"
+
+
+def exposition() -> str:
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_metrics(request):
+    from aiohttp import web
+    return web.Response(text=exposition(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_http_server(host: str, port: int):
+    """Возвращает web.AppRunner; aiohttp.web импортируется здесь — без /metrics он не нужен."""
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
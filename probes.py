@@ -0,0 +1,168 @@
+"""План проверки ника по манифесту Sherlock.
+
+Для каждого сайта манифест говорит, как отличить существующий профиль:
+errorType status_code — по коду ответа, message — по тексту ошибки на
+странице (errorMsg), response_url — по редиректу на страницу ошибки.
+regexCheck описывает допустимые ники: если ник ему не подходит, профиля
+там быть не может и запрос не нужен.
+
+Отсюда план: сайты с неподходящим ником пропускаются; status_code —
+HEAD; response_url — GET без редиректов, тело не читается; message —
+GET с чтением по кускам до первого errorMsg или до MAX_BODY_BYTES.
+"""
+import functools
+import re
+from dataclasses import dataclass, field
+
+HEAD, GET = "HEAD", "GET"
+FOUND, ABSENT, BLOCKED = "found", "absent", "blocked"
+# Коды, которыми сайты отвечают ботам и превышению частоты; 999 — LinkedIn
+BLOCK_STATUSES = frozenset((403, 429, 503, 999))
+MAX_BODY_BYTES = 256 * 1024
+CHUNK_BYTES = 16 * 1024
+
+
+@dataclass(slots=True)
+class Probe:
+    name: str
+    url: str                    # ссылка на профиль для ответа пользователю
+    probe_url: str              # куда идёт запрос (urlProbe, если задан)
+    method: str
+    kind: str                   # status_code, message или response_url
+    error_msgs: tuple = ()      # errorMsg в байтах
+    error_codes: tuple = ()
+
+
+@dataclass(slots=True)
+class ScanStats:
+    """Итоги одного поиска по нику: сколько запросов и байт сэкономил план."""
+    sites: int = 0
+    skipped_regex: int = 0
+    head: int = 0
+    get: int = 0
+    bytes_read: int = 0
+    bytes_saved: int = 0        # по Content-Length: объявленный размер минус прочитанное
+    early_exit: int = 0
+    by_kind: dict = field(default_factory=dict)
+
+    @property
+    def requests(self) -> int:
+        return self.head + self.get
+
+
+@functools.lru_cache(maxsize=1024)
+def _regex(pattern: str):
+    try:
+        return re.compile(pattern)
+    except re.error:
+        return None
+
+
+def _as_tuple(value) -> tuple:
+    if value is None:
+        return ()
+    return tuple(value) if isinstance(value, list) else (value,)
+
+
+def nick_allowed(site: dict, nick: str) -> bool:
+    pattern = site.get("regexCheck")
+    if not pattern:
+        return True
+    regex = _regex(pattern)
+    # Сломанная регулярка в манифесте — не повод терять сайт
+    return regex is None or regex.search(nick) is not None
+
+
+def plan(manifest: dict, nick: str, stats: ScanStats = None):
+    """Список Probe по манифесту; сайты, которым ник не подходит, только считаются в stats."""
+    probes = []
+    for name, site in manifest.items():
+        if not isinstance(site, dict) or not site.get("url"):
+            continue
+        if stats is not None:
+            stats.sites += 1
+        if not nick_allowed(site, nick):
+            if stats is not None:
+                stats.skipped_regex += 1
+            continue
+        url = site["url"].replace("{}", nick)
+        probe_url = (site.get("urlProbe") or site["url"]).replace("{}", nick)
+        kinds = _as_tuple(site.get("errorType")) or ("status_code",)
+        messages = tuple(m.encode() for m in _as_tuple(site.get("errorMsg")) if m) if "message" in kinds else ()
+        if messages:
+            probes.append(Probe(name, url, probe_url, GET, "message", error_msgs=messages))
+        elif "response_url" in kinds:
+            probes.append(Probe(name, url, probe_url, GET, "response_url"))
+        else:
+            probes.append(Probe(name, url, probe_url, HEAD, "status_code",
+                                error_codes=tuple(int(c) for c in _as_tuple(site.get("errorCode")))))
+    return probes
+
+
+def plain_probes(sites: dict):
+    """Запасной список без манифеста: HEAD по ссылке профиля, как раньше."""
+    return [Probe(name, url, url, HEAD, "status_code") for name, url in sites.items()]
+
+
+def _status_outcome(status: int, error_codes: tuple = ()) -> str:
+    if status in error_codes:
+        return ABSENT
+    if status in BLOCK_STATUSES:
+        return BLOCKED
+    return FOUND if 200 <= status < 300 else ABSENT
+
+
+async def run_probe(session, probe: Probe, stats: ScanStats, **kwargs) -> str:
+    """Выполняет probe; FOUND, ABSENT или BLOCKED (сайт не пустил)."""
+    kind_stats = stats.by_kind.setdefault(probe.kind, [0, 0])
+    kind_stats[0] += 1
+    if probe.method == HEAD:
+        stats.head += 1
+        async with session.head(probe.probe_url, allow_redirects=True, **kwargs) as resp:
+            stats.bytes_saved += resp.content_length or 0
+            outcome = _status_outcome(resp.status, probe.error_codes)
+    elif probe.kind == "response_url":
+        stats.get += 1
+        # Страница ошибки отдаётся редиректом: хватает кода ответа, тело не нужно
+        async with session.get(probe.probe_url, allow_redirects=False, **kwargs) as resp:
+            stats.bytes_saved += resp.content_length or 0
+            outcome = _status_outcome(resp.status)
+            resp.close()
+    else:
+        stats.get += 1
+        async with session.get(probe.probe_url, allow_redirects=True, **kwargs) as resp:
+            if resp.status >= 400:
+                stats.bytes_saved += resp.content_length or 0
+                resp.close()
+                outcome = _status_outcome(resp.status)
+            else:
+                outcome = FOUND if await _read_until_error(resp, probe.error_msgs, stats) else ABSENT
+    if outcome == FOUND:
+        kind_stats[1] += 1
+    return outcome
+
+
+async def _read_until_error(resp, messages: tuple, stats: ScanStats) -> bool:
+    """Читает тело кусками; False на первом же errorMsg. Сообщение может лежать на стыке кусков."""
+    overlap = max(len(m) for m in messages) - 1
+    tail = b""
+    read = 0
+    while read < MAX_BODY_BYTES:
+        chunk = await resp.content.read(CHUNK_BYTES)
+        if not chunk:
+            return True
+        read += len(chunk)
+        stats.bytes_read += len(chunk)
+        window = tail + chunk
+        if any(m in window for m in messages):
+            if resp.content_length:
+                stats.bytes_saved += max(0, resp.content_length - read)
+            stats.early_exit += 1
+            resp.close()
+            return False
+        tail = window[-overlap:] if overlap else b""
+    # Дальше MAX_BODY_BYTES не читаем: текста ошибки в начале страницы нет — считаем профиль найденным
+    if resp.content_length:
+        stats.bytes_saved += max(0, resp.content_length - read)
+    resp.close()
+    return True
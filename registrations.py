@@ -0,0 +1,116 @@
+"""Кто из пользователей уже зарегистрирован (заводил лимиты) — для реферальной программы.
+
+Запись пользователя в users вытесняется после простоя, а регистрация должна
+это пережить: иначе вернувшийся считался бы новым и снова приносил бы
+рефереру бонус. Поэтому она хранится отдельно и компактно: отсортированный
+array('q') id и параллельный array('H') дней последней активности — 10 байт
+на пользователя. Новые id копятся в небольшом словаре pending и вливаются
+в массивы при compact(). Регистрация, не подтверждённая ttl_days дней,
+забывается, так что хранятся только пользователи, активные за этот срок.
+
+На диске — zlib-сжатые байты массивов; файл перезаписывается целиком через
+временный, чтобы обрыв записи не портил прежний снимок.
+"""
+import bisect
+import os
+import zlib
+from array import array
+from datetime import date
+
+# Дни хранятся смещением от этой даты, чтобы влезть в 2 байта
+EPOCH = date(2020, 1, 1).toordinal()
+
+
+class Registrations:
+    def __init__(self, path: str = None, ttl_days: int = 365):
+        self.path = path
+        self.ttl_days = ttl_days
+        self._ids = array("q")
+        self._days = array("H")
+        self._pending = {}          # id -> день; отметки, ещё не влитые в массивы
+        self._compacting = False    # массивы копирует compact() в потоке: менять их на месте нельзя
+        self.dirty = False
+        self.loaded = False         # снимок с диска прочитан; до этого save() затёр бы его
+
+    def __len__(self) -> int:
+        return len(self._ids) + sum(1 for user_id in self._pending if self._find(user_id) < 0)
+
+    def _find(self, user_id: int) -> int:
+        i = bisect.bisect_left(self._ids, user_id)
+        return i if i < len(self._ids) and self._ids[i] == user_id else -1
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._pending or self._find(user_id) >= 0
+
+    def mark(self, user_id: int, day: int):
+        """Регистрирует пользователя или продлевает регистрацию; day — ordinal даты."""
+        day -= EPOCH
+        i = -1 if self._compacting else self._find(user_id)
+        if i >= 0:
+            if self._days[i] != day:
+                self._days[i] = day
+                self.dirty = True
+        elif self._pending.get(user_id) != day:
+            self._pending[user_id] = day
+            self.dirty = True
+
+    def merge(self, newer: "Registrations"):
+        """Накладывает отметки, сделанные, пока снимок читался с диска."""
+        for user_id, day in newer._pending.items():
+            self.mark(user_id, day + EPOCH)
+
+    def snapshot(self):
+        """Копии для compacted() в потоке; отметки, сделанные после, остаются в pending до install()."""
+        self._compacting = True
+        return self._ids[:], self._days[:], dict(self._pending)
+
+    @staticmethod
+    def compacted(ids, days, pending: dict, today: int, ttl_days: int):
+        """Массивы с влитыми pending и без устаревших регистраций; чистая функция для потока."""
+        cutoff = today - EPOCH - ttl_days
+        keep = [(user_id, day) for user_id, day in zip(ids, days) if day >= cutoff and user_id not in pending]
+        keep += [(user_id, day) for user_id, day in pending.items() if day >= cutoff]
+        keep.sort()
+        return array("q", [user_id for user_id, _ in keep]), array("H", [day for _, day in keep])
+
+    def install(self, ids, days, pending: dict):
+        """Ставит результат compacted(); pending — то, что было в snapshot()."""
+        self._ids, self._days = ids, days
+        # Новый словарь, а не del: после удаления dict не отдаёт память под таблицу
+        self._pending = {user_id: day for user_id, day in self._pending.items() if pending.get(user_id) != day}
+        self._compacting = False
+
+    def abort(self):
+        """compacted() не доработал: массивы прежние, pending не тронут, снимок ещё не записан."""
+        self._compacting = False
+        self.dirty = True
+
+    def compact(self, today: int):
+        """Снимок, сжатие и установка разом в текущем потоке — для тестов и бенчмарков."""
+        pending = self.snapshot()[2]
+        self.install(*self.compacted(self._ids, self._days, pending, today, self.ttl_days), pending)
+
+    @staticmethod
+    def pack(ids, days) -> bytes:
+        return zlib.compress(len(ids).to_bytes(8, "little") + ids.tobytes() + days.tobytes(), 6)
+
+    def save(self, payload: bytes):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path: str, ttl_days: int = 365) -> "Registrations":
+        registrations = cls(path, ttl_days)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                raw = zlib.decompress(f.read())
+            count = int.from_bytes(raw[:8], "little")
+            registrations._ids.frombytes(raw[8:8 + 8 * count])
+            registrations._days.frombytes(raw[8 + 8 * count:])
+        registrations.loaded = True
+        return registrations
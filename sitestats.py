@@ -0,0 +1,218 @@
+"""Надёжность сайтов Sherlock по истории проверок.
+
+Для каждого сайта копятся скользящие (экспоненциально сглаженные) оценки:
+задержка ответа, доля таймаутов, доля блокировок (403/429/503 и т.п.) и
+доля «найден» для контрольных ников — случайных строк, которых заведомо
+ни у кого нет. Сайт, отвечающий «найден» на такой ник, — источник ложных
+срабатываний.
+
+По этим оценкам:
+- сайты упорядочиваются: сначала надёжные и быстрые;
+- сайт, который чаще половины раз не отвечает или блокирует, уходит в
+  карантин на QUARANTINE_SECONDS, при повторе — вдвое дольше;
+- сайт с долей ложных «найден» от FALSE_POSITIVE_RATE исключается, пока
+  контрольные проверки не покажут обратное.
+
+Карантин хранится в wall-clock времени, чтобы переживать перезапуск.
+"""
+import json
+import os
+import time
+
+from probes import ABSENT, BLOCKED, FOUND
+
+ALPHA = 0.1                 # вес нового замера в сглаженных долях
+LATENCY_ALPHA = 0.2
+CONTROL_ALPHA = 0.2
+MIN_PROBES = 10             # раньше доли не учитываются
+MIN_CONTROLS = 5
+QUARANTINE_FAILURE_RATE = 0.5
+QUARANTINE_SECONDS = 1800
+QUARANTINE_MAX_SECONDS = 86400
+FALSE_POSITIVE_RATE = 0.8
+DEFAULT_LATENCY = 1.0       # оценка для сайта без замеров: в середину очереди
+
+TIMEOUT, ERROR = "timeout", "error"
+
+
+class SiteStats:
+    __slots__ = ("latency", "probes", "timeout_rate", "block_rate", "controls", "false_positive_rate",
+                 "quarantined_until", "strikes")
+
+    def __init__(self, latency=None, probes=0, timeout_rate=0.0, block_rate=0.0, controls=0,
+                 false_positive_rate=0.0, quarantined_until=0.0, strikes=0):
+        self.latency = latency
+        self.probes = probes
+        self.timeout_rate = timeout_rate
+        self.block_rate = block_rate
+        self.controls = controls
+        self.false_positive_rate = false_positive_rate
+        self.quarantined_until = quarantined_until
+        self.strikes = strikes
+
+    @property
+    def failure_rate(self) -> float:
+        return self.timeout_rate + self.block_rate if self.probes >= MIN_PROBES else 0.0
+
+    @property
+    def false_positive(self) -> bool:
+        return self.controls >= MIN_CONTROLS and self.false_positive_rate >= FALSE_POSITIVE_RATE
+
+    def absorb(self, fresh: "SiteStats"):
+        """Дописывает замеры fresh, начатые с нуля, после своих — как если бы они шли следом.
+
+        Сглаженная доля, начатая с нуля, — это сумма вкладов своих замеров;
+        прежняя за n новых замеров затухает в (1 - ALPHA) ** n раз. Задержку
+        fresh начинает с первого замера, поэтому для неё это приближение.
+        """
+        if fresh.quarantined_until > self.quarantined_until:
+            # fresh успел отправить сайт в карантин и начал доли заново: прежние уже не нужны
+            self.probes, self.timeout_rate, self.block_rate = fresh.probes, fresh.timeout_rate, fresh.block_rate
+            since = fresh.quarantined_until - min(QUARANTINE_MAX_SECONDS, QUARANTINE_SECONDS * 2 ** (fresh.strikes - 1))
+            self.strikes += fresh.strikes
+            self.quarantined_until = since + min(QUARANTINE_MAX_SECONDS, QUARANTINE_SECONDS * 2 ** (self.strikes - 1))
+        else:
+            decay = (1 - ALPHA) ** fresh.probes
+            self.timeout_rate = self.timeout_rate * decay + fresh.timeout_rate
+            self.block_rate = self.block_rate * decay + fresh.block_rate
+            self.probes += fresh.probes
+        if fresh.latency is not None:
+            decay = (1 - LATENCY_ALPHA) ** max(1, fresh.probes) if self.latency is not None else 0.0
+            self.latency = (self.latency or 0.0) * decay + fresh.latency * (1 - decay)
+        decay = (1 - CONTROL_ALPHA) ** fresh.controls
+        self.false_positive_rate = self.false_positive_rate * decay + fresh.false_positive_rate
+        self.controls += fresh.controls
+
+    def score(self) -> float:
+        """Чем больше, тем раньше проверять: доля полезных ответов на секунду ожидания."""
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return (1.0 - min(1.0, self.failure_rate)) / (latency + 0.1)
+
+
+class SiteReliability:
+    def __init__(self, path: str = None):
+        self.path = path
+        self.sites = {}
+        self.dirty = False
+        self.loaded = False
+
+    def _get(self, name: str) -> SiteStats:
+        stats = self.sites.get(name)
+        if stats is None:
+            stats = self.sites[name] = SiteStats()
+        return stats
+
+    def record(self, name: str, outcome: str, seconds: float = None, now: float = None):
+        stats = self._get(name)
+        stats.probes += 1
+        stats.timeout_rate += ALPHA * ((outcome == TIMEOUT) - stats.timeout_rate)
+        stats.block_rate += ALPHA * ((outcome == BLOCKED) - stats.block_rate)
+        if seconds is not None and outcome != TIMEOUT:
+            stats.latency = seconds if stats.latency is None else stats.latency + LATENCY_ALPHA * (seconds - stats.latency)
+        now = now if now is not None else time.time()
+        if stats.failure_rate >= QUARANTINE_FAILURE_RATE and stats.quarantined_until <= now:
+            stats.strikes += 1
+            stats.quarantined_until = now + min(QUARANTINE_MAX_SECONDS, QUARANTINE_SECONDS * 2 ** (stats.strikes - 1))
+            # После карантина сайт начинает с чистого листа, иначе снова уйдёт туда первой же ошибкой
+            stats.timeout_rate = stats.block_rate = 0.0
+            stats.probes = 0
+        elif outcome in (FOUND, ABSENT) and stats.strikes and stats.probes >= MIN_PROBES \
+                and stats.failure_rate < QUARANTINE_FAILURE_RATE / 2:
+            # Сайт стабильно отвечает после карантина — следующий снова будет коротким
+            stats.strikes = 0
+        self.dirty = True
+
+    def record_control(self, name: str, found: bool):
+        stats = self._get(name)
+        stats.controls += 1
+        stats.false_positive_rate += CONTROL_ALPHA * (found - stats.false_positive_rate)
+        self.dirty = True
+
+    def usable(self, name: str, now: float = None) -> bool:
+        stats = self.sites.get(name)
+        if stats is None:
+            return True
+        now = now if now is not None else time.time()
+        return stats.quarantined_until <= now and not stats.false_positive
+
+    def order(self, names, now: float = None):
+        """Пригодные сайты от надёжных и быстрых к медленным; остальные — отдельным списком."""
+        now = now if now is not None else time.time()
+        usable, skipped = [], []
+        for name in names:
+            (usable if self.usable(name, now) else skipped).append(name)
+        usable.sort(key=lambda n: -(self.sites[n].score() if n in self.sites else SiteStats().score()))
+        return usable, skipped
+
+    def control_candidates(self, names, count: int):
+        """Сайты для контрольных проверок: сначала с наименьшим числом контролей."""
+        return sorted(names, key=lambda n: self.sites[n].controls if n in self.sites else 0)[:count]
+
+    def report(self, limit: int = 15, now: float = None) -> str:
+        now = now if now is not None else time.time()
+        quarantined = sorted((n for n, s in self.sites.items() if s.quarantined_until > now),
+                             key=lambda n: self.sites[n].quarantined_until)
+        false_positive = sorted(n for n, s in self.sites.items() if s.false_positive)
+        measured = [n for n, s in self.sites.items() if s.latency is not None]
+        slow = sorted(measured, key=lambda n: -self.sites[n].latency)[:limit]
+        lines = [f"Сайтов со статистикой: {len(self.sites)}, в карантине: {len(quarantined)}, "
+                 f"ложные «найден»: {len(false_positive)}"]
+        if quarantined:
+            lines.append("\nКарантин:")
+            lines.extend(f"• {n}: ещё {(self.sites[n].quarantined_until - now) / 60:.0f} мин, "
+                         f"серия {self.sites[n].strikes}" for n in quarantined[:limit])
+        if false_positive:
+            lines.append("\nИсключены (находят случайный ник):")
+            lines.extend(f"• {n}: {self.sites[n].false_positive_rate:.0%} из {self.sites[n].controls}"
+                         for n in false_positive[:limit])
+        if slow:
+            lines.append("\nСамые медленные:")
+            lines.extend(f"• {n}: {self.sites[n].latency * 1000:.0f} мс, таймауты {self.sites[n].timeout_rate:.0%}, "
+                         f"блокировки {self.sites[n].block_rate:.0%}" for n in slow)
+        return "\n".join(lines)
+
+    def describe(self, name: str, now: float = None) -> str:
+        stats = self.sites.get(name)
+        if stats is None:
+            return f"{name}: замеров нет"
+        now = now if now is not None else time.time()
+        latency = f"{stats.latency * 1000:.0f} мс" if stats.latency is not None else "—"
+        state = "в карантине" if stats.quarantined_until > now else ("исключён" if stats.false_positive else "в работе")
+        return (f"{name}: {state}\nЗадержка: {latency}, проверок: {stats.probes}\n"
+                f"Таймауты: {stats.timeout_rate:.0%}, блокировки: {stats.block_rate:.0%}\n"
+                f"Контрольных проверок: {stats.controls}, ложных «найден»: {stats.false_positive_rate:.0%}\n"
+                f"Серия карантинов: {stats.strikes}")
+
+    def serialize(self) -> str:
+        self.dirty = False
+        return json.dumps({name: [getattr(stats, slot) for slot in SiteStats.__slots__]
+                           for name, stats in self.sites.items()}, separators=(",", ":"))
+
+    def save(self, snapshot: str):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(snapshot)
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path: str) -> "SiteReliability":
+        registry = cls(path)
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for name, values in json.load(f).items():
+                    registry.sites[name] = SiteStats(*values)
+        registry.loaded = True
+        return registry
+
+    def merge(self, newer: "SiteReliability"):
+        """Накладывает замеры, накопленные в newer, пока читался файл, поверх снимка."""
+        for name, fresh in newer.sites.items():
+            stats = self.sites.get(name)
+            if stats is None:
+                self.sites[name] = fresh
+            else:
+                stats.absorb(fresh)
+        self.dirty = self.dirty or newer.dirty
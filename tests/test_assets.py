@@ -0,0 +1,79 @@
+"""AssetRegistry: упавшая подготовка не кэшируется, байты отпускаются, file_id забывается только по своей ошибке."""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assets  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.sent = []
+
+    def get_bot(self):
+        return SimpleNamespace(id=42)
+
+    async def reply_photo(self, photo, **kwargs):
+        if self.fail is not None and isinstance(photo, str):
+            raise BadRequest(self.fail)
+        self.sent.append(photo)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"id{len(self.sent)}")])
+
+
+def _registry(tmp_path):
+    banner = tmp_path / "banner.jpg"
+    banner.write_bytes(b"jpeg")
+    registry = assets.AssetRegistry(str(tmp_path / "file_ids.json"))
+    registry.add_file("banner", str(banner))
+    return registry
+
+
+def test_failed_prepare_is_retried(tmp_path):
+    registry = _registry(tmp_path)
+    (tmp_path / "file_ids.json").write_text("{broken")
+
+    async def run():
+        with pytest.raises(ValueError):
+            await registry.prepare()
+        (tmp_path / "file_ids.json").write_text("{}")
+        await registry.prepare()
+
+    asyncio.run(run())
+    assert registry.prepared
+
+
+def test_bytes_are_dropped_after_upload_and_reread_when_file_id_is_rejected(tmp_path):
+    registry = _registry(tmp_path)
+    message = FakeMessage()
+
+    async def run():
+        assert (await registry.send_photo(message, "banner"))[1] == "upload"
+        assert registry.assets["banner"].data is None
+        assert (await registry.send_photo(message, "banner"))[1] == "file_id"
+        message.fail = "Wrong file identifier/http url specified"
+        assert (await registry.send_photo(message, "banner"))[1] == "upload"
+
+    asyncio.run(run())
+    assert message.sent == [b"jpeg", "id1", b"jpeg"]
+    assert registry.uploads == 2
+
+
+def test_other_bad_request_keeps_file_id(tmp_path):
+    registry = _registry(tmp_path)
+    message = FakeMessage()
+
+    async def run():
+        await registry.send_photo(message, "banner")
+        message.fail = "Message caption is too long"
+        with pytest.raises(BadRequest):
+            await registry.send_photo(message, "banner")
+
+    asyncio.run(run())
+    assert registry.file_ids == {f"42:{registry.assets['banner'].digest}": "id1"}
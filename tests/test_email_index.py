@@ -0,0 +1,56 @@
+"""Индекс почтовых доменов: обновление из внешних списков и повтор упавшей загрузки."""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_index  # noqa: E402
+import main  # noqa: E402
+
+
+def test_update_merges_remote_lists_into_local_files(tmp_path):
+    local = tmp_path / "lists"
+    local.mkdir()
+    (local / "disposable.txt").write_text("# одноразовые\nlocal-only.example\n")
+    remote_disposable = tmp_path / "domains.txt"
+    remote_disposable.write_text("Mailinator.com\n\n# комментарий\nlocal-only.example\n")
+    remote_free = tmp_path / "free.json"
+    remote_free.write_text(json.dumps(["gmail.com", "yandex.ru"]))
+
+    counts = email_index.update(str(local), {"disposable.txt": remote_disposable.as_uri(),
+                                             "free.txt": remote_free.as_uri()})
+
+    assert counts == {"disposable.txt": 2, "free.txt": 2}
+    assert (local / "disposable.txt").read_text().startswith("# одноразовые\n# источник: file://")
+    index = email_index.EmailDomainIndex.load(str(local))
+    verdict = index.check("x@sub.mailinator.com")
+    assert verdict.disposable and not verdict.free
+    assert index.check("x@local-only.example").disposable
+    assert index.check("x@gmail.com").free
+
+
+def test_failed_domain_index_load_is_retried(monkeypatch):
+    calls = []
+
+    def load(directory):
+        calls.append(directory)
+        if len(calls) == 1:
+            raise OSError("нет каталога")
+        return email_index.EmailDomainIndex(["mailinator.com"])
+
+    monkeypatch.setattr(email_index.EmailDomainIndex, "load", staticmethod(load))
+    monkeypatch.setattr(main, "email_domains", None)
+    monkeypatch.setattr(main, "_email_domains_task", None)
+
+    async def run():
+        with pytest.raises(OSError):
+            await main.get_email_domains()
+        return await main.get_email_domains()
+
+    assert len(asyncio.run(run()).disposable) == 1
+    assert len(calls) == 2
@@ -0,0 +1,54 @@
+"""FairConnector: ожидание слота общего пула видно в HTTP-спане трассы."""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+import tracing  # noqa: E402
+
+HOLD = 0.2
+
+
+async def _request(hold_pool: bool) -> tracing.Span:
+    async def handler(request):
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/"
+    scheduler = main.http_scheduler
+    main.http_scheduler = main.fairqueue.FairScheduler(1)
+    trace = tracing.begin("test", 1)
+    try:
+        if hold_pool:
+            await main.http_scheduler.acquire(main.fairqueue.Flow("other"))
+            asyncio.get_running_loop().call_later(HOLD, main.http_scheduler.release)
+        with tracing.span("Source"):
+            async with main.get_http_session().get(url) as resp:
+                await resp.read()
+        tracing.finish(trace)
+        return trace.root.children[0].children[0]
+    finally:
+        main.http_scheduler = scheduler
+        await main.close_http_session()
+        await runner.cleanup()
+
+
+def test_pool_wait_is_recorded_on_http_span():
+    span = asyncio.run(_request(hold_pool=True))
+    assert span.kind == "http"
+    assert span.attrs["pool_ms"] >= HOLD * 1000 * 0.8
+    assert "pool" in tracing.render_waterfall(tracing.recent[-1])
+
+
+def test_immediate_grant_has_no_pool_wait():
+    span = asyncio.run(_request(hold_pool=False))
+    assert "pool_ms" not in span.attrs
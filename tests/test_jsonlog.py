@@ -0,0 +1,55 @@
+"""jsonlog: на полной очереди теряются только DEBUG/INFO, предупреждения и ошибки доходят до файла все."""
+import logging
+import os
+import queue
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsonlog  # noqa: E402
+
+
+def _logger(handler):
+    logger = logging.getLogger("tests.jsonlog")
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_warnings_bypass_full_queue():
+    records, urgent = queue.Queue(2), queue.SimpleQueue()
+    logger = _logger(jsonlog.AsyncQueueHandler(records, urgent))
+    dropped = jsonlog.DROPPED.value("queue_full")
+    for n in range(5):
+        logger.debug("отладка %d", n)
+    for n in range(50):
+        logger.warning("предупреждение %d", n)
+    logger.error("ошибка")
+    assert records.qsize() == 2
+    assert jsonlog.DROPPED.value("queue_full") - dropped == 3
+    assert urgent.qsize() == 51
+
+
+def test_sampled_never_samples_warnings(monkeypatch):
+    records, urgent = queue.Queue(), queue.SimpleQueue()
+    logger = _logger(jsonlog.AsyncQueueHandler(records, urgent))
+    monkeypatch.setitem(jsonlog.sample_rates, "source.result", 0.0)
+    for _ in range(10):
+        jsonlog.sampled(logger, "source.result", "источник упал", level=logging.WARNING)
+        jsonlog.sampled(logger, "source.result", "источник ответил")
+    assert urgent.qsize() == 10
+    assert records.qsize() == 0
+    assert urgent.get().sample is None
+
+
+def test_setup_writes_warnings_through_separate_listener(tmp_path):
+    path = tmp_path / "bot.jsonl"
+    jsonlog.setup(str(path), "DEBUG", console_level="CRITICAL", loggers=("tests.setup",))
+    try:
+        logging.getLogger("tests.setup").warning("предупреждение")
+        logging.getLogger("tests.setup").info("сообщение")
+    finally:
+        jsonlog.shutdown()
+    levels = [line.split('"level":"')[1].split('"')[0] for line in path.read_text(encoding="utf-8").splitlines()]
+    assert sorted(levels) == ["info", "warning"]
@@ -0,0 +1,48 @@
+"""LoopWatchdog: выборки потока-сэмплера разбираются в потоке цикла и не теряются."""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import loopwatch  # noqa: E402
+
+
+def _block(seconds: float):
+    time.sleep(seconds)
+
+
+async def _watch_stall():
+    watchdog = loopwatch.LoopWatchdog(interval=0.02, threshold=0.05, root=os.path.dirname(__file__))
+    watchdog.start()
+    await asyncio.sleep(0.1)
+    _block(0.3)
+    # Даём корутине проснуться после остановки и разобрать выборки
+    await asyncio.sleep(0.1)
+    await watchdog.stop()
+    return watchdog
+
+
+def test_stall_samples_are_attributed_on_loop_thread():
+    recorded_on = []
+    original = loopwatch.LoopWatchdog._record
+
+    def record(self, stack, seen):
+        recorded_on.append(threading.current_thread() is threading.main_thread())
+        return original(self, stack, seen)
+
+    loopwatch.LoopWatchdog._record = record
+    try:
+        watchdog = asyncio.run(_watch_stall())
+    finally:
+        loopwatch.LoopWatchdog._record = original
+    assert recorded_on and all(recorded_on)
+    sites = [site for key, site in watchdog.sites.items() if "_block" in key]
+    assert len(sites) == 1
+    site = sites[0]
+    assert site.samples >= 2
+    assert site.stalls == 1
+    assert site.worst >= 0.2
+    assert watchdog._pending == []
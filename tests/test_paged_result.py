@@ -0,0 +1,43 @@
+"""PagedResult: в кэше страниц — упакованная модель, страницы из неё совпадают с показанными."""
+import os
+import sys
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+NOTICE = "⚠️ сокращено"
+
+
+def _results(value):
+    items = {f"Поле {n}": value for n in range(400)}
+    return [main.SourceResult("LeakCheck", [main.Section("✅ LeakCheck", items)], 0.25, 1700000000.0)]
+
+
+def _pages(results):
+    rendered = main.render(results, "📧 email")
+    pages = main.split_into_pages(f"{NOTICE}\n\n{rendered}")
+    paged = main.PagedResult.pack(results, rendered, len(pages), "📧 email", notice=NOTICE)
+    return paged, pages
+
+
+def test_results_are_stored_packed_and_render_the_same_pages():
+    paged, pages = _pages(_results(["a@example.com", 42]))
+    assert len(pages) > 1
+    assert paged.packed
+    assert len(paged.blob) < sum(map(len, pages))
+    assert [paged.page(i) for i in range(paged.total)] == pages
+
+
+def test_values_json_would_change_fall_back_to_text():
+    paged, pages = _pages(_results(("кортеж", 1)))
+    assert not paged.packed
+    assert [paged.page(i) for i in range(paged.total)] == pages
+
+
+def test_loaded_pages_follow_the_result():
+    paged, pages = _pages(_results("x"))
+    paged.extra.append("ещё")
+    assert paged.total == len(pages) + 1
+    assert paged.page(len(pages)) == "ещё"
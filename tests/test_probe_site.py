@@ -0,0 +1,62 @@
+"""probe_site: таймаут сайта попадает в статистику надёжности, таймаут в очереди к пулу — нет."""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+import main  # noqa: E402
+import probes  # noqa: E402
+import sitestats  # noqa: E402
+
+TIMEOUT = 0.2
+
+
+async def _hanging_site():
+    async def handler(request):
+        await asyncio.sleep(10 * TIMEOUT)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/user"
+
+
+async def _probe(hold_pool: bool) -> sitestats.SiteStats:
+    runner, url = await _hanging_site()
+    main.site_reliability = sitestats.SiteReliability()
+    scheduler = main.http_scheduler
+    main.http_scheduler = main.fairqueue.FairScheduler(1)
+    source_timeout, main.source_timeout = main.source_timeout, lambda ceiling: TIMEOUT
+    try:
+        if hold_pool:
+            # Единственный слот занят чужим запросом: проверка простоит весь срок в очереди
+            await main.http_scheduler.acquire(main.fairqueue.Flow("other"))
+        probe = probes.Probe("Hanging", url, url, probes.HEAD, "status_code")
+        outcome = await main.probe_site(main.get_http_session(), probe, probes.ScanStats(), {})
+        assert outcome == sitestats.TIMEOUT
+        return main.site_reliability.sites.get("Hanging")
+    finally:
+        main.source_timeout = source_timeout
+        main.http_scheduler = scheduler
+        await main.close_http_session()
+        await runner.cleanup()
+
+
+def test_uncontended_timeout_is_recorded():
+    stats = asyncio.run(_probe(hold_pool=False))
+    assert stats is not None
+    assert stats.probes == 1
+    assert stats.timeout_rate > 0
+
+
+def test_timeout_spent_in_pool_queue_is_not_recorded():
+    assert asyncio.run(_probe(hold_pool=True)) is None
@@ -0,0 +1,43 @@
+"""Отказ по дневному лимиту возвращает токены: корзины не пустеют от попыток сверх квоты."""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def _fresh(monkeypatch):
+    monkeypatch.setattr(main, "global_bucket", main.Bucket())
+    return main.UserRecord()
+
+
+def test_refund_restores_both_buckets(monkeypatch):
+    record = _fresh(monkeypatch)
+    assert main.acquire_rate_limit(record, "email") == 0
+    assert main.acquire_rate_limit(record, "email") == 0
+    before = record.tokens, main.global_bucket.tokens
+    assert main.acquire_rate_limit(record, "email") == 0
+    main.refund_rate_limit(record, "email")
+    # Между вызовами корзины чуть подросли по времени
+    assert (record.tokens, main.global_bucket.tokens) == pytest.approx(before, abs=0.01)
+
+
+def test_refund_never_exceeds_burst(monkeypatch):
+    record = _fresh(monkeypatch)
+    monkeypatch.setitem(main.ACTION_WEIGHTS, "nick", main.RATE_LIMITS["user_burst"] * 3)
+    # Действие дороже ёмкости разрешено с полной корзины, остаток обрезан до нуля
+    assert main.acquire_rate_limit(record, "nick") == 0
+    main.refund_rate_limit(record, "nick")
+    assert record.tokens == main.RATE_LIMITS["user_burst"]
+
+
+def test_attempts_over_quota_do_not_drain_tokens(monkeypatch):
+    record = _fresh(monkeypatch)
+    for _ in range(50):
+        assert main.acquire_rate_limit(record, "ip") == 0
+        main.refund_rate_limit(record, "ip")
+    assert main.acquire_rate_limit(record, "nick") == 0
@@ -0,0 +1,50 @@
+"""Registrations: регистрация переживает сжатие и перезапуск, устаревшая — забывается."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import registrations  # noqa: E402
+
+TODAY = registrations.EPOCH + 2000
+
+
+def test_compact_keeps_recent_and_drops_expired():
+    registered = registrations.Registrations(ttl_days=30)
+    registered.mark(7, TODAY - 31)
+    registered.mark(3, TODAY)
+    registered.mark(5, TODAY - 10)
+    registered.compact(TODAY)
+    assert 3 in registered and 5 in registered
+    assert 7 not in registered
+    assert list(registered._ids) == [3, 5]
+    assert registered._pending == {}
+
+
+def test_marks_made_during_compaction_survive_install():
+    registered = registrations.Registrations(ttl_days=30)
+    registered.mark(1, TODAY - 29)
+    registered.compact(TODAY - 29)
+    ids, days, pending = registered.snapshot()
+    registered.mark(1, TODAY)
+    registered.mark(2, TODAY)
+    registered.install(*registered.compacted(ids, days, pending, TODAY, 30), pending)
+    assert 2 in registered
+    registered.compact(TODAY + 5)
+    assert 1 in registered and 2 in registered
+
+
+def test_snapshot_round_trip_and_merge(tmp_path):
+    path = str(tmp_path / "registrations.bin")
+    registered = registrations.Registrations(path)
+    for user_id in (10, 2 ** 40, 3):
+        registered.mark(user_id, TODAY)
+    registered.compact(TODAY)
+    registered.save(registered.pack(registered._ids, registered._days))
+
+    fresh = registrations.Registrations(path)
+    fresh.mark(99, TODAY)
+    loaded = registrations.Registrations.load(path)
+    loaded.merge(fresh)
+    assert all(user_id in loaded for user_id in (3, 10, 2 ** 40, 99))
+    assert len(loaded) == 4
@@ -0,0 +1,59 @@
+"""SiteReliability.merge: замеры, накопленные до чтения снимка, дописываются к нему, а не заменяют его."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sitestats  # noqa: E402
+from probes import ABSENT, BLOCKED  # noqa: E402
+
+NOW = 1_000_000.0
+
+
+def _record(registries, outcomes, now=NOW):
+    for outcome in outcomes:
+        for registry in registries:
+            registry.record("site", outcome, 0.5, now=now)
+
+
+def test_merge_equals_continuous_history():
+    snapshot, continuous, fresh = (sitestats.SiteReliability() for _ in range(3))
+    _record([snapshot, continuous], [ABSENT] * 20 + [BLOCKED] * 3)
+    for found in (True, False, True, True, False, False):
+        for registry in (snapshot, continuous):
+            registry.record_control("site", found)
+    _record([fresh, continuous], [BLOCKED, ABSENT, ABSENT, sitestats.TIMEOUT])
+    fresh.record_control("site", True)
+    continuous.record_control("site", True)
+
+    snapshot.merge(fresh)
+    merged, expected = snapshot.sites["site"], continuous.sites["site"]
+    assert merged.probes == expected.probes == 27
+    assert merged.controls == expected.controls == 7
+    assert merged.block_rate == pytest.approx(expected.block_rate)
+    assert merged.timeout_rate == pytest.approx(expected.timeout_rate)
+    assert merged.false_positive_rate == pytest.approx(expected.false_positive_rate)
+    assert merged.latency == pytest.approx(0.5)
+
+
+def test_quarantine_seen_before_load_extends_snapshot_strikes():
+    snapshot, fresh = sitestats.SiteReliability(), sitestats.SiteReliability()
+    _record([snapshot], [BLOCKED] * sitestats.MIN_PROBES, now=NOW - 7200)
+    assert snapshot.sites["site"].strikes == 1
+    _record([fresh], [BLOCKED] * sitestats.MIN_PROBES)
+    assert fresh.sites["site"].strikes == 1
+
+    snapshot.merge(fresh)
+    stats = snapshot.sites["site"]
+    assert stats.strikes == 2
+    assert stats.quarantined_until == NOW + 2 * sitestats.QUARANTINE_SECONDS
+    assert stats.probes == 0 and stats.block_rate == 0.0
+
+
+def test_sites_unknown_to_snapshot_are_added():
+    snapshot, fresh = sitestats.SiteReliability(), sitestats.SiteReliability()
+    fresh.record("other", ABSENT, 0.2, now=NOW)
+    snapshot.merge(fresh)
+    assert snapshot.sites["other"].probes == 1
@@ -0,0 +1,46 @@
+"""UsernameIndex.merge: изменения, увиденные до чтения снимка, побеждают снимок — и удаления тоже."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import userindex  # noqa: E402
+
+
+def _snapshot(tmp_path, pairs):
+    index = userindex.UsernameIndex(str(tmp_path / "usernames.idx"))
+    for user_id, name in pairs:
+        index.observe(user_id, name)
+    index.save()
+    return userindex.UsernameIndex.load(index.path)
+
+
+def test_cleared_username_is_removed_on_merge(tmp_path):
+    loaded = _snapshot(tmp_path, [(1, "alice"), (2, "bob")])
+    live = userindex.UsernameIndex()
+    live.observe(1, None)
+    loaded.merge(live)
+    assert loaded.lookup("alice") is None
+    assert loaded.lookup("bob") == 2
+
+
+def test_rename_and_reuse_seen_before_load(tmp_path):
+    loaded = _snapshot(tmp_path, [(1, "alice"), (2, "bob")])
+    live = userindex.UsernameIndex()
+    live.observe(1, "alice2")
+    live.observe(2, None)
+    live.observe(3, "bob")
+    loaded.merge(live)
+    assert loaded.lookup("alice") is None
+    assert loaded.lookup("alice2") == 1
+    assert loaded.lookup("bob") == 3
+    assert len(loaded) == 2
+
+
+def test_username_set_again_after_clearing_is_kept(tmp_path):
+    loaded = _snapshot(tmp_path, [(1, "alice")])
+    live = userindex.UsernameIndex()
+    live.observe(1, None)
+    live.observe(1, "alice")
+    loaded.merge(live)
+    assert loaded.lookup("alice") == 1
@@ -0,0 +1,95 @@
+"""Адаптивные таймауты внешних источников.
+
+Для каждого источника хранится скользящее окно задержек HTTP-запросов,
+таймаут — p99 окна × FACTOR в пределах [MIN_SECONDS, потолок]. Потолок
+задаёт место вызова (прежние константы 5/10/15/20 с); пока в окне меньше
+MIN_SAMPLES замеров, действует он же. Закреплённый вручную таймаут
+(/timeouts) перекрывает и расчёт, и потолок.
+"""
+import math
+from collections import deque
+
+import metrics
+
+FACTOR = 3.0
+MIN_SECONDS = 1.0
+WINDOW = 200          # замеров на источник
+MIN_SAMPLES = 20
+RECOMPUTE_EVERY = 10  # p99 пересчитывается не чаще, чем раз в столько замеров
+
+EFFECTIVE = metrics.Gauge("upstream_timeout_seconds", "Действующий таймаут запроса к источнику", ["source"])
+P99 = metrics.Gauge("upstream_latency_p99_seconds", "p99 задержки источника по скользящему окну", ["source"])
+
+
+class LatencyWindow:
+    __slots__ = ("samples", "p99", "pending")
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.p99 = None
+        self.pending = 0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.pending += 1
+        if len(self.samples) >= MIN_SAMPLES and (self.p99 is None or self.pending >= RECOMPUTE_EVERY):
+            ordered = sorted(self.samples)
+            self.p99 = ordered[min(len(ordered) - 1, math.ceil(0.99 * len(ordered)) - 1)]
+            self.pending = 0
+
+
+class TimeoutPolicy:
+    def __init__(self):
+        self.windows = {}
+        self.pins = {}
+        self.ceilings = {}
+
+    def observe(self, source: str, seconds: float):
+        window = self.windows.get(source)
+        if window is None:
+            window = self.windows[source] = LatencyWindow()
+        window.observe(seconds)
+        if window.p99 is not None:
+            P99.set(window.p99, source)
+
+    def timeout(self, source: str, ceiling: float) -> float:
+        self.ceilings[source] = ceiling
+        value = self.pins.get(source)
+        if value is None:
+            window = self.windows.get(source)
+            value = ceiling
+            if window is not None and window.p99 is not None:
+                value = min(ceiling, max(MIN_SECONDS, window.p99 * FACTOR))
+        EFFECTIVE.set(value, source)
+        return value
+
+    def pin(self, source: str, seconds: float = None):
+        """Закрепляет таймаут источника; None возвращает расчёт по окну."""
+        if seconds is None:
+            self.pins.pop(source, None)
+        else:
+            self.pins[source] = seconds
+            EFFECTIVE.set(seconds, source)
+
+    def report(self) -> str:
+        sources = sorted(set(self.windows) | set(self.pins) | set(self.ceilings))
+        if not sources:
+            return "Замеров пока нет."
+        lines = []
+        for source in sources:
+            window = self.windows.get(source)
+            p99 = f"{window.p99 * 1000:.0f} мс" if window is not None and window.p99 is not None else "—"
+            count = len(window.samples) if window is not None else 0
+            ceiling = self.ceilings.get(source)
+            if source in self.pins:
+                current = f"{self.pins[source]:g} с 📌"
+            elif ceiling is not None:
+                current = f"{self.timeout(source, ceiling):.1f} с"
+            else:
+                current = "—"
+            limit = f"{ceiling:g} с" if ceiling is not None else "—"
+            lines.append(f"{source}: {current} (p99 {p99}, замеров {count}, потолок {limit})")
+        return "\n".join(lines)
+
+
+policy = TimeoutPolicy()
@@ -0,0 +1,269 @@
+"""Трассировка поисков: дерево спанов lookup → источник → HTTP-запрос.
+
+Текущий спан хранится в contextvar, поэтому задачи из asyncio.gather
+наследуют его и вешают свои спаны на общего родителя. Тайминги HTTP
+(очередь лимита aiohttp, DNS, connect, TTFB, тело) снимаются хуками
+aiohttp.TraceConfig; ожидание слота в общем пуле (FairConnector в main)
+коннектор дописывает в HTTP-спан сам через pool_wait().
+Завершённые трассы лежат в кольцевом буфере recent.
+"""
+import contextlib
+import contextvars
+import json
+import secrets
+import time
+from collections import deque
+from html import escape
+from urllib.parse import urlsplit
+
+import aiohttp
+
+BUFFER_SIZE = 200
+# Сколько самых долгих HTTP-спанов показывать под одним источником в /trace
+WATERFALL_HTTP_LIMIT = 5
+WATERFALL_WIDTH = 24
+
+current_span = contextvars.ContextVar("current_span", default=None)
+recent = deque(maxlen=BUFFER_SIZE)
+# HTTP-спан запроса, который сейчас выполняет задача; его дополняет коннектор
+http_span = contextvars.ContextVar("http_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "start", "end", "attrs", "children")
+
+    def __init__(self, name, kind, start=None):
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter() if start is None else start
+        self.end = None
+        self.attrs = {}
+        self.children = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2),
+            "attrs": self.attrs,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "user_id", "started_at", "root", "_token")
+
+    def __init__(self, action, user_id):
+        self.trace_id = secrets.token_hex(4)
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.root = Span(action, "lookup")
+        self._token = None
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "user_id": self.user_id,
+                "started_at": self.started_at, **self.root.to_dict(self.root.start)}
+
+
+def begin(action: str, user_id: int) -> Trace:
+    trace = Trace(action, user_id)
+    trace._token = current_span.set(trace.root)
+    return trace
+
+
+def finish(trace: Trace, **attrs):
+    trace.root.end = time.perf_counter()
+    trace.root.attrs.update(attrs)
+    current_span.reset(trace._token)
+    recent.append(trace)
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "source"):
+    """Дочерний спан текущего; вне трассы ничего не записывает."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, kind)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+
+# ---------- Хуки aiohttp ----------
+def _mark(ctx, key):
+    if ctx.span is not None:
+        ctx.marks[key] = time.perf_counter()
+
+
+def _phase(ctx, name, start_key):
+    if ctx.span is not None and start_key in ctx.marks:
+        ctx.span.attrs[name] = round((time.perf_counter() - ctx.marks[start_key]) * 1000, 2)
+
+
+async def _on_request_start(session, ctx, params):
+    parent = current_span.get()
+    if parent is None:
+        ctx.span = None
+        http_span.set(None)
+        return
+    url = urlsplit(str(params.url))
+    # Только хост и путь: в query бывают API-ключи
+    ctx.span = Span(f"{params.method} {url.hostname}", "http")
+    ctx.span.attrs["path"] = url.path[:120]
+    ctx.marks = {}
+    parent.children.append(ctx.span)
+    http_span.set(ctx.span)
+
+
+def pool_wait(seconds: float):
+    """Ожидание слота общего пула — атрибутом pool_ms HTTP-спана; редиректы ждут заново и суммируются."""
+    span = http_span.get()
+    if span is not None and seconds > 0:
+        span.attrs["pool_ms"] = round(span.attrs.get("pool_ms", 0) + seconds * 1000, 2)
+
+
+async def _on_queued_start(session, ctx, params):
+    _mark(ctx, "queued")
+
+
+async def _on_queued_end(session, ctx, params):
+    _phase(ctx, "queue_ms", "queued")
+
+
+async def _on_dns_start(session, ctx, params):
+    _mark(ctx, "dns")
+
+
+async def _on_dns_end(session, ctx, params):
+    _phase(ctx, "dns_ms", "dns")
+
+
+async def _on_connect_start(session, ctx, params):
+    _mark(ctx, "connect")
+
+
+async def _on_connect_end(session, ctx, params):
+    _phase(ctx, "connect_ms", "connect")
+
+
+async def _on_reuse(session, ctx, params):
+    if ctx.span is not None:
+        ctx.span.attrs["reused"] = True
+
+
+async def _on_request_end(session, ctx, params):
+    if ctx.span is None:
+        return
+    now = time.perf_counter()
+    ctx.span.attrs["status"] = params.response.status
+    ctx.span.attrs["ttfb_ms"] = round((now - ctx.span.start) * 1000, 2)
+    ctx.marks["headers"] = now
+    ctx.span.end = now
+
+
+async def _on_chunk(session, ctx, params):
+    if ctx.span is None or "headers" not in ctx.marks:
+        return
+    now = time.perf_counter()
+    ctx.span.attrs["bytes"] = ctx.span.attrs.get("bytes", 0) + len(params.chunk)
+    ctx.span.attrs["body_ms"] = round((now - ctx.marks["headers"]) * 1000, 2)
+    ctx.span.end = now
+
+
+async def _on_request_exception(session, ctx, params):
+    if ctx.span is None:
+        return
+    ctx.span.attrs["error"] = type(params.exception).__name__
+    ctx.span.end = time.perf_counter()
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(_on_request_start)
+    config.on_connection_queued_start.append(_on_queued_start)
+    config.on_connection_queued_end.append(_on_queued_end)
+    config.on_dns_resolvehost_start.append(_on_dns_start)
+    config.on_dns_resolvehost_end.append(_on_dns_end)
+    config.on_connection_create_start.append(_on_connect_start)
+    config.on_connection_create_end.append(_on_connect_end)
+    config.on_connection_reuseconn.append(_on_reuse)
+    config.on_request_end.append(_on_request_end)
+    config.on_response_chunk_received.append(_on_chunk)
+    config.on_request_exception.append(_on_request_exception)
+    return config
+
+
+# ---------- Вывод ----------
+def slowest(limit: int = 3) -> list:
+    return sorted(recent, key=lambda trace: trace.root.duration, reverse=True)[:limit]
+
+
+def find(trace_id: str):
+    for trace in recent:
+        if trace.trace_id == trace_id:
+            return trace
+    return None
+
+
+def _bar(span, origin: float, total: float) -> str:
+    scale = WATERFALL_WIDTH / total if total > 0 else 0
+    offset = min(int((span.start - origin) * scale), WATERFALL_WIDTH - 1)
+    length = max(1, int(span.duration * scale))
+    length = min(length, WATERFALL_WIDTH - offset)
+    return "·" * offset + "█" * length + "·" * (WATERFALL_WIDTH - offset - length)
+
+
+def _http_details(span) -> str:
+    attrs = span.attrs
+    parts = [str(attrs.get("status", attrs.get("error", "?")))]
+    for key, label in (("pool_ms", "pool"), ("dns_ms", "dns"), ("connect_ms", "conn"), ("ttfb_ms", "ttfb"), ("body_ms", "body")):
+        if key in attrs:
+            parts.append(f"{label} {attrs[key]:.0f}")
+    return " ".join(parts)
+
+
+def _waterfall_lines(span, origin, total, depth, lines, http_limit):
+    name = ("  " * depth + span.name)[:26]
+    details = f" {_http_details(span)}" if span.kind == "http" else ""
+    lines.append(f"{name:<26} {_bar(span, origin, total)} {span.duration:6.2f}s{details}")
+    children = sorted(span.children, key=lambda child: child.start)
+    http = [child for child in children if child.kind == "http"]
+    if len(http) > http_limit:
+        keep = set(map(id, sorted(http, key=lambda child: child.duration, reverse=True)[:http_limit]))
+        children = [child for child in children if child.kind != "http" or id(child) in keep]
+    for child in children:
+        _waterfall_lines(child, origin, total, depth + 1, lines, http_limit)
+    if len(http) > http_limit:
+        lines.append("  " * (depth + 1) + f"… ещё {len(http) - http_limit} HTTP-запросов")
+
+
+def render_waterfall(trace: Trace, http_limit: int = WATERFALL_HTTP_LIMIT) -> str:
+    """Водопад трассы в HTML (<pre>) для отправки в Telegram.
+
+    http_limit — сколько самых долгих HTTP-запросов показывать под каждым спаном.
+    """
+    root = trace.root
+    started = time.strftime("%H:%M:%S", time.localtime(trace.started_at))
+    header = f"{trace.trace_id} · {root.name} · user {trace.user_id} · {started} · {root.duration:.2f}s"
+    outcome = root.attrs.get("outcome")
+    if outcome:
+        header += f" · {outcome}"
+    lines = []
+    _waterfall_lines(root, root.start, root.duration, 0, lines, http_limit)
+    return f"<b>{escape(header)}</b>\n<pre>{escape(chr(10).join(lines))}</pre>"
+
+
+def dump() -> str:
+    """Все трассы из буфера в JSON — для разбора вне бота."""
+    return json.dumps([trace.to_dict() for trace in recent], ensure_ascii=False, indent=1)
@@ -0,0 +1,124 @@
+"""Индекс username → Telegram ID, который бот собирает сам.
+
+Каждый апдейт несёт id и username отправителя (а пересланные сообщения и
+ответы — ещё и чужие), поэтому индекс пополняется без единого запроса к
+Bot API. Смена username учитывается: старое имя освобождается, если всё
+ещё указывает на этого пользователя; имя, занятое другим id, переходит к
+нему. Без username пользователь из индекса убирается.
+
+На диске индекс — zlib-сжатые строки «id username»; файл перезаписывается
+целиком через временный, чтобы обрыв записи не портил прежний снимок.
+"""
+import os
+import time
+import zlib
+from collections import OrderedDict
+
+
+class UsernameIndex:
+    def __init__(self, path: str = None):
+        self.path = path
+        self._by_name = {}     # username в нижнем регистре -> id
+        self._by_id = {}       # id -> username; строки общие с _by_name
+        self.dirty = False
+        self.renames = 0
+        self.loaded = False    # снимок с диска прочитан; до этого save() затёр бы его неполным индексом
+        # Пока снимок не прочитан — id, убравшие username: снимку их удаление неизвестно
+        self._cleared = set()
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def observe(self, user_id: int, username: str = None):
+        old = self._by_id.get(user_id)
+        name = username.lower() if username else None
+        if name is None and not self.loaded:
+            # Даже если этот индекс id не знал: в снимке у него может быть имя
+            self._cleared.add(user_id)
+        if old == name:
+            return
+        if old is not None and self._by_name.get(old) == user_id:
+            del self._by_name[old]
+            if name is not None:
+                self.renames += 1
+        if name is None:
+            self._by_id.pop(user_id, None)
+        else:
+            self._cleared.discard(user_id)
+            previous_owner = self._by_name.get(name)
+            if previous_owner is not None and previous_owner != user_id:
+                # Имя освободил прежний владелец — его старая запись больше не верна
+                self._by_id.pop(previous_owner, None)
+            self._by_name[name] = user_id
+            self._by_id[user_id] = name
+        self.dirty = True
+
+    def merge(self, newer: "UsernameIndex"):
+        """Накладывает изменения, собранные, пока индекс читался с диска: они свежее снимка.
+
+        Смены имени переносятся через observe (старое имя того же id освобождается),
+        а снятые username — по списку _cleared.
+        """
+        for user_id in newer._cleared:
+            self.observe(user_id, None)
+        for name, user_id in newer._by_name.items():
+            self.observe(user_id, name)
+        self.renames += newer.renames
+
+    def lookup(self, username: str):
+        return self._by_name.get(username.lower())
+
+    def serialize(self) -> str:
+        """Снимок для save(); строится в потоке event loop, пока словари не меняются."""
+        self.dirty = False
+        return "\n".join(f"{user_id} {name}" for name, user_id in self._by_name.items())
+
+    def save(self, snapshot: str = None):
+        if not self.path:
+            return
+        payload = zlib.compress((snapshot if snapshot is not None else self.serialize()).encode(), 6)
+        tmp = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path: str) -> "UsernameIndex":
+        index = cls(path)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                text = zlib.decompress(f.read()).decode()
+            for line in text.splitlines():
+                user_id, _, name = line.partition(" ")
+                if name:
+                    index._by_name[name] = int(user_id)
+                    index._by_id[int(user_id)] = name
+        index.loaded = True
+        return index
+
+
+class ResolveCache:
+    """Результаты get_chat по username: найденный id живёт POSITIVE_TTL, «не найден» — NEGATIVE_TTL."""
+    POSITIVE_TTL = 86400
+    NEGATIVE_TTL = 600
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._data = OrderedDict()     # username -> (истекает, id или None)
+
+    def get(self, username: str, now: float = None):
+        """(True, id или None) — есть свежий ответ; (False, None) — нужно спрашивать Bot API."""
+        now = now if now is not None else time.monotonic()
+        entry = self._data.get(username.lower())
+        if entry is None or entry[0] < now:
+            return False, None
+        return True, entry[1]
+
+    def put(self, username: str, user_id: int = None, now: float = None):
+        now = now if now is not None else time.monotonic()
+        key = username.lower()
+        self._data.pop(key, None)
+        if len(self._data) >= self.max_size:
+            self._data.popitem(last=False)
+        self._data[key] = (now + (self.POSITIVE_TTL if user_id is not None else self.NEGATIVE_TTL), user_id)